@@ -0,0 +1,283 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from chapter_parser import parse_chapter_record
+from rate_limiter import SiteRateLimiter, THROTTLE_STATUS_CODES, parse_retry_after, backoff_delay
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed when the async engine is selected
+    aiohttp = None
+
+class AsyncCrawlEngine:
+    """
+    asyncio fetch engine, an alternative backend to NovelDownloader's worker threads
+
+    All HTTP requests run on a single event loop thread with aiohttp, so hundreds
+    of requests can be in flight at once, while HTML parsing is handed off to an
+    executor. Parsing reuses the NovelDownloader parse methods, so both engines
+    produce identical chapter data.
+    """
+
+    def __init__(self, downloader, max_in_flight=None, parse_workers=None, logger=None):
+        """
+        Initialize the engine and start its event loop thread
+
+        Args:
+            downloader: NovelDownloader instance providing headers, parsers and logging
+            max_in_flight: Maximum number of concurrent requests
+                           (default: ASYNC_MAX_IN_FLIGHT environment variable or 20)
+            parse_workers: Number of parser threads (default: CPU count)
+        """
+        if aiohttp is None:
+            raise RuntimeError("The async engine requires aiohttp (pip install aiohttp)")
+
+        self.downloader = downloader
+        self.logger = logger or logging.getLogger('async_engine')
+        self.max_in_flight = max_in_flight or int(os.getenv('ASYNC_MAX_IN_FLIGHT', 20))
+        self.parse_executor = ThreadPoolExecutor(max_workers=parse_workers or os.cpu_count() or 1,
+                                                 thread_name_prefix='async_parse')
+
+        # Run the event loop on its own thread so the synchronous download loop can consume results
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.loop_thread.start()
+
+        self.session = None
+        self.semaphore = None
+        self._run(self._open_session())
+
+    def _run_loop(self):
+        """Event loop thread function"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _submit(self, coro):
+        """Schedule a coroutine on the engine loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _run(self, coro):
+        """Run a coroutine on the engine loop and wait for its result"""
+        return self._submit(coro).result()
+
+    async def _open_session(self):
+        """Create the aiohttp session and request limiter on the engine loop"""
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=30))
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def _close_session(self):
+        """Close the aiohttp session"""
+        if self.session:
+            await self.session.close()
+
+    def close(self):
+        """Close the session, stop the event loop and the parser threads"""
+        try:
+            self._run(self._close_session())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join(timeout=5)
+            self.parse_executor.shutdown(wait=False)
+
+    async def _request(self, url, is_api=False, is_mtc=True, cookie='', download_id=None, cache_kind=None):
+        """Async counterpart of NovelDownloader._make_request"""
+        return (await self._fetch(url, is_api, is_mtc, cookie, download_id, cache_kind))[0]
+
+    async def _fetch(self, url, is_api=False, is_mtc=True, cookie='', download_id=None, cache_kind=None):
+        """Async counterpart of NovelDownloader._fetch, returns (body, unchanged)"""
+        cache = self.downloader.cache
+        variant = self.downloader._cache_variant(is_mtc, cookie)
+        entry = None
+        if cache_kind:
+            entry, is_fresh = await self._cache(cache.lookup, url, variant)
+            if is_fresh:
+                return entry['body'], True
+
+        headers = self.downloader._build_headers(is_api, is_mtc, cookie)
+        headers.update(self.downloader._conditional_headers(entry))
+        bucket = SiteRateLimiter.get_bucket(url)
+        max_retries = self.downloader.request_retries
+        last_exception = None
+
+        for attempt in range(max_retries):
+            retry_after = None
+            try:
+                # Share the site's request budget with the threaded engine and other jobs
+                wait_time = bucket.reserve()
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
+
+                async with self.semaphore:
+                    request_start = time.monotonic()
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status in THROTTLE_STATUS_CODES:
+                            retry_after = parse_retry_after(response.headers.get('retry-after'))
+                            bucket.on_throttled(retry_after)
+                        elif response.status == 304 and entry is not None:
+                            # Page unchanged since we cached it, keep the stored body
+                            bucket.on_success(time.monotonic() - request_start)
+                            await self._cache(cache.mark_revalidated, url, variant)
+                            return entry['body'], True
+                        response.raise_for_status()
+
+                        # Return JSON for API requests, text otherwise
+                        self.downloader._count_bytes(download_id, len(await response.read()))
+                        if is_api and is_mtc:
+                            result = await response.json(content_type=None)
+                        else:
+                            result = await response.text()
+                        etag = response.headers.get('etag')
+                        last_modified = response.headers.get('last-modified')
+
+                bucket.on_success(time.monotonic() - request_start)
+                if cache_kind:
+                    await self._cache(cache.put, url, result, cache_kind, variant, etag=etag, last_modified=last_modified)
+                return result, False
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                last_exception = e
+                self.downloader._log('error', f"Lỗi khi tải trang {url}, lần thử {attempt+1}/{max_retries}: {str(e)}", download_id)
+
+                if isinstance(e, aiohttp.ClientResponseError):
+                    if 400 <= e.status < 500 and e.status not in THROTTLE_STATUS_CODES:
+                        # Client errors (404, 403...) won't succeed on retry
+                        break
+                elif isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+                    # Connection resets and timeouts usually mean the site is overloaded
+                    bucket.on_throttled()
+
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+
+        error_message = f"Thất bại sau {attempt+1} lần thử: {str(last_exception)}"
+        self.downloader._log('error', error_message, download_id)
+        raise Exception(error_message)
+
+    async def _cache(self, method, *args, **kwargs):
+        """Run a response cache call on the default executor, cache reads and writes block on file I/O and its lock"""
+        return await self.loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+    async def _parse(self, parse_function, *args):
+        """Run a parse function on the parser executor"""
+        return await self.loop.run_in_executor(self.parse_executor, functools.partial(parse_function, *args))
+
+    async def _parse_chapter(self, site_type, html, chapter_number, chapter_title=None, download_id=None):
+        """Parse a chapter page in the downloader's parser processes, or on the parser threads if they are disabled"""
+        pool = self.downloader._get_parse_pool()
+        if pool is None:
+            parse_function = {
+                'metruyenchu': self.downloader._parse_mtc_chapter_content,
+                'tangthuvien': self.downloader._parse_ttv_chapter_content
+            }[site_type]
+            return await self._parse(parse_function, html, chapter_number, chapter_title, download_id)
+
+        try:
+            record = await self.loop.run_in_executor(pool, functools.partial(
+                parse_chapter_record, site_type, html, chapter_number, chapter_title, self.downloader.html_parser))
+        except BrokenProcessPool:
+            self.downloader._reset_parse_pool(pool)
+            raise
+        return self.downloader._chapter_from_record(record, download_id)
+
+    async def _get_mtc_novel_info(self, url, cookie='', download_id=None):
+        """Get novel information from Metruyenchu"""
+        variant = self.downloader._cache_variant(True, cookie)
+        html, page_unchanged = await self._fetch(url, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='novel_info')
+        novel_info = await self._parse(self.downloader._parse_cached, url, variant, page_unchanged,
+                                       self.downloader._parse_mtc_novel_info, html, download_id)
+        list_unchanged = False
+
+        # Get chapter list from API if book_id is available
+        if novel_info['book_id']:
+            api_url = self.downloader._mtc_chapters_api_url(novel_info['book_id'])
+            try:
+                api_data, list_unchanged = await self._fetch(api_url, is_api=True, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='chapter_list')
+                novel_info['chapters_list'] = self.downloader._parse_mtc_chapter_list(api_data, download_id)
+            except Exception as e:
+                self.downloader._log('error', f"Error getting chapter list from API: {str(e)}", download_id)
+
+        novel_info['not_modified'] = page_unchanged and list_unchanged
+        return novel_info
+
+    async def _get_ttv_novel_info(self, url, download_id=None):
+        """Get novel information from Tangthuvien"""
+        html, page_unchanged = await self._fetch(url, is_mtc=False, download_id=download_id, cache_kind='novel_info')
+        novel_info, total_chapters = await self._parse(self.downloader._parse_cached, url, '', page_unchanged,
+                                                       self.downloader._parse_ttv_novel_info, html, download_id)
+        list_unchanged = False
+
+        # Get chapter list
+        if novel_info['book_id'] and total_chapters > 0:
+            chapters_url = self.downloader._ttv_chapters_url(novel_info['book_id'], total_chapters)
+            try:
+                chapters_html, list_unchanged = await self._fetch(chapters_url, is_mtc=False, download_id=download_id, cache_kind='chapter_list')
+                novel_info['chapters_list'] = await self._parse(self.downloader._parse_cached, chapters_url, '', list_unchanged,
+                                                                self.downloader._parse_ttv_chapter_list, chapters_html, download_id)
+            except Exception as e:
+                self.downloader._log('error', f"Error getting chapter list from Tangthuvien: {str(e)}", download_id)
+
+        novel_info['not_modified'] = page_unchanged and list_unchanged
+        return novel_info
+
+    async def _get_mtc_chapter_content(self, url, chapter_number, chapter_title=None, cookie='', download_id=None):
+        """Get chapter content from Metruyenchu"""
+        chapter_url = self.downloader._mtc_chapter_url(url, chapter_number)
+        html = await self._request(chapter_url, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='chapter')
+        chapter_data = await self._parse_chapter('metruyenchu', html, chapter_number, chapter_title, download_id)
+
+        # Locked or missing chapters may become available later, don't keep them cached
+        if self.downloader._is_placeholder(chapter_data):
+            await self._cache(self.downloader.cache.invalidate, chapter_url, self.downloader._cache_variant(True, cookie))
+        return chapter_data
+
+    async def _get_ttv_chapter_content(self, chapter_info, download_id=None):
+        """Get chapter content from Tangthuvien"""
+        html = await self._request(chapter_info['url'], is_mtc=False, download_id=download_id, cache_kind='chapter')
+        chapter_data = await self._parse_chapter('tangthuvien', html, chapter_info['index'], chapter_info['name'], download_id)
+
+        # Locked or missing chapters may become available later, don't keep them cached
+        if self.downloader._is_placeholder(chapter_data):
+            await self._cache(self.downloader.cache.invalidate, chapter_info['url'])
+        return chapter_data
+
+    async def _get_chapter_content(self, url, chapter_info, site_type, cookie='', download_id=None):
+        """Get chapter content based on site type"""
+        self.downloader._log('info', f"📥 Đang tải chương {chapter_info.get('index')}: {chapter_info.get('name', 'Không tên')}", download_id)
+        if site_type == 'metruyenchu':
+            return await self._get_mtc_chapter_content(url, chapter_info['index'], chapter_info.get('name'), cookie, download_id)
+        elif site_type == 'tangthuvien':
+            return await self._get_ttv_chapter_content(chapter_info, download_id)
+        else:
+            raise ValueError(f"Unsupported website type: {site_type}")
+
+    def get_novel_info(self, url, cookie='', download_id=None):
+        """Get novel information (auto-detect site type)"""
+        site_type = self.downloader._detect_site_type(url)
+        if site_type == "metruyenchu":
+            return self._run(self._get_mtc_novel_info(url, cookie, download_id))
+        elif site_type == "tangthuvien":
+            return self._run(self._get_ttv_novel_info(url, download_id))
+        else:
+            raise ValueError("Unsupported website type")
+
+    def fetch_chapters(self, url, chapters, site_type, novel_title, cookie='', download_id=None):
+        """
+        Fetch chapters on the event loop and yield them back in chapter-index order
+
+        Yields:
+            (chapter_info, chapter_data) tuples, chapter_data is None if the chapter
+            still failed after all retries
+        """
+        self.downloader._log('info', f"⚡ Tải bất đồng bộ với tối đa {self.max_in_flight} request cùng lúc", download_id)
+
+        def submit_fetch(chapter_info):
+            return self._submit(self._get_chapter_content(url, chapter_info, site_type, cookie, download_id))
+
+        yield from self.downloader._fetch_in_order(chapters, submit_fetch, self.max_in_flight * 2, download_id)
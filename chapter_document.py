@@ -0,0 +1,252 @@
+import re
+import copy
+from bs4 import BeautifulSoup
+from bs4.element import Tag, NavigableString
+from ebooklib import epub
+
+# Tags kept even when they have no text
+EMPTY_ALLOWED_TAGS = ['br', 'img', 'hr']
+# Attributes kept on chapter tags
+ALLOWED_ATTRS = ['id', 'class', 'href', 'src', 'alt']
+
+def make_fragment(element=None):
+    """
+    Create an empty document to hold a chapter's content
+
+    Args:
+        element: Optional tag moved (not copied) into the new document
+    """
+    fragment = BeautifulSoup('', 'html.parser')
+    if element is not None:
+        fragment.append(element.extract())
+    return fragment
+
+def _split_long_paragraph(soup, p, text):
+    """
+    Refill a paragraph with its first sentences and move the rest to new paragraphs
+
+    Returns:
+        The paragraphs inserted after p, in document order
+    """
+    p.clear()
+
+    # Split paragraph
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    current_p = p
+    new_paragraphs = []
+
+    for i, sentence in enumerate(sentences):
+        if i > 0 and i % 3 == 0:  # Every 3 sentences create a new paragraph
+            new_p = soup.new_tag('p')
+            current_p.insert_after(new_p)
+            current_p = new_p
+            new_paragraphs.append(new_p)
+
+        if current_p.string:
+            current_p.string = current_p.string + " " + sentence
+        else:
+            current_p.string = sentence
+
+    return new_paragraphs
+
+def _has_text(tag, text_types):
+    """Whether get_text(strip=True) of a tag is non-empty, given the types of its non-blank strings"""
+    interesting = tag.interesting_string_types
+    if interesting is None:
+        interesting = Tag.MAIN_CONTENT_STRING_TYPES
+    elif isinstance(interesting, type):
+        return interesting in text_types
+    return any(text_type in interesting for text_type in text_types)
+
+def optimize_for_ereader(soup):
+    """
+    Optimize a parsed chapter for e-readers, in place, in a single traversal
+
+    Strips unneeded attributes, splits very long paragraphs, adds paragraph spacing,
+    turns leaf div/span tags into paragraphs, removes empty tags and replaces
+    literal '&nbsp;'. Tags are rewritten when entered and checked for emptiness when
+    left, with the string types found below them collected on the way up, so no
+    subtree is searched more than once.
+
+    Args:
+        soup: BeautifulSoup document holding the chapter content
+    """
+    # Types of the non-blank strings found under each open tag (keyed by id)
+    text_types = {id(soup): set()}
+    # Stack of (node, leaving, is_split), is_split marks paragraphs created by splitting
+    stack = [(soup, False, False)]
+
+    while stack:
+        node, leaving, is_split = stack.pop()
+
+        if leaving:
+            found = text_types.pop(id(node))
+            replacements = []
+            for child in node.contents:
+                if isinstance(child, NavigableString):
+                    if child.strip():
+                        found.add(type(child))
+                    if '&' in child:
+                        replacements.append(child)
+
+            # Fix special characters
+            for string in replacements:
+                string.replace_with(string.replace('&nbsp;', ' '))
+
+            if node is soup:
+                continue
+            text_types[id(node.parent)].update(found)
+
+            # Remove empty tags
+            if node.name not in EMPTY_ALLOWED_TAGS and not _has_text(node, found):
+                node.decompose()
+            continue
+
+        following = []
+        if node is not soup:
+            # Remove unnecessary attributes
+            for attr in list(node.attrs):
+                if attr not in ALLOWED_ATTRS:
+                    del node[attr]
+
+            if node.name == 'p' and not is_split:
+                # Split long paragraphs
+                text = node.get_text()
+                if len(text) > 1000:
+                    following = _split_long_paragraph(soup, node, text)
+
+            if node.name == 'p':
+                # Ensure spacing between paragraphs
+                node['style'] = 'margin-top: 0.5em; margin-bottom: 0.5em;'
+            elif node.name in ('div', 'span') and not any(isinstance(child, Tag) for child in node.contents):
+                # Convert complex tags without child tags to simple paragraphs
+                new_tag = soup.new_tag('p')
+                new_tag.string = node.get_text()
+                node.replace_with(new_tag)
+                node = new_tag
+
+        text_types[id(node)] = set()
+        for new_p in reversed(following):
+            stack.append((new_p, False, True))
+        stack.append((node, True, False))
+        for child in reversed(node.contents):
+            if isinstance(child, Tag):
+                stack.append((child, False, False))
+
+    return soup
+
+class ChapterDocument:
+    """
+    A chapter parsed once and carried through every stage of the pipeline
+
+    Holds the chapter title, its plain text and its optimized HTML tree. The tree
+    is only serialized when the EPUB is written, and only parsed from HTML when a
+    stage actually needs it.
+    """
+
+    def __init__(self, title, text, root=None, html=None, title_checked=False):
+        """
+        Args:
+            title: Chapter title
+            text: Plain text of the chapter
+            root: BeautifulSoup document of the chapter content
+            html: Serialized content, used instead of root when the tree is not available yet
+            title_checked: Whether the content already starts with its title heading
+        """
+        self.title = title
+        self.text = text
+        self._root = root
+        self._html = html
+        self.title_checked = title_checked
+
+    @classmethod
+    def from_html(cls, title, text, html, title_checked=False):
+        """Create a document from serialized content, parsed lazily"""
+        return cls(title, text, html=html, title_checked=title_checked)
+
+    @property
+    def root(self):
+        """Content tree, parsed on first access"""
+        if self._root is None:
+            self._root = BeautifulSoup(self._html or '', 'html.parser')
+        return self._root
+
+    @property
+    def html(self):
+        """Serialized content, cached until the tree changes"""
+        if self._html is None:
+            self._html = str(self._root) if self._root is not None else ''
+        return self._html
+
+    def changed(self):
+        """Drop the cached serialization after the tree was modified"""
+        if self._root is not None:
+            self._html = None
+
+    @property
+    def paragraphs(self):
+        return self.root.find_all('p')
+
+    @property
+    def headings(self):
+        return self.root.find_all(['h1', 'h2', 'h3'])
+
+    def ensure_title_heading(self, title):
+        """
+        Make sure the chapter starts with its title as a heading
+
+        A heading containing the title is kept as is, a title found in one of the
+        first two paragraphs is turned into an h2, otherwise an h2 is inserted.
+        """
+        if self.title_checked:
+            return
+        self.title_checked = True
+
+        title_lower = title.lower()
+        for heading in self.headings:
+            if title_lower in heading.get_text().lower():
+                return
+
+        for p in self.root.find_all('p', limit=2):
+            if title_lower in p.get_text().lower():
+                # Title is in content but not as heading
+                p.name = 'h2'
+                self.changed()
+                return
+
+        heading = self.root.new_tag('h2')
+        heading.string = title
+        self.root.insert(0, heading)
+        self.changed()
+
+    def copy_paragraphs(self):
+        """Copies of the chapter paragraphs, for building split parts without touching the tree"""
+        return [copy.copy(p) for p in self.paragraphs]
+
+class ChapterHtml(epub.EpubHtml):
+    """EPUB chapter whose XHTML page is built from its ChapterDocument only when first needed"""
+
+    def __init__(self, document, **kwargs):
+        self.document = document
+        super().__init__(**kwargs)
+
+    @property
+    def content(self):
+        if not self._content and self.document is not None:
+            self._content = """
+            <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+            <head>
+                <title>""" + self.title + """</title>
+                <meta charset="utf-8"/>
+                <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
+            </head>
+            <body>
+                """ + self.document.html + """
+            </body>
+            </html>
+            """
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
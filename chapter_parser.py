@@ -0,0 +1,231 @@
+import re
+import logging
+import traceback
+from bs4 import BeautifulSoup
+from chapter_document import ChapterDocument, make_fragment, optimize_for_ereader
+
+# Content used when a chapter is locked or missing
+PLACEHOLDER_CONTENT = "Không có nội dung. Chương này có thể bị khóa hoặc không tồn tại."
+
+logger = logging.getLogger('chapter_parser')
+
+def _log_to_logger(level, message):
+    getattr(logger, level)(message)
+
+def extract_chapter_title(chapter_number, content=None, default_title=None):
+    """Extract or create an appropriate chapter title"""
+    # If we already have a good title, use it
+    if default_title and default_title != f"Chapter {chapter_number}" and default_title != "":
+        return default_title
+
+    # Try to extract title from content if available
+    if content:
+        try:
+            title_pattern = re.compile(r"Chương\s+\d+\s*[:\-]\s*(.*?)[\n\r]", re.IGNORECASE)
+            match = title_pattern.search(content)
+            if match:
+                return f"Chương {chapter_number}: {match.group(1).strip()}"
+        except Exception as e:
+            logger.warning(f"Error extracting title: {e}")
+
+    # Default title with just the chapter number
+    return f"Chương {chapter_number}"
+
+def optimize_chapter_html(soup):
+    """Optimize a parsed chapter for e-readers, in place, keeping it as is on error"""
+    try:
+        optimize_for_ereader(soup)
+    except Exception as e:
+        logger.error(f"Error optimizing HTML: {e}")
+        traceback.print_exc()
+    return soup
+
+def parse_mtc_chapter(html, chapter_number, chapter_title=None, parser='html.parser', log=None):
+    """
+    Extract chapter title and content from a Metruyenchu chapter page
+
+    Args:
+        parser: BeautifulSoup tree builder for the page
+        log: Optional callable(level, message) receiving progress messages
+
+    Returns:
+        Dict with the chapter 'title', plain text 'content' and its ChapterDocument
+    """
+    log = log or _log_to_logger
+    soup = BeautifulSoup(html, parser)
+
+    # Get chapter title
+    title_elem = soup.select_one('h2')
+    base_title = title_elem.text.strip() if title_elem and title_elem.text else "Chương " + str(chapter_number)
+
+    # Use title from API if available
+    if chapter_title:
+        base_title = chapter_title
+
+    # Get chapter content
+    content_elem = soup.select_one('[data-x-bind="ChapterContent"]')
+    content = ""
+
+    if content_elem:
+        content = content_elem.get_text('\n', strip=True)
+
+    if not content or len(content.strip()) == 0:
+        # Use default content if not found
+        content = PLACEHOLDER_CONTENT
+        log('warning', f"⚠️ Không tìm thấy nội dung cho chương {chapter_number}: Nội dung có thể bị khoá hoặc không tồn tại, sử dụng nội dung mặc định")
+
+    # Extract better title if possible
+    title = extract_chapter_title(chapter_number, content, base_title)
+
+    # Format HTML content
+    if content_elem:
+        # Process p and br tags
+        for p in content_elem.find_all('p'):
+            p.insert_after(soup.new_tag('br'))
+
+        # Optimize HTML for e-reader, working on the tree parsed above
+        document = ChapterDocument(title, content, root=optimize_chapter_html(make_fragment(content_elem)))
+    else:
+        document = ChapterDocument.from_html(title, content, "<p>" + content + "</p>")
+
+    # Log information
+    log('info', f"✅ Đã tải chương {chapter_number}: {title} - Độ dài: {len(content)} ký tự")
+
+    return {
+        'title': title,
+        'content': content,
+        'document': document
+    }
+
+def parse_ttv_chapter(html, chapter_number, chapter_title=None, parser='html.parser', log=None):
+    """
+    Extract chapter title and content from a Tangthuvien chapter page
+
+    Args:
+        parser: BeautifulSoup tree builder for the page
+        log: Optional callable(level, message) receiving progress messages
+
+    Returns:
+        Dict with the chapter 'title', plain text 'content' and its ChapterDocument
+    """
+    log = log or _log_to_logger
+    # Parse content
+    soup = BeautifulSoup(html, parser)
+
+    # Clear head content to reduce debug file size
+    if soup.head:
+        soup.head.clear()
+        soup.head.append(soup.new_tag('title'))
+        soup.head.title.string = f"Debug HTML - Chapter {chapter_number}"
+
+    # Novel content - try with main selector
+    content_elem = soup.select_one('.box-chap')
+    content = ""
+    content_root = None
+
+    # If main selector not found, try alternative selector
+    if not content_elem or not content_elem.text.strip():
+        content_blocks = soup.select('p.content-block')
+
+        if content_blocks:
+            log('info', f"ℹ️ Sử dụng selector thay thế cho chương {chapter_number}")
+
+            # Create content from p.content-block tags
+            content = "\n".join([block.get_text(strip=True) for block in content_blocks])
+
+            # Create new HTML with p tags
+            content_container = soup.new_tag('div')
+            content_container['class'] = 'chapter-content'
+
+            for block in content_blocks:
+                p = soup.new_tag('p')
+                p.string = block.get_text(strip=True)
+                content_container.append(p)
+
+            content_elem = content_container
+            content_root = make_fragment(content_container)
+        else:
+            # Still no content found
+            content_elem = None
+
+    # Process if content found with main selector
+    if content_elem and not content:
+        content = content_elem.get_text('\n', strip=True)
+
+        # Create new HTML from text with \n converted to p tags
+        if content:
+            # Split paragraphs by \n
+            paragraphs = content.split('\n')
+
+            # Create div to contain content
+            fixed_content_elem = soup.new_tag('div')
+            fixed_content_elem['class'] = 'chapter-content'
+
+            # Add each paragraph to a separate p tag
+            for paragraph in paragraphs:
+                # Skip empty lines
+                if paragraph.strip():
+                    p = soup.new_tag('p')
+                    p.string = paragraph.strip()
+                    fixed_content_elem.append(p)
+
+            content_root = make_fragment(fixed_content_elem)
+        else:
+            content_root = BeautifulSoup("<div class='chapter-content'></div>", 'html.parser')
+
+    # If no content could be retrieved, use default content
+    if not content or len(content.strip()) == 0:
+        # Use default content
+        content = PLACEHOLDER_CONTENT
+        log('warning', f"⚠️ Không tìm thấy nội dung cho chương {chapter_number}: Nội dung có thể bị khoá hoặc không tồn tại")
+        content_root = BeautifulSoup("<p>" + content + "</p>", 'html.parser')
+
+    # If content still not set (rare case)
+    if content_root is None:
+        content_root = BeautifulSoup("<p>" + content.replace("\n\n", "</p><p>") + "</p>", 'html.parser')
+
+    # Extract better title if possible
+    title = extract_chapter_title(chapter_number, content, chapter_title)
+
+    # Optimize HTML for e-reader
+    document = ChapterDocument(title, content, root=optimize_chapter_html(content_root))
+
+    # Log information
+    log('info', f"✅ Đã tải chương {chapter_number}: {title} - Độ dài: {len(content)} ký tự")
+
+    return {
+        'title': title,
+        'content': content,
+        'document': document
+    }
+
+CHAPTER_PARSERS = {
+    'metruyenchu': parse_mtc_chapter,
+    'tangthuvien': parse_ttv_chapter
+}
+
+def parse_chapter_record(site_type, html, chapter_number, chapter_title=None, parser='html.parser'):
+    """
+    Parse a chapter page into a compact, picklable record (runs in parser worker processes)
+
+    The title heading is already ensured, so the receiving side never needs to parse
+    the chapter again unless it has to split it.
+
+    Returns:
+        Dict with 'title', 'content', the serialized 'html' and the 'logs' emitted
+        while parsing as (level, message) tuples
+    """
+    logs = []
+    chapter_data = CHAPTER_PARSERS[site_type](html, chapter_number, chapter_title, parser,
+                                              log=lambda level, message: logs.append((level, message)))
+
+    title = extract_chapter_title(chapter_number, chapter_data['content'], chapter_data['title'])
+    document = chapter_data['document']
+    document.ensure_title_heading(title)
+
+    return {
+        'title': title,
+        'content': chapter_data['content'],
+        'html': document.html,
+        'logs': logs
+    }
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+
+class ChapterStore:
+    """
+    SQLite store of the downloaded chapters of a novel
+
+    Chapters are keyed by site, book id and chapter index and hold their title,
+    optimized HTML, a content hash, the fetch time and whether the content is
+    only the placeholder of a locked or missing chapter. The store is the source
+    of truth of a download: checkpoints write to it, resume asks it which
+    chapters exist and the EPUB is built from it, so a book can be exported
+    again without refetching anything. The database runs in WAL mode, so
+    several jobs can read and write it at the same time.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS novels (
+            site TEXT NOT NULL,
+            book_id TEXT NOT NULL,
+            info TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (site, book_id)
+        );
+        CREATE TABLE IF NOT EXISTS chapters (
+            site TEXT NOT NULL,
+            book_id TEXT NOT NULL,
+            chapter_index INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            html TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            placeholder INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (site, book_id, chapter_index)
+        );
+    """
+
+    # Novel info fields kept to rebuild the book without fetching the novel page
+    NOVEL_FIELDS = ['title', 'author', 'cover_url', 'synopsis', 'site_type', 'book_id', 'url']
+
+    def __init__(self, path, site, book_id, logger=None):
+        """
+        Args:
+            path: Database file (usually one per novel in the temp folder)
+            site: Site type of the novel ('metruyenchu' or 'tangthuvien')
+            book_id: Book id on the site (the novel title when the site gave none)
+        """
+        self.logger = logger or logging.getLogger('chapter_store')
+        self.path = path
+        self.site = site
+        self.book_id = str(book_id)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            # Stores created before placeholder chapters were flagged
+            if 'placeholder' not in self._columns(conn, 'main'):
+                conn.execute("ALTER TABLE chapters ADD COLUMN placeholder INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        # One short-lived connection per call, so any thread may use the store
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _columns(conn, schema):
+        return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(chapters)")]
+
+    @staticmethod
+    def content_hash(html):
+        return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+    def save_novel(self, novel_info):
+        """Remember the novel information used to build the book"""
+        info = {field: novel_info.get(field) for field in self.NOVEL_FIELDS}
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO novels (site, book_id, info, updated_at) VALUES (?, ?, ?, ?)",
+                (self.site, self.book_id, json.dumps(info, ensure_ascii=False), time.time())
+            )
+
+    def load_novel(self):
+        """Novel information saved with save_novel, None if there is none"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT info FROM novels WHERE site = ? AND book_id = ?",
+                               (self.site, self.book_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_chapters(self, chapters):
+        """
+        Store chapters in one transaction, replacing earlier versions
+
+        Args:
+            chapters: List of dicts with 'index', 'title', the chapter 'html' and
+                      optionally 'placeholder' (content missing on the site)
+
+        Returns:
+            Number of chapters stored
+        """
+        if not chapters:
+            return 0
+
+        now = time.time()
+        rows = [(self.site, self.book_id, int(chapter['index']), chapter['title'], chapter['html'],
+                 self.content_hash(chapter['html']), now, int(bool(chapter.get('placeholder'))))
+                for chapter in chapters]
+        with closing(self._connect()) as conn, conn:
+            # A refetched chapter whose content did not change keeps its fetch time,
+            # the EPUB is dated by the newest chapter content
+            conn.executemany(
+                "INSERT INTO chapters "
+                "(site, book_id, chapter_index, title, html, content_hash, fetched_at, placeholder) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (site, book_id, chapter_index) DO UPDATE SET "
+                "title = excluded.title, html = excluded.html, placeholder = excluded.placeholder, "
+                "fetched_at = CASE WHEN content_hash = excluded.content_hash AND title = excluded.title "
+                "THEN fetched_at ELSE excluded.fetched_at END, "
+                "content_hash = excluded.content_hash", rows
+            )
+        return len(rows)
+
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM chapters WHERE site = ? AND book_id = ?",
+                                (self.site, self.book_id)).fetchone()[0]
+
+    def max_index(self):
+        """Highest stored chapter index, 0 if the store is empty"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MAX(chapter_index) FROM chapters WHERE site = ? AND book_id = ?",
+                               (self.site, self.book_id)).fetchone()
+        return row[0] or 0
+
+    def chapter_entries(self):
+        """
+        Index, title, content hash and placeholder flag of every stored chapter, without the HTML
+
+        Returns:
+            List of dicts with 'index', 'title', 'content_hash' and 'placeholder', in chapter order
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT chapter_index, title, content_hash, placeholder FROM chapters "
+                "WHERE site = ? AND book_id = ? ORDER BY chapter_index",
+                (self.site, self.book_id)
+            ).fetchall()
+        return [{'index': index, 'title': title, 'content_hash': content_hash, 'placeholder': bool(placeholder)}
+                for index, title, content_hash, placeholder in rows]
+
+    def iter_chapters(self):
+        """
+        Iterate over the stored chapters in chapter order, one row at a time
+
+        Yields:
+            Dicts with 'index', 'title', 'html', 'content_hash', 'fetched_at' and 'placeholder'
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "SELECT chapter_index, title, html, content_hash, fetched_at, placeholder FROM chapters "
+                "WHERE site = ? AND book_id = ? ORDER BY chapter_index",
+                (self.site, self.book_id)
+            )
+            for index, title, html, content_hash, fetched_at, placeholder in cursor:
+                yield {
+                    'index': index,
+                    'title': title,
+                    'html': html,
+                    'content_hash': content_hash,
+                    'fetched_at': fetched_at,
+                    'placeholder': bool(placeholder)
+                }
+
+    def merge_from(self, other_path):
+        """
+        Copy the chapters of another copy of the store that are missing here
+
+        Chapters already stored locally are kept, since they are at least as recent.
+
+        Args:
+            other_path: Database file of the other copy (e.g. downloaded from Dropbox)
+
+        Returns:
+            Number of chapters copied
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("ATTACH DATABASE ? AS other", (other_path,))
+            placeholder = 'placeholder' if 'placeholder' in self._columns(conn, 'other') else '0'
+            with conn:
+                before = conn.total_changes
+                conn.execute(
+                    "INSERT OR IGNORE INTO chapters "
+                    "(site, book_id, chapter_index, title, html, content_hash, fetched_at, placeholder) "
+                    f"SELECT site, book_id, chapter_index, title, html, content_hash, fetched_at, {placeholder} "
+                    "FROM other.chapters WHERE site = ? AND book_id = ?", (self.site, self.book_id)
+                )
+                copied = conn.total_changes - before
+                conn.execute(
+                    "INSERT OR IGNORE INTO novels SELECT site, book_id, info, updated_at FROM other.novels "
+                    "WHERE site = ? AND book_id = ?", (self.site, self.book_id)
+                )
+            conn.execute("DETACH DATABASE other")
+        return copied
+
+    def snapshot(self, dest_path):
+        """Write a consistent single-file copy of the store (e.g. for uploading it)"""
+        with closing(self._connect()) as conn, closing(sqlite3.connect(dest_path)) as dest:
+            conn.backup(dest)
+        return dest_path
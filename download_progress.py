@@ -0,0 +1,117 @@
+import os
+import math
+import time
+import threading
+
+class DownloadProgress:
+    """
+    Structured progress of one download
+
+    Counts the chapters of the novel that are fetched, failed or skipped (already
+    stored), the bytes fetched from the site and the current stage. The chapter
+    rate is an exponential moving average over time, sampled at most once per
+    second, so bursts of chapters released together by the in-order fetcher do
+    not make it jump, and the ETA follows the recent speed of the site rather
+    than the average since the start.
+    """
+
+    # Chapters are parsed while the next ones are fetched, so fetching and parsing share one stage
+    STAGES = ('info', 'fetch', 'assemble', 'upload', 'done')
+
+    def __init__(self, rate_window=None):
+        """
+        Args:
+            rate_window: Time constant of the rate average in seconds
+                         (default: PROGRESS_RATE_WINDOW or 20)
+        """
+        self.rate_window = rate_window if rate_window is not None else float(os.getenv('PROGRESS_RATE_WINDOW', 20))
+        self.stage = 'info'
+        self.chapters_total = 0
+        self.chapters_done = 0
+        self.chapters_failed = 0
+        self.chapters_skipped = 0
+        self.bytes_fetched = 0
+        self.started_at = time.time()
+        self.stage_started_at = self.started_at
+        self.rate = None  # Chapters per second, None until the first sample
+        self._sample_time = None
+        self._sample_done = 0
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage):
+        if stage not in self.STAGES:
+            raise ValueError(f"Unknown download stage: {stage}")
+        with self._lock:
+            if stage == 'fetch':
+                # The rate only measures the fetch stage
+                self._sample_time = time.time()
+                self._sample_done = self.chapters_done
+            self.stage = stage
+            self.stage_started_at = time.time()
+
+    def set_chapters(self, total, skipped=0):
+        """Chapter count of the novel and how many of them are already stored"""
+        with self._lock:
+            self.chapters_total = total
+            self.chapters_skipped = skipped
+
+    def chapter_done(self, failed=False):
+        with self._lock:
+            if failed:
+                self.chapters_failed += 1
+            else:
+                self.chapters_done += 1
+            self._sample(time.time())
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_fetched += count
+
+    def _sample(self, now):
+        """Fold the chapters fetched since the last sample into the rate (called with the lock held)"""
+        if self._sample_time is None:
+            return
+        elapsed = now - self._sample_time
+        if elapsed < 1:
+            return
+        window_rate = (self.chapters_done - self._sample_done) / elapsed
+        if self.rate is None:
+            self.rate = window_rate
+        else:
+            # Weight of the new sample grows with the time it covers
+            alpha = 1 - math.exp(-elapsed / self.rate_window)
+            self.rate += alpha * (window_rate - self.rate)
+        self._sample_time = now
+        self._sample_done = self.chapters_done
+
+    def remaining(self):
+        return max(self.chapters_total - self.chapters_skipped - self.chapters_done - self.chapters_failed, 0)
+
+    def to_dict(self):
+        """Progress record as sent to clients and stored with the job status"""
+        with self._lock:
+            now = time.time()
+            rate = self.rate
+            if rate is None and self.stage == 'fetch' and now > self.stage_started_at:
+                # No full sample yet, use the average of the stage so far
+                rate = self.chapters_done / (now - self.stage_started_at)
+            remaining = self.remaining()
+            finished = self.chapters_skipped + self.chapters_done + self.chapters_failed
+
+            eta = None
+            if self.stage == 'fetch' and rate:
+                eta = round(remaining / rate)
+
+            return {
+                'stage': self.stage,
+                'chapters_total': self.chapters_total,
+                'chapters_done': self.chapters_done,
+                'chapters_failed': self.chapters_failed,
+                'chapters_skipped': self.chapters_skipped,
+                'percent': round(finished * 100 / self.chapters_total, 1) if self.chapters_total else 0,
+                'bytes_fetched': self.bytes_fetched,
+                'rate': round(rate, 2) if rate is not None else None,
+                'eta': eta,
+                'elapsed': round(now - self.started_at),
+                'stage_elapsed': round(now - self.stage_started_at)
+            }
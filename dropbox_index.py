@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+import dropbox
+from dropbox.exceptions import ApiError
+
+class DropboxFolderIndex:
+    """
+    Cached index of the files in Dropbox folders, for existence checks by name
+
+    A folder is listed in full (every page) the first time it is looked up. After
+    that, lookups older than the refresh interval only fetch the changes since the
+    last listing through the list_folder cursor, and uploads made through the
+    storage are added right away. Names are matched case-insensitively, like
+    Dropbox does.
+    """
+
+    def __init__(self, storage, logger=None, refresh_interval=None):
+        """
+        Args:
+            storage: DropboxStorage whose client is used for the listings
+            refresh_interval: Seconds a listing is trusted before its changes are fetched
+                              (default: DROPBOX_INDEX_REFRESH or 30)
+        """
+        self.logger = logger or logging.getLogger('dropbox_index')
+        self.storage = storage
+        self.refresh_interval = refresh_interval if refresh_interval is not None else \
+            float(os.getenv('DROPBOX_INDEX_REFRESH', 30))
+        self._folders = {}  # folder path (lower case) -> {'entries', 'cursor', 'refreshed_at'}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(path):
+        folder, name = os.path.split(path.rstrip('/'))
+        return folder.lower() if folder != '/' else '', name
+
+    @staticmethod
+    def entry_info(entry):
+        """File info dict (as returned by DropboxStorage.list_files) of a metadata entry"""
+        return {
+            'name': entry.name,
+            'path': entry.path_display,
+            'type': 'folder' if isinstance(entry, dropbox.files.FolderMetadata) else 'file',
+            'size': getattr(entry, 'size', 0) if hasattr(entry, 'size') else 0
+        }
+
+    def _apply(self, entries, changes):
+        for entry in changes:
+            if isinstance(entry, dropbox.files.DeletedMetadata):
+                entries.pop(entry.name.lower(), None)
+            else:
+                entries[entry.name.lower()] = self.entry_info(entry)
+
+    def _list(self, folder):
+        """List a folder in full, returns (entries, cursor)"""
+        dbx = self.storage.dbx
+        entries = {}
+        result = dbx.files_list_folder(folder)
+        self._apply(entries, result.entries)
+        while result.has_more:
+            result = dbx.files_list_folder_continue(result.cursor)
+            self._apply(entries, result.entries)
+        return entries, result.cursor
+
+    def _refresh(self, folder, state):
+        """Apply the changes made to a folder since its last listing"""
+        dbx = self.storage.dbx
+        try:
+            result = dbx.files_list_folder_continue(state['cursor'])
+            self._apply(state['entries'], result.entries)
+            while result.has_more:
+                result = dbx.files_list_folder_continue(result.cursor)
+                self._apply(state['entries'], result.entries)
+            state['cursor'] = result.cursor
+        except ApiError as e:
+            if not (hasattr(e.error, 'is_reset') and e.error.is_reset()):
+                raise
+            # Dropbox expired the cursor, list the folder again
+            self.logger.info(f"Dropbox cursor of {folder or '/'} was reset, listing it again")
+            state['entries'], state['cursor'] = self._list(folder)
+
+    def _folder(self, folder):
+        """Up-to-date entries of a folder (called with the lock held)"""
+        state = self._folders.get(folder)
+        now = time.time()
+        if state is None:
+            try:
+                entries, cursor = self._list(folder)
+            except ApiError as e:
+                if hasattr(e.error, 'is_path') and e.error.is_path() and e.error.get_path().is_not_found():
+                    return {}  # Not created yet, nothing to cache
+                raise
+            state = self._folders[folder] = {'entries': entries, 'cursor': cursor, 'refreshed_at': now}
+            self.logger.info(f"Indexed {len(entries)} entries of Dropbox folder {folder or '/'}")
+        elif now - state['refreshed_at'] >= self.refresh_interval:
+            self._refresh(folder, state)
+            state['refreshed_at'] = now
+        return state['entries']
+
+    def find(self, path):
+        """
+        Look up a file or folder by path
+
+        Returns:
+            File info dict, None if it does not exist
+        """
+        folder, name = self._split(path)
+        with self._lock:
+            return self._folder(folder).get(name.lower())
+
+    def exists(self, path):
+        return self.find(path) is not None
+
+    def entries(self, folder):
+        """File info dicts of every entry of a folder"""
+        with self._lock:
+            return list(self._folder(folder.rstrip('/').lower()).values())
+
+    def added(self, metadata):
+        """Record a file just uploaded, if its folder is indexed"""
+        folder, _ = self._split(metadata.path_display)
+        with self._lock:
+            state = self._folders.get(folder)
+            if state is not None:
+                state['entries'][metadata.name.lower()] = self.entry_info(metadata)
+
+    def clear(self):
+        """Forget every listing (e.g. after switching accounts)"""
+        with self._lock:
+            self._folders = {}
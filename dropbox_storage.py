@@ -1,38 +1,70 @@
 import os
+import hashlib
 import logging
+import threading
 import dropbox
-from dropbox.exceptions import ApiError, AuthError
-from dropbox.files import WriteMode
+import requests
+from dropbox.exceptions import ApiError, AuthError, InternalServerError, RateLimitError
+from dropbox.files import CommitInfo, UploadSessionCursor, WriteMode
 import time
 import json
+from dropbox_index import DropboxFolderIndex
+from progress_channel import ProgressChannel
+
+# Dropbox rejects a single upload request above 150 MB
+MAX_UPLOAD_CHUNK_SIZE = 150 * 1024 * 1024
+# Block size of the Dropbox content hash
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+def dropbox_content_hash(path):
+    """
+    Compute the Dropbox content hash of a local file
+
+    SHA-256 of the concatenated SHA-256 digests of each 4 MB block, the value
+    Dropbox reports as content_hash in file metadata.
+    """
+    block_hashes = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(CONTENT_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            block_hashes.update(hashlib.sha256(block).digest())
+    return block_hashes.hexdigest()
 
 class DropboxStorage:
-    def __init__(self, logger=None, socket=None, dropbox_auth=None):
+    def __init__(self, logger=None, socket=None, dropbox_auth=None, progress=None):
         self.logger = logger or logging.getLogger('dropbox_storage')
         self.socket = socket
+        # Log lines reach the clients in the batched frames of their download
+        self.progress = progress or (ProgressChannel(socket, logger=self.logger) if socket else None)
         self.dropbox_auth = dropbox_auth
         self.dbx = None
         self.is_active = False
+        # Files larger than one chunk are uploaded in an upload session, chunk by chunk
+        chunk_mb = float(os.getenv('DROPBOX_UPLOAD_CHUNK_MB', 8))
+        self.upload_chunk_size = min(max(int(chunk_mb * 1024 * 1024), 1024 * 1024), MAX_UPLOAD_CHUNK_SIZE)
+        # Attempts per chunk after network or server errors
+        self.upload_retries = int(os.getenv('DROPBOX_UPLOAD_RETRIES', 3))
+        # Shared link of each uploaded path, links stay valid when the file is overwritten
+        self._shared_links = {}
+        self._shared_links_lock = threading.Lock()
+        # Cached listings of the folders looked up, for existence checks without listing them again
+        self.folder_index = DropboxFolderIndex(self, logger=self.logger)
         self._initialize_client()
 
     def _log(self, level, message, download_id=None):
         """Log a message and emit it via socket if available"""
         if level == 'info':
-            self.logger.info(message)
+            self.logger.info(message, extra={'download_id': download_id})
         elif level == 'error':
-            self.logger.error(message)
+            self.logger.error(message, extra={'download_id': download_id})
         elif level == 'warning':
-            self.logger.warning(message)
-
-        # Emit via socket if available
-        if self.socket and download_id:
-            self.socket.emit('log_update', {
-                'download_id': download_id,
-                'level': level,
-                'message': message,
-                'timestamp': time.time(),
-                'source': 'dropbox_storage'  # Add source identifier
-            })
+            self.logger.warning(message, extra={'download_id': download_id})
+
+        # Send via socket if available, with the next progress frame of the download
+        if self.progress and download_id:
+            self.progress.log(download_id, level, message, 'dropbox_storage')
 
     def _initialize_client(self):
         """Initialize Dropbox client if auth is available"""
@@ -158,75 +190,36 @@ class DropboxStorage:
             self._log('info', f"Local path: {local_path}", download_id)
             self._log('info', f"Dropbox path: {dropbox_path}", download_id)
 
-            # Read file contents
-            with open(local_path, 'rb') as f:
-                file_content = f.read()
-
-            self._log('info', f"File read successfully, content length: {len(file_content)} bytes", download_id)
+            # Skip the upload when Dropbox already has the same bytes at this path
+            content_hash = dropbox_content_hash(local_path)
+            if self._remote_content_hash(dropbox_path) == content_hash:
+                self._log('info', f"File unchanged in Dropbox (content hash {content_hash[:12]}...), skipping upload", download_id)
+                return self._get_shared_link(dropbox_path, download_id)
 
             # Upload the file
             self._log('info', "Starting Dropbox upload...", download_id)
             upload_start = time.time()
-            upload_result = self.dbx.files_upload(
-                file_content,
-                dropbox_path,
-                mode=WriteMode('overwrite')
-            )
+            if file_size > self.upload_chunk_size:
+                upload_result = self._upload_in_session(local_path, dropbox_path, file_size, download_id)
+            else:
+                with open(local_path, 'rb') as f:
+                    upload_result = self.dbx.files_upload(
+                        f.read(),
+                        dropbox_path,
+                        mode=WriteMode('overwrite'),
+                        content_hash=content_hash
+                    )
             upload_time = time.time() - upload_start
 
             # Log upload result
-            self._log('info', f"Upload completed in {upload_time:.2f} seconds", download_id)
+            self._log('info', f"Upload completed in {upload_time:.2f} seconds "
+                              f"({file_size / (1024*1024) / max(upload_time, 0.001):.2f} MB/s)", download_id)
             self._log('info', f"Upload result: {upload_result}", download_id)
             self._log('info', f"File uploaded successfully to {dropbox_path}", download_id)
+            if isinstance(upload_result, dropbox.files.FileMetadata):
+                self.folder_index.added(upload_result)
 
-            # Create a shared link
-            self._log('info', "Creating shared link...", download_id)
-            shared_link_start = time.time()
-            try:
-                shared_link = self.dbx.sharing_create_shared_link_with_settings(dropbox_path)
-                shared_link_time = time.time() - shared_link_start
-                self._log('info', f"Shared link created in {shared_link_time:.2f} seconds", download_id)
-                self._log('info', f"Shared link result: {shared_link}", download_id)
-
-                link_url = shared_link.url
-
-                # Convert dropbox.com links to dl.dropboxusercontent.com links for direct download
-                if link_url.startswith('https://www.dropbox.com'):
-                    dl_url = link_url.replace('www.dropbox.com', 'dl.dropboxusercontent.com')
-                    dl_url = dl_url.replace('?dl=0', '')
-                    self._log('info', f"Converted URL for direct download: {dl_url}", download_id)
-                else:
-                    dl_url = link_url
-                    self._log('info', f"Using original URL (no conversion needed): {dl_url}", download_id)
-
-                return dl_url
-            except Exception as e:
-                self._log('error', f"Error creating shared link: {str(e)}", download_id)
-                self._log('error', f"Will try alternate method to create shared link...", download_id)
-
-                # Try alternate method for shared link
-                try:
-                    sharing_info = self.dbx.sharing_get_shared_links(dropbox_path)
-                    self._log('info', f"Got existing sharing info: {sharing_info}", download_id)
-
-                    if sharing_info.links:
-                        link_url = sharing_info.links[0].url
-                        self._log('info', f"Found existing shared link: {link_url}", download_id)
-
-                        # Convert URL for direct download
-                        if link_url.startswith('https://www.dropbox.com'):
-                            dl_url = link_url.replace('www.dropbox.com', 'dl.dropboxusercontent.com')
-                            dl_url = dl_url.replace('?dl=0', '')
-                        else:
-                            dl_url = link_url
-
-                        return dl_url
-                    else:
-                        self._log('error', "No existing shared links found", download_id)
-                        return None
-                except Exception as alt_e:
-                    self._log('error', f"Alternate method also failed: {str(alt_e)}", download_id)
-                    return None
+            return self._get_shared_link(dropbox_path, download_id)
 
         except ApiError as e:
             self._log('error', f"Dropbox API error: {str(e)}", download_id)
@@ -243,6 +236,188 @@ class DropboxStorage:
             self._log('error', f"Traceback: {traceback.format_exc()}", download_id)
             return None
 
+    def _remote_content_hash(self, dropbox_path):
+        """Content hash of a file in Dropbox, None if it does not exist"""
+        try:
+            metadata = self.dbx.files_get_metadata(dropbox_path)
+        except ApiError as e:
+            if not (e.error.is_path() and e.error.get_path().is_not_found()):
+                self.logger.warning(f"Could not read Dropbox metadata of {dropbox_path}: {str(e)}")
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not read Dropbox metadata of {dropbox_path}: {str(e)}")
+            return None
+        return getattr(metadata, 'content_hash', None)
+
+    def _get_shared_link(self, dropbox_path, download_id=None):
+        """
+        Direct download link of a Dropbox file, created once per path and cached
+
+        Returns:
+            Shared link URL, None if no link could be created
+        """
+        with self._shared_links_lock:
+            if dropbox_path in self._shared_links:
+                return self._shared_links[dropbox_path]
+
+        dl_url = self._create_shared_link(dropbox_path, download_id)
+        if dl_url:
+            with self._shared_links_lock:
+                self._shared_links[dropbox_path] = dl_url
+        return dl_url
+
+    def _create_shared_link(self, dropbox_path, download_id=None):
+        """Create a shared link for a file (or reuse an existing one) and turn it into a direct download URL"""
+        self._log('info', "Creating shared link...", download_id)
+        shared_link_start = time.time()
+        try:
+            shared_link = self.dbx.sharing_create_shared_link_with_settings(dropbox_path)
+            shared_link_time = time.time() - shared_link_start
+            self._log('info', f"Shared link created in {shared_link_time:.2f} seconds", download_id)
+            self._log('info', f"Shared link result: {shared_link}", download_id)
+
+            link_url = shared_link.url
+
+            # Convert dropbox.com links to dl.dropboxusercontent.com links for direct download
+            if link_url.startswith('https://www.dropbox.com'):
+                dl_url = link_url.replace('www.dropbox.com', 'dl.dropboxusercontent.com')
+                dl_url = dl_url.replace('?dl=0', '')
+                self._log('info', f"Converted URL for direct download: {dl_url}", download_id)
+            else:
+                dl_url = link_url
+                self._log('info', f"Using original URL (no conversion needed): {dl_url}", download_id)
+
+            return dl_url
+        except Exception as e:
+            self._log('error', f"Error creating shared link: {str(e)}", download_id)
+            self._log('error', f"Will try alternate method to create shared link...", download_id)
+
+            # Try alternate method for shared link
+            try:
+                sharing_info = self.dbx.sharing_get_shared_links(dropbox_path)
+                self._log('info', f"Got existing sharing info: {sharing_info}", download_id)
+
+                if sharing_info.links:
+                    link_url = sharing_info.links[0].url
+                    self._log('info', f"Found existing shared link: {link_url}", download_id)
+
+                    # Convert URL for direct download
+                    if link_url.startswith('https://www.dropbox.com'):
+                        dl_url = link_url.replace('www.dropbox.com', 'dl.dropboxusercontent.com')
+                        dl_url = dl_url.replace('?dl=0', '')
+                    else:
+                        dl_url = link_url
+
+                    return dl_url
+                else:
+                    self._log('error', "No existing shared links found", download_id)
+                    return None
+            except Exception as alt_e:
+                self._log('error', f"Alternate method also failed: {str(alt_e)}", download_id)
+                return None
+
+    def _upload_in_session(self, local_path, dropbox_path, file_size, download_id=None):
+        """
+        Upload a large file through an upload session, streaming it from disk one chunk at a time
+
+        The session id and the last offset acknowledged by Dropbox are saved next to
+        the local file, so an upload that failed continues from that offset the next
+        time the same file is uploaded to the same path.
+
+        Returns:
+            FileMetadata of the uploaded file
+        """
+        state_path = local_path + '.dropbox-upload'
+        file_mtime = os.path.getmtime(local_path)
+        session_id, offset = None, 0
+
+        state = self._load_upload_state(state_path)
+        if state and state.get('dropbox_path') == dropbox_path and state.get('size') == file_size \
+                and state.get('mtime') == file_mtime:
+            session_id, offset = state['session_id'], state['offset']
+            self._log('info', f"Resuming upload session at {offset / (1024*1024):.2f} MB", download_id)
+
+        commit = CommitInfo(path=dropbox_path, mode=WriteMode('overwrite'))
+        failures = 0
+        with open(local_path, 'rb') as f:
+            while True:
+                f.seek(offset)
+                chunk = f.read(min(self.upload_chunk_size, file_size - offset))
+                is_last = offset + len(chunk) >= file_size
+                chunk_start = time.time()
+                try:
+                    if session_id is None:
+                        session_id = self.dbx.files_upload_session_start(chunk).session_id
+                    elif is_last:
+                        result = self.dbx.files_upload_session_finish(chunk, UploadSessionCursor(session_id, offset), commit)
+                    else:
+                        self.dbx.files_upload_session_append_v2(chunk, UploadSessionCursor(session_id, offset))
+                except ApiError as e:
+                    lookup_error = e.error
+                    if hasattr(lookup_error, 'is_lookup_failed') and lookup_error.is_lookup_failed():
+                        lookup_error = lookup_error.get_lookup_failed()
+
+                    if hasattr(lookup_error, 'is_incorrect_offset') and lookup_error.is_incorrect_offset():
+                        # Dropbox already has a different part of the file (e.g. a chunk sent before a timeout)
+                        offset = lookup_error.get_incorrect_offset().correct_offset
+                        self._log('warning', f"Upload offset corrected by Dropbox to {offset} bytes", download_id)
+                    elif hasattr(lookup_error, 'is_not_found') and lookup_error.is_not_found():
+                        # Saved session expired, start a new one
+                        self._log('warning', "Upload session expired, starting a new one", download_id)
+                        session_id, offset = None, 0
+                    else:
+                        raise
+                    failures += 1
+                    if failures > self.upload_retries:
+                        raise
+                    continue
+                except (requests.exceptions.RequestException, InternalServerError, RateLimitError) as e:
+                    failures += 1
+                    if failures > self.upload_retries:
+                        raise
+                    delay = getattr(e, 'backoff', None) or 2 ** failures
+                    self._log('warning', f"Upload chunk failed ({str(e)}), retrying in {delay} seconds "
+                                         f"from {offset / (1024*1024):.2f} MB", download_id)
+                    time.sleep(delay)
+                    continue
+
+                failures = 0
+                offset += len(chunk)
+                chunk_time = max(time.time() - chunk_start, 0.001)
+                self._log('info', f"Uploaded {offset / (1024*1024):.2f}/{file_size / (1024*1024):.2f} MB "
+                                  f"({offset * 100 // file_size}%) at {len(chunk) / (1024*1024) / chunk_time:.2f} MB/s", download_id)
+
+                if is_last:
+                    self._remove_upload_state(state_path)
+                    return result
+                self._save_upload_state(state_path, {
+                    'dropbox_path': dropbox_path,
+                    'size': file_size,
+                    'mtime': file_mtime,
+                    'session_id': session_id,
+                    'offset': offset
+                })
+
+    def _load_upload_state(self, state_path):
+        try:
+            with open(state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_upload_state(self, state_path, state):
+        try:
+            with open(state_path, 'w') as f:
+                json.dump(state, f)
+        except OSError as e:
+            self.logger.warning(f"Could not save upload session state: {str(e)}")
+
+    def _remove_upload_state(self, state_path):
+        try:
+            os.remove(state_path)
+        except FileNotFoundError:
+            pass
+
     def download_file(self, dropbox_path, local_path):
         """
         Download a file from Dropbox
@@ -320,6 +495,21 @@ class DropboxStorage:
             self._log('error', f"Traceback: {traceback.format_exc()}")
             return False
 
+    def file_exists(self, dropbox_path):
+        """
+        Check whether a file exists in Dropbox, using the cached folder index
+
+        Returns:
+            True if it exists, False otherwise (or if Dropbox could not be reached)
+        """
+        if not self.is_active:
+            return False
+        try:
+            return self.folder_index.exists(dropbox_path)
+        except Exception as e:
+            self._log('error', f"Error checking {dropbox_path} in Dropbox: {str(e)}")
+            return False
+
     def list_files(self, path=""):
         """
         List files in a Dropbox folder
@@ -337,16 +527,14 @@ class DropboxStorage:
         try:
             self._log('info', f"Listing files in: {path}")
             result = self.dbx.files_list_folder(path)
+            entries = list(result.entries)
+
+            # Large folders come in several pages
+            while result.has_more:
+                result = self.dbx.files_list_folder_continue(result.cursor)
+                entries.extend(result.entries)
 
-            files = []
-            for entry in result.entries:
-                file_info = {
-                    'name': entry.name,
-                    'path': entry.path_display,
-                    'type': 'folder' if isinstance(entry, dropbox.files.FolderMetadata) else 'file',
-                    'size': getattr(entry, 'size', 0) if hasattr(entry, 'size') else 0
-                }
-                files.append(file_info)
+            files = [DropboxFolderIndex.entry_info(entry) for entry in entries]
 
             self._log('info', f"Listed {len(files)} files/folders in {path}")
             return files
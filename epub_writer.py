@@ -0,0 +1,147 @@
+import os
+import zipfile
+import logging
+from ebooklib import epub
+
+# Timestamp of every zip entry, so the same book always gives the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+class FixedTimeZipFile(zipfile.ZipFile):
+    """Zip file writing its entries with ZIP_DATE_TIME instead of the current time"""
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if not isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            zinfo_or_arcname = zipfile.ZipInfo(zinfo_or_arcname, date_time=ZIP_DATE_TIME)
+            zinfo_or_arcname.compress_type = self.compression
+            zinfo_or_arcname.external_attr = 0o600 << 16
+            if compresslevel is None:
+                compresslevel = self.compresslevel
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+class ChapterEntry(epub.EpubHtml):
+    """Index entry of a chapter already written to the zip (no content kept)"""
+
+    def __init__(self, item):
+        super().__init__(uid=item.id, file_name=item.file_name,
+                         media_type=item.media_type or 'application/xhtml+xml',
+                         title=item.title, lang=item.lang, direction=item.direction,
+                         media_overlay=item.media_overlay, media_duration=item.media_duration)
+        self.properties = list(item.properties)
+        self.is_linear = item.is_linear
+
+class StreamingEpubWriter(epub.EpubWriter):
+    """
+    EPUB writer that stores each chapter in the zip as soon as it is added
+
+    The book only keeps its small items (metadata, cover, intro, stylesheet,
+    navigation) and a ChapterEntry per written chapter, so memory does not grow
+    with the chapter contents. The OPF, NCX and nav are written from that index
+    when the book is closed. The zip is built next to the output path and only
+    moved into place once it is complete.
+
+    The zip entries carry a fixed timestamp and the OPF modified date is passed
+    to close(), so writing the same book again gives a byte-identical EPUB.
+    """
+
+    def __init__(self, output_path, book, logger=None):
+        """
+        Args:
+            output_path: Path of the finished EPUB
+            book: EpubBook holding the metadata and non-chapter items; chapter items
+                  already in it are removed and must be passed to add_chapter
+        """
+        # The nav page-list would re-read every chapter; chapter pages never carry
+        # epub:type page markers (their attributes are stripped when optimized)
+        super().__init__(output_path + '.part', book, {'epub3_pages': False})
+        self.logger = logger or logging.getLogger('epub_writer')
+        self.output_path = output_path
+        self.chapters = []  # ChapterEntry of each written chapter, in the order added
+        self.parts = []     # ChapterEntry of each written split part, listed after the chapters
+        self.out = None
+
+    def open(self):
+        """Start the zip: mimetype first and uncompressed, then the container file"""
+        self.book.items = [item for item in self.book.items if not self.is_chapter(item)]
+        self.process()
+
+        self.out = FixedTimeZipFile(self.file_name, 'w', zipfile.ZIP_DEFLATED,
+                                    compresslevel=self.options['compresslevel'])
+        self.out.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self._write_container()
+        return self
+
+    @staticmethod
+    def is_chapter(item):
+        return isinstance(item, epub.EpubHtml) and bool(getattr(item, 'id', None)) and item.id.startswith('chapter_')
+
+    def add_chapter(self, item, is_part=False):
+        """
+        Write a chapter page to the zip and release its content
+
+        Args:
+            item: EpubHtml of the chapter
+            is_part: Whether the page is a part of a split chapter
+
+        Returns:
+            The ChapterEntry standing for the chapter in the book
+        """
+        item.book = self.book
+        self.out.writestr(f"{self.book.FOLDER_NAME}/{item.file_name}", item.get_content())
+
+        entry = ChapterEntry(item)
+        entry.book = self.book
+        (self.parts if is_part else self.chapters).append(entry)
+
+        # Free the page, only the entry stays in memory
+        if hasattr(item, 'document'):
+            item.document = None
+        item.content = ''
+        return entry
+
+    def _write_items(self):
+        for item in self.book.get_items():
+            if not isinstance(item, ChapterEntry):
+                self._write_item(item)
+
+    def _write_item(self, item):
+        if isinstance(item, epub.EpubNcx):
+            self.out.writestr(f"{self.book.FOLDER_NAME}/{item.file_name}", self._get_ncx())
+        elif isinstance(item, epub.EpubNav):
+            self.out.writestr(f"{self.book.FOLDER_NAME}/{item.file_name}", self._get_nav(item))
+        elif item.manifest:
+            self.out.writestr(f"{self.book.FOLDER_NAME}/{item.file_name}", item.get_content())
+        else:
+            self.out.writestr(item.file_name, item.get_content())
+
+    def close(self, modified=None):
+        """
+        Write the remaining items, the OPF and the navigation, then move the EPUB into place
+
+        The caller sets book.spine and book.toc from the chapter entries first.
+
+        Args:
+            modified: UTC datetime written as the book's modified date (default: now)
+        """
+        if modified is not None:
+            self.options['mtime'] = modified
+        self.book.items.extend(self.chapters)
+        self.book.items.extend(self.parts)
+
+        self._write_opf()
+        self._write_items()
+        self.out.close()
+        self.out = None
+        os.replace(self.file_name, self.output_path)
+
+    def abort(self):
+        """Drop an unfinished EPUB"""
+        if self.out is not None:
+            try:
+                self.out.close()
+            except Exception as e:
+                self.logger.warning(f"Error closing unfinished EPUB: {e}")
+            self.out = None
+        try:
+            os.remove(self.file_name)
+        except FileNotFoundError:
+            pass
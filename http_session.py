@@ -0,0 +1,84 @@
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+class HttpSessionPool:
+    """Per-host pool of keep-alive requests sessions"""
+
+    def __init__(self, pool_size=None, logger=None):
+        """
+        Initialize the session pool
+
+        Args:
+            pool_size: Maximum number of open connections kept per host
+                       (default: HTTP_POOL_SIZE environment variable or 10)
+        """
+        self.logger = logger or logging.getLogger('http_session')
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', 10))
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        """Create a session whose adapter keeps up to pool_size connections alive"""
+        session = requests.Session()
+        # Retries are handled by NovelDownloader._make_request, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                              pool_block=False, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['connection'] = 'keep-alive'
+        return session
+
+    def get_session(self, url):
+        """Return the shared session for the host of the given URL"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            session = self.sessions.get(host)
+            if session is None:
+                self.logger.info(f"Opening HTTP session pool for {host} (pool size: {self.pool_size})")
+                session = self._create_session()
+                self.sessions[host] = session
+            return session
+
+    def get(self, url, **kwargs):
+        """Send a GET request through the pooled session of the URL's host"""
+        return self.get_session(url).get(url, **kwargs)
+
+    def get_stats(self):
+        """
+        Get connection reuse statistics per host
+
+        Returns:
+            Dict mapping host to its request count, opened connections and reused requests
+        """
+        stats = {}
+        with self._lock:
+            sessions = dict(self.sessions)
+
+        for host, session in sessions.items():
+            requests_count = 0
+            connections = 0
+            for adapter in set(session.adapters.values()):
+                for key in list(adapter.poolmanager.pools.keys()):
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+            stats[host] = {
+                'requests': requests_count,
+                'connections': connections,
+                'reused': max(0, requests_count - connections)
+            }
+        return stats
+
+    def close(self):
+        """Close all sessions and their pooled connections"""
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.close()
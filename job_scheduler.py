@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import itertools
+import threading
+
+class DownloadJob:
+    """A download waiting for or running on a scheduler worker"""
+
+    def __init__(self, job_id, url, site=None, priority=0, params=None):
+        """
+        Args:
+            job_id: Download ID of the job
+            url: Novel page URL
+            site: Site type of the novel, used for the per-site limits (None if unknown)
+            priority: Higher priorities run first when the scheduler orders by priority
+            params: Extra arguments passed on to the job runner (cookie, engine, ...)
+        """
+        self.id = job_id
+        self.url = url
+        self.site = site
+        self.priority = priority
+        self.params = params or {}
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.cancel_event = threading.Event()
+        self.seq = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class JobScheduler:
+    """
+    Runs download jobs on a pool of worker threads
+
+    Submitting returns at once, the jobs wait in the scheduler until a worker is
+    free. Jobs of the same site are capped so one site cannot take every worker,
+    and they are picked in submission order (FIFO) or by priority, submission
+    order breaking ties. Waiting jobs can be cancelled outright; running jobs
+    get their cancel event set and stop at the next chapter.
+    """
+
+    ORDERS = ('fifo', 'priority')
+
+    def __init__(self, run_job, logger=None, workers=None, site_limits=None, order=None):
+        """
+        Args:
+            run_job: Callable running a DownloadJob on a worker thread
+            workers: Number of jobs run at the same time (default: DOWNLOAD_WORKERS or 3)
+            site_limits: Dict of site type -> maximum running jobs of that site
+                         (default: MTC_MAX_JOBS and TTV_MAX_JOBS, 2 each)
+            order: 'fifo' or 'priority' (default: JOB_ORDER or 'fifo')
+        """
+        self.logger = logger or logging.getLogger('job_scheduler')
+        self.run_job = run_job
+        self.workers = workers if workers is not None else int(os.getenv('DOWNLOAD_WORKERS', 3))
+        self.site_limits = site_limits if site_limits is not None else {
+            'metruyenchu': int(os.getenv('MTC_MAX_JOBS', 2)),
+            'tangthuvien': int(os.getenv('TTV_MAX_JOBS', 2))
+        }
+        self.order = order or os.getenv('JOB_ORDER', 'fifo').lower()
+        if self.order not in self.ORDERS:
+            raise ValueError(f"Unsupported job order: {self.order}")
+
+        self._waiting = []     # Jobs not started yet
+        self._running = {}     # job id -> running job
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def _sort_key(self, job):
+        if self.order == 'priority':
+            return (-job.priority, job.seq)
+        return job.seq
+
+    def submit(self, job):
+        """
+        Queue a job, returns at once
+
+        Returns:
+            Position of the job in the queue (1 = next to start)
+        """
+        with self._condition:
+            job.seq = next(self._counter)
+            self._waiting.append(job)
+            self._waiting.sort(key=self._sort_key)
+            self._start_workers()
+            self._condition.notify()
+            return self._waiting.index(job) + 1
+
+    def start(self):
+        """Start the worker threads (they are also started by the first submit)"""
+        with self._condition:
+            self._start_workers()
+
+    def _start_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < max(self.workers, 1):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _site_running(self, site):
+        return sum(1 for job in self._running.values() if job.site == site)
+
+    def _next_job(self):
+        """First waiting job whose site is under its limit (called with the lock held)"""
+        for job in self._waiting:
+            limit = self.site_limits.get(job.site)
+            if limit is not None and self._site_running(job.site) >= max(limit, 1):
+                continue
+            self._waiting.remove(job)
+            self._running[job.id] = job
+            job.started_at = time.time()
+            return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+
+            try:
+                self.logger.info(f"Starting job {job.id} ({job.site or 'unknown site'})", extra={'download_id': job.id})
+                self.run_job(job)
+            except Exception as e:
+                self.logger.error(f"Error running job {job.id}: {str(e)}", extra={'download_id': job.id})
+            finally:
+                with self._condition:
+                    self._running.pop(job.id, None)
+                    # A site slot is free again, other workers may now start a job
+                    self._condition.notify_all()
+
+    def cancel(self, job_id):
+        """
+        Cancel a job
+
+        Returns:
+            The cancelled DownloadJob and 'waiting' (removed from the queue) or
+            'running' (asked to stop), or (None, None) if the job is unknown or finished
+        """
+        with self._condition:
+            for job in self._waiting:
+                if job.id == job_id:
+                    self._waiting.remove(job)
+                    job.cancel_event.set()
+                    return job, 'waiting'
+            job = self._running.get(job_id)
+            if job:
+                job.cancel_event.set()
+                return job, 'running'
+        return None, None
+
+    def position(self, job_id):
+        """Position of a waiting job in the queue (1 = next to start), None if it is not waiting"""
+        with self._condition:
+            for position, job in enumerate(self._waiting, 1):
+                if job.id == job_id:
+                    return position
+        return None
+
+    def snapshot(self):
+        """
+        Current state of the scheduler
+
+        Returns:
+            Dict with the 'running' and 'waiting' jobs (in queue order) and the settings
+        """
+        def describe(job):
+            return {
+                'download_id': job.id,
+                'url': job.url,
+                'site': job.site,
+                'priority': job.priority,
+                'submit_time': job.submitted_at,
+                'start_time': job.started_at
+            }
+
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'alive_workers': sum(1 for thread in self._threads if thread.is_alive()),
+                'order': self.order,
+                'site_limits': dict(self.site_limits),
+                'running': [describe(job) for job in self._running.values()],
+                'waiting': [describe(job) for job in self._waiting]
+            }
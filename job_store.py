@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from contextlib import closing
+
+class JobStore:
+    """
+    SQLite table of the download jobs and their status
+
+    Every job is recorded when it is submitted, with what is needed to run it
+    again (URL, site, priority, cookie and engine), and its status dict (state,
+    progress, times, file path, Dropbox link or error) is rewritten on every
+    change. After a restart the finished jobs can still be looked up and the
+    interrupted ones are submitted again; they resume from the checkpoints of
+    their chapter stores.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            site TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            params TEXT NOT NULL,
+            state TEXT NOT NULL,
+            status TEXT NOT NULL,
+            restarts INTEGER NOT NULL DEFAULT 0,
+            submitted_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+    """
+
+    # States of the jobs that had not finished when the process stopped
+    UNFINISHED_STATES = ('queued', 'in_progress', 'uploading', 'cancelling')
+
+    def __init__(self, path, logger=None):
+        """
+        Args:
+            path: Database file (keep it out of the folders served over HTTP, it holds the cookies)
+        """
+        self.logger = logger or logging.getLogger('job_store')
+        self.path = path
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+        # Secure the file permissions (UNIX only)
+        try:
+            os.chmod(path, 0o600)
+        except OSError:
+            pass
+
+    def _connect(self):
+        # One short-lived connection per call, so any thread may use the store
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add(self, job, status):
+        """
+        Record a submitted job
+
+        Args:
+            job: DownloadJob
+            status: Initial status dict of the download
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(id, url, site, priority, params, state, status, restarts, submitted_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (job.id, job.url, job.site, job.priority, json.dumps(job.params, ensure_ascii=False),
+                 status.get('status', 'queued'), json.dumps(status, ensure_ascii=False), job.submitted_at, now)
+            )
+
+    def update(self, job_id, status):
+        """Replace the status dict of a job"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, status = ?, updated_at = ? WHERE id = ?",
+                (status.get('status', ''), json.dumps(status, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def statuses(self):
+        """
+        Status dicts of every recorded job
+
+        Returns:
+            Dict of job id -> status dict, oldest job first
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, status FROM jobs ORDER BY submitted_at").fetchall()
+        return {job_id: json.loads(status) for job_id, status in rows}
+
+    def unfinished(self):
+        """
+        Jobs that were queued or running when the process stopped
+
+        Returns:
+            List of dicts with 'id', 'url', 'site', 'priority', 'params', 'state',
+            'restarts' and 'submitted_at', in submission order
+        """
+        placeholders = ', '.join('?' * len(self.UNFINISHED_STATES))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, url, site, priority, params, state, restarts, submitted_at FROM jobs "
+                f"WHERE state IN ({placeholders}) ORDER BY submitted_at", self.UNFINISHED_STATES
+            ).fetchall()
+        return [{'id': job_id, 'url': url, 'site': site, 'priority': priority, 'params': json.loads(params),
+                 'state': state, 'restarts': restarts, 'submitted_at': submitted_at}
+                for job_id, url, site, priority, params, state, restarts, submitted_at in rows]
+
+    def restarted(self, job_id):
+        """Count one more restart of an interrupted job"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET restarts = restarts + 1 WHERE id = ?", (job_id,))
+
+    def prune(self, max_age):
+        """
+        Forget the finished jobs not updated for max_age seconds
+
+        Returns:
+            Number of jobs removed
+        """
+        placeholders = ', '.join('?' * len(self.UNFINISHED_STATES))
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                f"DELETE FROM jobs WHERE state NOT IN ({placeholders}) AND updated_at < ?",
+                self.UNFINISHED_STATES + (time.time() - max_age,)
+            )
+            return cursor.rowcount
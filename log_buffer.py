@@ -0,0 +1,120 @@
+import os
+import logging
+import threading
+from collections import deque, OrderedDict
+
+class DownloadLogHandler(logging.Handler):
+    """
+    Logging handler keeping the recent log lines of every download in memory
+
+    Each download gets its own bounded ring buffer, filled from the records
+    logged with a `download_id` attribute (passed as `extra`), so a busy
+    download cannot push the lines of another one out and reading the lines
+    of one download does not scan the others. An optional global tail keeps
+    the last lines of every logger call. Lines are numbered with one global
+    sequence, so clients can ask for the lines after the last one they saw,
+    and are told when some of those were already pushed out of the buffer.
+    """
+
+    def __init__(self, capacity=None, per_download=None, max_downloads=None):
+        """
+        Args:
+            capacity: Lines of the global tail, 0 disables it (default: LOG_TAIL_LINES or 100)
+            per_download: Lines kept per download (default: LOG_BUFFER_LINES or 500)
+            max_downloads: Downloads whose lines are kept, the least recently logging
+                           ones are dropped first (default: LOG_BUFFER_DOWNLOADS or 100)
+        """
+        super().__init__()
+        self.capacity = capacity if capacity is not None else int(os.getenv('LOG_TAIL_LINES', 100))
+        self.per_download = per_download if per_download is not None else int(os.getenv('LOG_BUFFER_LINES', 500))
+        self.max_downloads = max_downloads if max_downloads is not None else int(os.getenv('LOG_BUFFER_DOWNLOADS', 100))
+
+        self.tail = deque(maxlen=self.capacity) if self.capacity > 0 else None
+        self.downloads = OrderedDict()  # download id -> deque of (seq, line)
+        self.evicted = {}               # buffer id (None for the tail) -> seq of the newest line pushed out
+        self.seq = 0
+        self._buffers_lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        download_id = getattr(record, 'download_id', None)
+        with self._buffers_lock:
+            self.seq += 1
+            entry = (self.seq, line)
+            if self.tail is not None:
+                self._append(None, self.tail, entry)
+            if download_id:
+                buffer = self.downloads.get(download_id)
+                if buffer is None:
+                    buffer = self.downloads[download_id] = deque(maxlen=self.per_download)
+                    while len(self.downloads) > self.max_downloads:
+                        dropped_id, _ = self.downloads.popitem(last=False)
+                        self.evicted.pop(dropped_id, None)
+                else:
+                    self.downloads.move_to_end(download_id)
+                self._append(download_id, buffer, entry)
+
+    def _append(self, buffer_id, buffer, entry):
+        if len(buffer) == buffer.maxlen:
+            self.evicted[buffer_id] = buffer[0][0]
+        buffer.append(entry)
+
+    def _read(self, buffer_id, buffer, since=None, n=None):
+        """
+        Lines of a buffer after sequence number `since`, at most the last n of them
+
+        Returns:
+            (lines, truncated) where truncated tells that lines after `since` are missing,
+            pushed out of the buffer or left out by n
+        """
+        lines = []
+        truncated = False
+        for seq, line in reversed(buffer):
+            if since is not None and seq <= since:
+                break
+            if n is not None and len(lines) >= n:
+                truncated = since is not None
+                break
+            lines.append(line)
+        else:
+            truncated = since is not None and self.evicted.get(buffer_id, 0) > since
+        lines.reverse()
+        return lines, truncated
+
+    def get_logs(self, n=None, since=None):
+        """
+        Lines of the global tail
+
+        Args:
+            n: Return at most the last n lines
+            since: Only return the lines after this sequence number
+
+        Returns:
+            (lines, seq, truncated) where seq is the sequence number to pass as `since`
+            next time, and truncated tells that some lines after `since` are not returned
+            (the buffer no longer holds them or n left them out)
+        """
+        with self._buffers_lock:
+            if self.tail is None:
+                return [], self.seq, False
+            lines, truncated = self._read(None, self.tail, since, n)
+            return lines, self.seq, truncated
+
+    def get_download_logs(self, download_id, n=None, since=None):
+        """
+        Lines logged for one download (see get_logs for the arguments)
+
+        Returns:
+            (lines, seq, truncated), see get_logs
+        """
+        with self._buffers_lock:
+            buffer = self.downloads.get(download_id)
+            if buffer is None:
+                return [], self.seq, False
+            lines, truncated = self._read(download_id, buffer, since, n)
+            return lines, self.seq, truncated
@@ -3,11 +3,11 @@ import os
 import time
 import json
 import threading
-import eventlet.queue as queue
+import multiprocessing
 import hashlib
 import datetime
 from flask import Flask, request, jsonify, render_template
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 from flask_cors import CORS
 import logging
 from dotenv import load_dotenv
@@ -22,7 +22,10 @@ from novel_downloader import NovelDownloader
 from dropbox_storage import DropboxStorage
 from keep_alive import KeepAlive
 from dropbox_auth import DropboxAuth
-from worker_singleton import WorkerThreadSingleton
+from job_scheduler import DownloadJob, JobScheduler
+from job_store import JobStore
+from log_buffer import DownloadLogHandler
+from progress_channel import ProgressChannel
 
 # Tạo secret key duy nhất cho mỗi phiên Replit
 if not os.environ.get('SECURE_PATH_KEY'):
@@ -72,26 +75,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger('novel_downloader_api')
 
-# Create a custom logger handler that will store recent logs
-class RecentLogsHandler(logging.Handler):
-    def __init__(self, capacity=100):
-        super().__init__()
-        self.capacity = capacity
-        self.logs = []
-
-    def emit(self, record):
-        log_entry = self.format(record)
-        self.logs.append(log_entry)
-        if len(self.logs) > self.capacity:
-            self.logs.pop(0)
-
-    def get_logs(self, n=None):
-        if n is None:
-            return self.logs
-        return self.logs[-n:]
-
-# Create our recent logs handler
-recent_logs_handler = RecentLogsHandler()
+# Keep the recent logs in memory, per download and as a global tail
+recent_logs_handler = DownloadLogHandler()
 recent_logs_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 logger.addHandler(recent_logs_handler)
 
@@ -101,151 +86,218 @@ CORS(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'novel-downloader-secret')
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
-# Queue for download tasks
-download_queue = queue.Queue()
+# Job store, scheduler and download statuses are set up by init_jobs() when the server starts
+job_store = None
+scheduler = None
+_jobs_lock = threading.Lock()
 
-# Dictionary to store active downloads
+# Dictionary to store active downloads, filled with the jobs of earlier runs by init_jobs()
+# (updated from scheduler workers, progress callbacks and upload threads, guarded by the lock)
 active_downloads = {}
+_downloads_lock = threading.Lock()
+
+def update_download(download_id, **fields):
+    """Update the status of a download and persist it in the job store"""
+    store = get_job_store()
+    with _downloads_lock:
+        status = active_downloads.setdefault(download_id, {})
+        status.update(fields)
+        store.update(download_id, status)
+        return dict(status)
+
+def download_status(download_id):
+    """Copy of the status of a download, None if it is unknown"""
+    with _downloads_lock:
+        status = active_downloads.get(download_id)
+        return dict(status) if status is not None else None
+
+# Download logs, progress and events go out in batched frames to the room of each download
+progress_channel = ProgressChannel(socketio, logger=logger)
 
 # Initialize Dropbox storage
 dropbox_auth = DropboxAuth(logger=logger, socket=socketio)
-dropbox_storage = DropboxStorage(logger=logger, socket=socketio, dropbox_auth=dropbox_auth)
+dropbox_storage = DropboxStorage(logger=logger, socket=socketio, dropbox_auth=dropbox_auth, progress=progress_channel)
 
 # Initialize the novel downloader with the specified parameters
 downloader = NovelDownloader(
     logger=logger,
     socket=socketio,
-    dropbox=dropbox_storage
+    dropbox=dropbox_storage,
+    progress=progress_channel
 )
 
 # Initialize dropbox auth with the app
 dropbox_auth.init_app(app)
 
-# Background worker to process download tasks
-def download_worker():
-    logger.info("Worker thread started")
-    while True:
-        try:
-            # Get a task from the queue
-            logger.info("Worker thread waiting for task... (current thread ID: %s)", threading.get_ident())
-
-            try:
-                task = download_queue.get(block=True, timeout=10)  # Chờ 5 giây
-                download_id = task['id']
-                url = task['url']
-                cookie = task.get('cookie', '')
-                logger.info(f"Worker thread got task: {download_id}")
-
-                download_novel(download_id=download_id, url=url, cookie=cookie)
-
-                # Mark task as done
-                download_queue.task_done()
-            except queue.Empty:
-                # Log nếu không có task trong 5 giây
-                logger.info("No task in queue for 5 seconds")
-                
-                # Kiểm tra trạng thái queue
-                logger.info(f"Current queue size: {download_queue.qsize()}")
-                
-                # Ngủ ngắn để tránh CPU spinning
-                time.sleep(1)
-                
-                continue
-
-        except Exception as e:
-            logger.error(f"Error in download worker: {str(e)}")
-            time.sleep(1)  # Prevent CPU spinning if there's a persistent error
-
-def download_novel(download_id, url, cookie):
+def run_download_job(job):
+    """Run a scheduled download job on a scheduler worker"""
+    download_novel(download_id=job.id, url=job.url, cookie=job.params.get('cookie', ''),
+                   engine=job.params.get('engine', 'threaded'), cancel_event=job.cancel_event)
+
+def download_novel(download_id, url, cookie, engine='threaded', cancel_event=None):
     # Update status
-    active_downloads[download_id] = {
-        'status': 'in_progress',
-        'url': url,
-        'start_time': time.time(),
-        'progress': 0
-    }
+    update_download(download_id, status='in_progress', url=url, engine=engine, start_time=time.time(), progress=None)
 
     # Emit status update
-    socketio.emit('status_update', {
+    progress_channel.event(download_id, 'status_update', {
         'download_id': download_id,
         'status': 'in_progress',
         'message': f"Starting download for {url}"
     })
 
     # Run the download
-    logger.info(f"Starting download for URL: {url} with ID: {download_id}")
-    result = downloader.download_novel(url, cookie=cookie, download_id=download_id)
+    logger.info(f"Starting download for URL: {url} with ID: {download_id}", extra={'download_id': download_id})
 
-    if result['success']:
-        # Update status on success
-        active_downloads[download_id]['status'] = 'completed'
-        active_downloads[download_id]['file_path'] = result['file_path']
-        active_downloads[download_id]['dropbox_url'] = result.get('dropbox_url', '')
-        active_downloads[download_id]['end_time'] = time.time()
-
-        # Emit completion event
-        socketio.emit('download_completed', {
-            'download_id': download_id,
-            'url': url,
-            'file_path': result['file_path'],
-            'dropbox_url': result.get('dropbox_url', '')
-        })
+    download_returned = threading.Event()
+
+    def on_uploaded(dropbox_url):
+        # Runs on an upload worker once the background EPUB upload is done
+        download_returned.wait()
+        complete_download(download_id, url, result['file_path'], dropbox_url)
 
-        logger.info(f"Download completed for ID: {download_id}")
+    try:
+        result = downloader.download_novel(url, cookie=cookie, download_id=download_id, engine=engine,
+                                           on_uploaded=on_uploaded, cancel_event=cancel_event,
+                                           on_progress=lambda progress: update_download(download_id, progress=progress))
+
+        if result['success'] and result.get('upload_pending'):
+            # The EPUB is ready, the Dropbox upload finishes in the background
+            update_download(download_id, status='uploading', file_path=result['file_path'])
+            progress_channel.event(download_id, 'status_update', {
+                'download_id': download_id,
+                'status': 'uploading',
+                'message': "Uploading EPUB to Dropbox"
+            })
+            logger.info(f"Download finished for ID: {download_id}, upload running in background", extra={'download_id': download_id})
+    finally:
+        download_returned.set()
+
+    if result['success']:
+        if not result.get('upload_pending'):
+            complete_download(download_id, url, result['file_path'], result.get('dropbox_url'))
+    elif result.get('cancelled'):
+        cancel_download(download_id, result['error'])
     else:
-        # Update status on failure
-        active_downloads[download_id]['status'] = 'failed'
-        active_downloads[download_id]['error'] = result['error']
-        active_downloads[download_id]['end_time'] = time.time()
+        fail_download(download_id, url, result['error'])
 
-        # Emit failure event
-        socketio.emit('download_failed', {
-            'download_id': download_id,
-            'url': url,
-            'error': result['error']
-        })
+def complete_download(download_id, url, file_path, dropbox_url):
+    """Mark a download as completed and emit the completion event"""
+    update_download(download_id, status='completed', file_path=file_path, dropbox_url=dropbox_url or '',
+                    end_time=time.time())
+
+    # Emit completion event
+    progress_channel.event(download_id, 'download_completed', {
+        'download_id': download_id,
+        'url': url,
+        'file_path': file_path,
+        'dropbox_url': dropbox_url or ''
+    })
 
-        logger.error(f"Download failed for ID: {download_id}: {result['error']}")
+    logger.info(f"Download completed for ID: {download_id}", extra={'download_id': download_id})
 
-# Start the download worker thread
-# worker_thread = threading.Thread(target=download_worker, daemon=True)
-# worker_thread.start()
+def fail_download(download_id, url, error):
+    """Mark a download as failed and emit the failure event"""
+    update_download(download_id, status='failed', error=error, end_time=time.time())
 
-# worker_thread = WorkerThreadSingleton.get_instance(download_worker, logger)
+    progress_channel.event(download_id, 'download_failed', {
+        'download_id': download_id,
+        'url': url,
+        'error': error
+    })
+
+    logger.error(f"Download failed for ID: {download_id}: {error}", extra={'download_id': download_id})
+
+def cancel_download(download_id, message="Download cancelled"):
+    """Mark a download as cancelled and emit the status update"""
+    update_download(download_id, status='cancelled', end_time=time.time())
+
+    progress_channel.event(download_id, 'status_update', {
+        'download_id': download_id,
+        'status': 'cancelled',
+        'message': message
+    })
+
+    logger.info(f"Download cancelled for ID: {download_id}", extra={'download_id': download_id})
+
+def init_jobs():
+    """
+    Open the job store, create the download scheduler and resume the jobs interrupted by the last shutdown
 
-def monitor_worker_thread():
-    global worker_thread
-    while True:
-        if not worker_thread.is_alive():
-            logger.error("Worker thread is dead! Restarting it...")
-            worker_thread = threading.Thread(target=download_worker, daemon=True)
-            worker_thread.start()
-            logger.info("Worker thread restarted")
-        time.sleep(60)  # Check every minute
+    Called by the server start-up (python main.py and wsgi.create_app), or on first use
+    through ensure_jobs() when the WSGI server loads main:application directly; never on
+    import: parser worker processes and anything else importing this module must not run
+    the persisted jobs again. Later calls, and calls from child processes, do nothing.
 
-# Start the monitor thread
-# monitor_thread = threading.Thread(target=monitor_worker_thread, daemon=True)
-# monitor_thread.start()
+    Returns:
+        True if the jobs were set up by this call
+    """
+    global job_store, scheduler
+    if multiprocessing.parent_process() is not None:
+        return False
+
+    with _jobs_lock:
+        if scheduler is not None:
+            return False
+
+        # Durable record of the download jobs, in the fixed secure folder like the Dropbox tokens
+        # (SECURE_DIR changes on every boot unless SECURE_PATH_KEY is set)
+        job_store = JobStore(os.getenv('JOB_DB_PATH') or os.path.join(os.getcwd(), 'secure', 'jobs.db'), logger=logger)
+        pruned_jobs = job_store.prune(float(os.getenv('JOB_HISTORY_DAYS', 7)) * 86400)
+        if pruned_jobs:
+            logger.info(f"Removed {pruned_jobs} finished jobs from the job store")
+        with _downloads_lock:
+            active_downloads.update(job_store.statuses())
+
+        # Download jobs run on the scheduler workers, /api/download only queues them
+        scheduler = JobScheduler(run_download_job, logger=logger)
+        resume_interrupted_jobs()
+        return True
+
+def ensure_jobs():
+    """Set up the jobs on first use if the server start-up did not (e.g. gunicorn main:application)"""
+    if scheduler is None:
+        init_jobs()
+
+def get_job_store():
+    ensure_jobs()
+    return job_store
+
+def get_scheduler():
+    ensure_jobs()
+    return scheduler
+
+def resume_interrupted_jobs():
+    """Submit the jobs interrupted by the last shutdown again, they resume from their checkpoints"""
+    max_restarts = int(os.getenv('JOB_MAX_RESTARTS', 3))
+    for row in job_store.unfinished():
+        download_id = row['id']
+        if row['state'] == 'cancelling':
+            cancel_download(download_id, "Download cancelled before the restart")
+            continue
+        if row['restarts'] >= max_restarts:
+            # The job may be what brings the process down, don't run it forever
+            fail_download(download_id, row['url'], f"Interrupted by {row['restarts'] + 1} restarts, giving up")
+            continue
+
+        job_store.restarted(download_id)
+        update_download(download_id, status='queued', restarts=row['restarts'] + 1)
+        job = DownloadJob(download_id, row['url'], site=row['site'], priority=row['priority'], params=row['params'])
+        scheduler.submit(job)
+        logger.info(f"Resuming interrupted download {download_id} ({row['state']} before the restart)", extra={'download_id': download_id})
 
-# Replace the existing worker thread initialization with this:
 def start_worker_thread():
-    global worker_thread
+    """Start the scheduler workers (they are also started by the first download)"""
     try:
-        # Chấm dứt thread cũ nếu còn tồn tại
-        if 'worker_thread' in globals() and worker_thread is not None:
-            logger.info("Terminating old worker thread if it exists")
-        
-        # Tạo và khởi động thread mới
-        logger.info("Starting download worker thread")
-        worker_thread = threading.Thread(target=download_worker, daemon=True)
-        worker_thread.start()
-        logger.info(f"Worker thread started, is_alive: {worker_thread.is_alive()}")
+        download_scheduler = get_scheduler()
+        download_scheduler.start()
+        logger.info(f"Download scheduler started with {download_scheduler.workers} workers")
         return True
     except Exception as e:
-        logger.error(f"Error starting worker thread: {str(e)}")
+        logger.error(f"Error starting download scheduler: {str(e)}")
         return False
-    
-# start_worker_thread()
+
+# The first request resumes the interrupted jobs when the WSGI server loaded main:application
+app.before_request(ensure_jobs)
 
 # Web Routes
 @app.route('/')
@@ -270,34 +322,16 @@ def ping():
 
 @app.route('/thread/status')
 def thread_status():
-    global worker_thread
-
-    # Kiểm tra worker_thread có tồn tại không
-    if 'worker_thread' not in globals():
-        return "Worker thread is not initialized"
-    
-    # Kiểm tra worker_thread có phải None không
-    if worker_thread is None:
-        return "Worker thread is None"
-    
-    # Thread đang hoạt động bình thường
-    return f"Worker thread is alive: {worker_thread.is_alive()}"
+    state = get_scheduler().snapshot()
+    return (f"Download workers alive: {state['alive_workers']}/{state['workers']}, "
+            f"running: {len(state['running'])}, waiting: {len(state['waiting'])}")
 
 @app.route('/thread/start')
 def ensure_worker_thread():
-    global worker_thread
-    
-    # Kiểm tra và khởi tạo lại thread nếu không hoạt động
-    if worker_thread is None or not worker_thread.is_alive():
-        try:
-            worker_thread = threading.Thread(target=download_worker, daemon=True)
-            worker_thread.start()
-            logger.info("Ensured worker thread is running")
-            return "Đang khởi động lại worker"
-        except Exception as e:
-            logger.error(f"Failed to ensure worker thread: {e}")
-            return f"Failed to ensure worker thread: {e}"
-        
+    if start_worker_thread():
+        return "Download workers are running"
+    return "Failed to start download workers"
+
 # New route for Dropbox status page
 @app.route('/dropbox/status')
 def dropbox_status_page():
@@ -338,44 +372,48 @@ def start_download():
 
         url = data['url']
         cookie = data.get('cookie', '')
+        engine = data.get('engine', 'threaded')
 
-        # Generate a unique ID for this download
-        download_id = f"download_{int(time.time())}"
-
-        # Create a new download task and add it to the queue
-        task = {
-            'id': download_id,
-            'url': url,
-            'cookie': cookie
-        }
+        if engine not in ('threaded', 'async'):
+            return jsonify({'success': False, 'error': "engine must be 'threaded' or 'async'"}), 400
 
-        # Kiểm tra trạng thái của queue trước khi put
-        logger.info(f"Current thread: {threading.current_thread().name}")
-        logger.info(f"Queue before put - size: {download_queue.qsize()}")
+        try:
+            priority = int(data.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'priority must be an integer'}), 400
 
-        # Đảm bảo task được đưa vào queue
         try:
-            # download_queue.put(task, block=False)
-            download_novel(download_id, url, cookie)
-            logger.info(f"Task added to queue successfully")
-        except queue.Full:
-            logger.error("Queue is full. Could not add task.")
-            return jsonify({'success': False, 'error': 'Download queue is full'}), 500
-        
-        logger.info(f"Queue after put - size: {download_queue.qsize()}")
+            site = downloader._detect_site_type(url)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # Generate a unique ID for this download (several downloads may start in the same second)
+        download_id = f"download_{int(time.time())}_{secrets.token_hex(3)}"
 
-        # Initialize download status
-        active_downloads[download_id] = {
+        # Record the job and its status before it can start
+        job = DownloadJob(download_id, url, site=site, priority=priority,
+                          params={'cookie': cookie, 'engine': engine})
+        status = {
             'status': 'queued',
             'url': url,
-            'submit_time': time.time()
+            'engine': engine,
+            'priority': priority,
+            'submit_time': job.submitted_at
         }
+        store = get_job_store()
+        with _downloads_lock:
+            active_downloads[download_id] = status
+            store.add(job, status)
+
+        # Hand the job to the scheduler, it runs as soon as a worker and a slot of its site are free
+        position = get_scheduler().submit(job)
 
         # Log and return the download ID
-        logger.info(f"New download queued for URL: {url} with ID: {download_id}")
+        logger.info(f"New download queued for URL: {url} with ID: {download_id} (position {position})", extra={'download_id': download_id})
         return jsonify({
             'success': True,
             'download_id': download_id,
+            'position': position,
             'message': 'Download has been queued'
         })
 
@@ -383,29 +421,79 @@ def start_download():
         logger.error(f"Error starting download: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/cancel/<download_id>', methods=['POST'])
+def cancel_download_request(download_id):
+    try:
+        if download_id not in active_downloads:
+            return jsonify({'success': False, 'error': 'Download ID not found'}), 404
+
+        job, state = get_scheduler().cancel(download_id)
+        if state == 'waiting':
+            cancel_download(download_id, "Download removed from the queue")
+        elif state == 'running':
+            # The download stops at its next chapter and keeps what it has fetched
+            update_download(download_id, status='cancelling')
+            progress_channel.event(download_id, 'status_update', {
+                'download_id': download_id,
+                'status': 'cancelling',
+                'message': "Stopping download"
+            })
+            logger.info(f"Cancelling running download with ID: {download_id}", extra={'download_id': download_id})
+        else:
+            return jsonify({'success': False, 'error': 'Download is not queued or running'}), 409
+
+        return jsonify({
+            'success': True,
+            'download_id': download_id,
+            'status': active_downloads[download_id]['status']
+        })
+
+    except Exception as e:
+        logger.error(f"Error cancelling download: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/queue', methods=['GET'])
+def get_queue():
+    try:
+        return jsonify({
+            'success': True,
+            'queue': get_scheduler().snapshot()
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting queue: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/status/<download_id>', methods=['GET'])
 def get_download_status(download_id):
     try:
-        # Check if the download ID exists
-        if download_id not in active_downloads:
+        # Get the download status, if the download ID exists
+        status = download_status(download_id)
+        if status is None:
             return jsonify({'success': False, 'error': 'Download ID not found'}), 404
 
-        # Get the download status
-        status = active_downloads[download_id]
+        if status['status'] == 'queued':
+            status['position'] = get_scheduler().position(download_id)
+        # Live progress of a running download, the stored one is only updated between stages
+        live_progress = downloader.get_progress(download_id)
+        if live_progress:
+            status['progress'] = live_progress
 
-        # Get the number of log entries to return
-        n_logs = request.args.get('logs', 20, type=int)
+        # Get the number of log entries to return (all new ones when polling with since)
+        since = request.args.get('since', type=int)
+        n_logs = request.args.get('logs', None if since is not None else 20, type=int)
 
-        # Filter logs for this download
-        download_logs = [log for log in recent_logs_handler.get_logs() 
-                        if download_id in log][-n_logs:]
+        # Logs of this download only, after the last line the client has seen
+        download_logs, log_seq, log_truncated = recent_logs_handler.get_download_logs(download_id, n_logs, since)
 
         # Return the status and logs
         return jsonify({
             'success': True,
             'download_id': download_id,
             'status': status,
-            'logs': download_logs
+            'logs': download_logs,
+            'log_seq': log_seq,
+            'log_truncated': log_truncated
         })
 
     except Exception as e:
@@ -447,15 +535,18 @@ def list_downloads():
 @app.route('/api/logs', methods=['GET'])
 def get_recent_logs():
     try:
-        # Get the number of log entries to return
-        n_logs = request.args.get('n', 100, type=int)
+        # Get the number of log entries to return (all new ones when polling with since)
+        since = request.args.get('since', type=int)
+        n_logs = request.args.get('n', None if since is not None else 100, type=int)
 
         # Get recent logs
-        logs = recent_logs_handler.get_logs(n_logs)
+        logs, log_seq, log_truncated = recent_logs_handler.get_logs(n_logs, since)
 
         return jsonify({
             'success': True,
-            'logs': logs
+            'logs': logs,
+            'log_seq': log_seq,
+            'log_truncated': log_truncated
         })
 
     except Exception as e:
@@ -465,17 +556,42 @@ def get_recent_logs():
 # WebSocket events
 @socketio.on('connect')
 def handle_connect():
+    ensure_jobs()
     logger.info(f"Client connected: {request.sid}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     logger.info(f"Client disconnected: {request.sid}")
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Receive the frames and events of a download, starting with its current status"""
+    download_id = (data or {}).get('download_id')
+    if not download_id:
+        return
+    join_room(ProgressChannel.room(download_id))
+    if download_id in active_downloads:
+        status = active_downloads[download_id]
+        socketio.emit('status_update', {
+            'download_id': download_id,
+            'status': status.get('status'),
+            'message': 'Subscribed'
+        }, to=request.sid)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    download_id = (data or {}).get('download_id')
+    if download_id:
+        leave_room(ProgressChannel.room(download_id))
+
 # Run the application
 if __name__ == '__main__':
     # Determine port from environment variable or use default
     port = int(os.environ.get('PORT', 10000))
 
+    # Open the job store and resume the downloads interrupted by the last shutdown
+    init_jobs()
+
     # Print server information
     logger.info(f"Starting Novel Downloader API on port {port}")
     logger.info(f"API documentation available at /")
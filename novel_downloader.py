@@ -7,19 +7,48 @@ import traceback
 import json
 import threading
 import queue
+import copy
+import shutil
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from bs4 import BeautifulSoup
 from ebooklib import epub
 from tqdm.auto import tqdm
 import uuid
+import hashlib
+import datetime
 import logging
 from urllib.parse import urlparse, unquote
+from http_session import HttpSessionPool
+from async_engine import AsyncCrawlEngine
+from response_cache import ResponseCache
+from parser_backend import get_parser
+from chapter_document import ChapterDocument, ChapterHtml
+from chapter_store import ChapterStore
+from resume_manifest import ResumeManifest
+from upload_queue import UploadQueue
+from progress_channel import ProgressChannel
+from download_progress import DownloadProgress
+from epub_writer import StreamingEpubWriter
+from chapter_parser import (PLACEHOLDER_CONTENT, extract_chapter_title, parse_mtc_chapter,
+                            parse_ttv_chapter, parse_chapter_record)
+from rate_limiter import SiteRateLimiter, THROTTLE_STATUS_CODES, parse_retry_after, backoff_delay
 
 class NovelDownloader:
-    def __init__(self, logger=None, socket=None, dropbox=None):
+    def __init__(self, logger=None, socket=None, dropbox=None, http_pool=None, response_cache=None, upload_queue=None,
+                 progress=None):
         self.logger = logger or logging.getLogger('novel_downloader')
         self.socket = socket
+        # Log lines and progress reach the clients in batched frames
+        self.progress = progress or (ProgressChannel(socket, logger=self.logger) if socket else None)
+        # Progress of the running downloads (and of the ones still uploading), by download ID
+        self._trackers = {}
         self.dropbox = dropbox
 
+        # Pooled keep-alive sessions shared by every fetch path
+        self.http = http_pool or HttpSessionPool(logger=self.logger)
+
         # Xác định thư mục gốc
         self.project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         if not os.path.exists(self.project_root):
@@ -34,10 +63,36 @@ class NovelDownloader:
         self.output_folder = os.path.join(self.project_root, 'novel_output')
         os.makedirs(self.output_folder, exist_ok=True)
 
+        # Persistent cache of fetched pages, so re-runs rebuild from disk instead of re-crawling
+        cache_dir = os.getenv('HTTP_CACHE_DIR') or os.path.join(self.temp_folder, 'http_cache')
+        self.cache = response_cache or ResponseCache(cache_dir, logger=self.logger)
+
         # Set up queues for background processing
         self.save_queue = queue.Queue()
         self.exit_event = threading.Event()
         self.checkpoint_interval = 50
+        # Chapter stores whose checkpointed chapters are still only in Dropbox (local path -> Dropbox path)
+        self._remote_stores = {}
+        self._merge_lock = threading.Lock()
+        # Background Dropbox uploads, downloads never wait for them
+        self.uploads = upload_queue or UploadQueue(dropbox, logger=self.logger)
+
+        # Number of chapters fetched in parallel for each site
+        self.fetch_workers = {
+            'metruyenchu': int(os.getenv('MTC_FETCH_WORKERS', 3)),
+            'tangthuvien': int(os.getenv('TTV_FETCH_WORKERS', 3))
+        }
+        # Extra attempts for a chapter whose fetch failed
+        self.chapter_retries = int(os.getenv('CHAPTER_RETRIES', 2))
+        # Attempts per HTTP request (with adaptive backoff between them)
+        self.request_retries = int(os.getenv('REQUEST_RETRIES', 5))
+        # Parser backend for full pages (lxml when installed, html.parser as fallback)
+        self.html_parser = get_parser()
+        # Worker processes parsing chapter pages off the fetching threads (default 0 = parse on the fetching threads).
+        # Opt-in: spawned workers import the entry script again, so its boot must sit under `if __name__ == '__main__'`
+        self.parse_processes = int(os.getenv('PARSE_PROCESSES', 0))
+        self.parse_pool = None
+        self._parse_pool_lock = threading.Lock()
 
         # Start checkpoint saver thread
         self.saver_thread = threading.Thread(target=self._checkpoint_saver_thread, daemon=True)
@@ -69,21 +124,15 @@ class NovelDownloader:
             message = f"[{download_id}] {message}"
 
         if level == 'info':
-            self.logger.info(message)
+            self.logger.info(message, extra={'download_id': download_id})
         elif level == 'error':
-            self.logger.error(message)
+            self.logger.error(message, extra={'download_id': download_id})
         elif level == 'warning':
-            self.logger.warning(message)
-
-        # Emit via socket if available
-        if self.socket and download_id:
-            self.socket.emit('log_update', {
-                'download_id': download_id,
-                'level': level,
-                'message': message,
-                'timestamp': time.time(),
-                'source': 'novel_downloader'
-            })
+            self.logger.warning(message, extra={'download_id': download_id})
+
+        # Send via socket if available, with the next progress frame of the download
+        if self.progress and download_id:
+            self.progress.log(download_id, level, message, 'novel_downloader')
 
     def _checkpoint_saver_thread(self):
         """Background thread for saving checkpoints"""
@@ -92,29 +141,21 @@ class NovelDownloader:
                 # Try to get a save task from the queue with timeout
                 save_task = self.save_queue.get(timeout=1.0)
                 if save_task:
-                    book, intro, chapters, output_path, download_id = save_task
+                    store, manifest, records, chapter_count, download_id, saved = save_task
                     try:
-                        # First save to local temp file
-                        self._save_epub(book, intro, chapters, output_path, True, download_id)
-                        
-                        # If Dropbox is available, also save to Dropbox/Novel/Temp
+                        # Store only the chapters added since the last checkpoint
+                        store.put_chapters(records)
+                        manifest.add_chapters(records)
+                        manifest.save()
+
+                        # If Dropbox is available, also save to Dropbox/Novel/Temp in the background
                         if self.dropbox and self.dropbox.is_active:
-                            filename = os.path.basename(output_path)
-                            dropbox_temp_path = f"/Novel/Temp/{filename}"
-                            
-                            # Ensure the Temp folder exists
-                            self.dropbox.create_folder("/Novel/Temp")
-                            
-                            # Upload the checkpoint to Dropbox
-                            dropbox_url = self.dropbox.upload_file(output_path, dropbox_temp_path)
-                            if dropbox_url:
-                                self._log('info', f"Checkpoint also saved to Dropbox: {dropbox_url}", download_id)
-                            else:
-                                self._log('warning', "Failed to save checkpoint to Dropbox", download_id)
-                        
-                        self._log('info', f"Saved checkpoint after {len(chapters)} chapters", download_id)
+                            self._queue_store_upload(store, manifest, download_id)
+
+                        self._log('info', f"Saved checkpoint after {chapter_count} chapters", download_id)
                     except Exception as e:
                         self._log('error', f"Error saving checkpoint: {str(e)}", download_id)
+                    saved.set()
                     self.save_queue.task_done()
             except queue.Empty:
                 # No save task in queue, continue checking
@@ -123,6 +164,207 @@ class NovelDownloader:
                 self.logger.error(f"Error in checkpoint saver thread: {str(e)}")
                 traceback.print_exc()
 
+    def _queue_checkpoint(self, store, manifest, records, chapter_count, download_id=None):
+        """
+        Queue the records of the chapters not checkpointed yet for the saver thread
+
+        Returns:
+            Event set once this checkpoint (and every one queued before it) is saved
+        """
+        # The saver thread is shared by every running download, it only stops with the downloader
+        if not self.saver_thread.is_alive():
+            self.saver_thread = threading.Thread(target=self._checkpoint_saver_thread, daemon=True)
+            self.saver_thread.start()
+        saved = threading.Event()
+        self.save_queue.put((store, manifest, list(records), chapter_count, download_id, saved))
+        return saved
+
+    def _open_chapter_store(self, novel_info, safe_filename, url=None, download_id=None):
+        """
+        Open the chapter store of a novel and its resume manifest, kept in the temp folder
+
+        Without a local store only the manifest is fetched from Dropbox/Novel/Temp,
+        the chapters it lists are merged in from the Dropbox copy of the store when
+        they are needed (next checkpoint upload or EPUB export).
+
+        Returns:
+            Tuple (ChapterStore, ResumeManifest), the manifest lists every stored chapter
+        """
+        name = os.path.splitext(safe_filename)[0]
+        store_path = os.path.join(self.temp_folder, name + '.db')
+        manifest_path = os.path.join(self.temp_folder, name + '.manifest.json')
+        site_type = novel_info['site_type']
+        book_id = novel_info.get('book_id') or novel_info['title'].strip()
+
+        local_store = os.path.exists(store_path)
+        manifest = ResumeManifest.load(manifest_path, logger=self.logger)
+        remote_store = None
+
+        if not local_store and self.dropbox and self.dropbox.is_active:
+            store_filename = os.path.basename(store_path)
+            manifest_filename = os.path.basename(manifest_path)
+            try:
+                if self.dropbox.file_exists(f"/Novel/Temp/{store_filename}"):
+                    self._log('info', f"✅ Đã tìm thấy checkpoint hiện có trong Dropbox: /Novel/Temp/{store_filename}", download_id)
+                    remote_store = f"/Novel/Temp/{store_filename}"
+                    if self.dropbox.file_exists(f"/Novel/Temp/{manifest_filename}") and \
+                            self.dropbox.download_file(f"/Novel/Temp/{manifest_filename}", manifest_path):
+                        manifest = ResumeManifest.load(manifest_path, logger=self.logger)
+                    else:
+                        # Checkpoint made before manifests existed, fetch the whole store now
+                        manifest = None
+                        if self.dropbox.download_file(remote_store, store_path):
+                            local_store = True
+                        else:
+                            self._log('warning', f"❌ Tải checkpoint từ Dropbox thất bại", download_id)
+                        remote_store = None
+            except Exception as e:
+                self._log('warning', f"⚠️ Lỗi khi kiểm tra Dropbox để tìm checkpoint: {str(e)}", download_id)
+                remote_store = None
+
+        store = ChapterStore(store_path, site_type, book_id, logger=self.logger)
+
+        if manifest is None or not manifest.matches(site_type, book_id):
+            manifest = ResumeManifest(manifest_path, site_type, book_id, logger=self.logger)
+            remote_store = None
+        if url:
+            manifest.source_url = url
+
+        if remote_store and manifest.count():
+            self._remote_stores[store_path] = remote_store
+            self._log('info', f"📋 Đã đọc manifest từ Dropbox ({manifest.count()} chương), kho chương sẽ được tải khi cần", download_id)
+        elif local_store and manifest.count() != store.count():
+            # Manifest missing or behind the store (e.g. interrupted checkpoint), list the store again
+            manifest.reset()
+            manifest.add_chapters(store.chapter_entries())
+            manifest.save()
+        elif not local_store:
+            manifest.reset()
+
+        return store, manifest
+
+    def _merge_remote_store(self, store, download_id=None):
+        """
+        Merge the chapters only in the Dropbox copy of a store into the local store
+
+        Returns:
+            True when the local store holds every checkpointed chapter
+        """
+        with self._merge_lock:
+            return self._merge_remote_store_locked(store, download_id)
+
+    def _merge_remote_store_locked(self, store, download_id=None):
+        dropbox_path = self._remote_stores.get(store.path)
+        if not dropbox_path:
+            return True
+
+        download_path = store.path + '.remote'
+        self._log('info', f"⬇️ Đang tải kho chương từ Dropbox: {dropbox_path}", download_id)
+        try:
+            if not self.dropbox or not self.dropbox.download_file(dropbox_path, download_path):
+                self._log('warning', "❌ Tải kho chương từ Dropbox thất bại", download_id)
+                return False
+            copied = store.merge_from(download_path)
+        except Exception as e:
+            self._log('error', f"❌ Lỗi khi gộp kho chương từ Dropbox: {str(e)}", download_id)
+            return False
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+
+        self._remote_stores.pop(store.path, None)
+        self._log('info', f"📒 Đã gộp {copied} chương từ Dropbox vào kho chương", download_id)
+        return True
+
+    def _queue_store_upload(self, store, manifest, download_id=None):
+        """
+        Queue the upload of the chapter store and its manifest to Dropbox/Novel/Temp
+
+        The snapshot is taken when the upload starts, so a checkpoint still waiting
+        is simply replaced by the newer one. The manifest is copied before the store
+        is snapshotted and uploaded after it, so it never lists chapters the Dropbox
+        copy of the store does not have.
+        """
+        def prepare():
+            # Chapters only in the Dropbox copy are merged first, so the upload loses none
+            if not self._merge_remote_store(store, download_id):
+                self._log('warning', "Failed to save checkpoint to Dropbox", download_id)
+                return None
+
+            # Ensure the Temp folder exists
+            self.dropbox.create_folder("/Novel/Temp")
+
+            manifest_copy = manifest.path + '.upload'
+            shutil.copyfile(manifest.path, manifest_copy)
+            try:
+                snapshot_path = store.snapshot(store.path + '.upload')
+            except Exception:
+                # The queue only removes the staging files it was given
+                for path in (manifest_copy, store.path + '.upload'):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            return [
+                (snapshot_path, f"/Novel/Temp/{os.path.basename(store.path)}"),
+                (manifest_copy, f"/Novel/Temp/{os.path.basename(manifest.path)}")
+            ]
+
+        def on_done(urls):
+            if urls and all(urls):
+                self._log('info', f"Checkpoint also saved to Dropbox: {urls[0]}", download_id)
+            elif urls is not None:
+                self._log('warning', "Failed to save checkpoint to Dropbox", download_id)
+
+        if not os.path.exists(manifest.path):
+            manifest.save()
+        return self.uploads.submit(store.path, prepare=prepare, download_id=download_id,
+                                   on_done=on_done, delete_after=True)
+
+    def _queue_epub_upload(self, epub_path, safe_filename, download_id=None, on_uploaded=None, extra_files=()):
+        """
+        Queue the upload of a finished EPUB to Dropbox/Novel, the download does not wait for it
+
+        Args:
+            epub_path: Local EPUB, removed once uploaded
+            on_uploaded: Callable receiving the Dropbox link (None if the upload failed)
+            extra_files: Other local files of the novel to remove after a successful upload
+        """
+        def on_done(urls):
+            dropbox_url = urls[0] if urls else None
+            if dropbox_url:
+                self._log('info', f"☁️ EPUB đã được tải lên Dropbox: {dropbox_url}", download_id)
+
+                # Delete local files after successful upload
+                for path in (epub_path,) + tuple(extra_files):
+                    self._delete_local_file(path, download_id)
+            else:
+                self._log('warning', "⚠️ Không thể tạo URL tải xuống Dropbox", download_id)
+            if on_uploaded:
+                on_uploaded(dropbox_url)
+
+        self._log('info', "☁️ Đang tải EPUB lên Dropbox (chạy nền)...", download_id)
+        return self.uploads.submit(f"/Novel/{safe_filename}", files=[(epub_path, f"/Novel/{safe_filename}")],
+                                   download_id=download_id, on_done=on_done)
+
+    def _import_epub_chapters(self, store, manifest, chapters, download_id=None):
+        """Copy the chapters of an EPUB made before the chapter store existed into the store"""
+        records = []
+        for chapter in chapters:
+            if getattr(chapter, 'id', None) and not re.fullmatch(r'chapter_\d+', chapter.id):
+                continue  # Split parts are made again from their chapter
+            self._fix_chapter_item(chapter)
+            html = chapter.get_body_content().decode('utf-8').strip()
+            records.append({
+                'index': int(chapter.id.split('_')[1]),
+                'title': chapter.title,
+                'html': html,
+                'placeholder': self._is_placeholder_html(html)
+            })
+        store.put_chapters(records)
+        manifest.add_chapters(records)
+        manifest.save()
+        self._log('info', f"📒 Đã chuyển {len(records)} chương từ EPUB hiện có vào kho chương", download_id)
+
     def _generate_user_agent(self):
         """Generate a random user agent"""
         user_agents = [
@@ -175,8 +417,22 @@ class NovelDownloader:
         self._log('info', f"⏳ Delay {second:.2f}s...", download_id)
         time.sleep(second)
 
-    def _make_request(self, url, is_api=False, is_mtc=True, cookie='', download_id=None):
-        """Make an HTTP request with appropriate headers"""
+    def _log_connection_stats(self, download_id=None):
+        """Log how many requests reused a pooled connection, per host, and HTTP cache usage"""
+        for host, stats in self.http.get_stats().items():
+            self._log('info', f"🔌 {host}: {stats['requests']} request, {stats['connections']} kết nối, {stats['reused']} lần dùng lại kết nối", download_id)
+
+        cache_stats = self.cache.get_stats()
+        self._log('info', f"🗄️ HTTP cache: {cache_stats['hits']} hit, {cache_stats['misses']} miss, {cache_stats['revalidations']} xác thực lại (304), {cache_stats['entries']} mục ({cache_stats['bytes'] / (1024*1024):.2f} MB)", download_id)
+
+    def _throttle(self, url, download_id=None):
+        """Block until the site's token bucket allows another request"""
+        wait_time = SiteRateLimiter.get_bucket(url).acquire()
+        if wait_time >= 1:
+            self._log('info', f"⏳ Chờ giới hạn tốc độ {wait_time:.2f}s...", download_id)
+
+    def _build_headers(self, is_api=False, is_mtc=True, cookie=''):
+        """Build request headers for the given site and request type"""
         headers = {
             'user-agent': self._generate_user_agent(),
             'referer': 'https://metruyencv.com/' if is_mtc else 'https://tangthuvien.net/'
@@ -191,35 +447,130 @@ class NovelDownloader:
             headers['authorization'] = f'Bearer {cookie}'
             headers['accept'] = 'application/json, text/plain, */*'
 
-        # Try up to 3 times if there's an error
-        max_retries = 3
+        return headers
+
+    def _cache_variant(self, is_mtc=True, cookie=''):
+        """Cache variant for a request, pages fetched with an access token are cached separately"""
+        if is_mtc and cookie:
+            return hashlib.sha256(cookie.encode('utf-8')).hexdigest()[:16]
+        return ''
+
+    def _conditional_headers(self, entry):
+        """Build If-None-Match / If-Modified-Since headers from the validators of a cached entry"""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['if-none-match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['if-modified-since'] = entry['last_modified']
+        return headers
+
+    def _parse_cached(self, url, variant, unchanged, parse_function, *args):
+        """
+        Parse a cached page, reusing the stored result when the page has not changed
+
+        Args:
+            unchanged: True if the body came from a fresh cache entry or a 304 revalidation
+            parse_function: Parser called with *args when there is no stored result
+        """
+        if unchanged:
+            parsed = self.cache.get_parsed(url, variant)
+            if parsed is not None:
+                return parsed
+
+        parsed = parse_function(*args)
+        self.cache.set_parsed(url, parsed, variant)
+        return parsed
+
+    def _make_request(self, url, is_api=False, is_mtc=True, cookie='', download_id=None, cache_kind=None):
+        """Make an HTTP request with appropriate headers and return the response body"""
+        return self._fetch(url, is_api, is_mtc, cookie, download_id, cache_kind)[0]
+
+    def _fetch(self, url, is_api=False, is_mtc=True, cookie='', download_id=None, cache_kind=None):
+        """
+        Make an HTTP request with appropriate headers
+
+        The site's rate adapts to the server: 429/503 responses and dropped
+        connections halve it and are retried with exponential backoff (or after
+        the server's Retry-After), fast successful responses raise it again.
+
+        Args:
+            cache_kind: Resource type ('novel_info', 'chapter_list' or 'chapter') used to
+                        serve and store the response in the on-disk cache, None to bypass it.
+                        Expired entries are revalidated with If-None-Match / If-Modified-Since.
+
+        Returns:
+            Tuple of (body, unchanged), unchanged is True if the body was served from
+            the cache or the server answered 304 Not Modified
+        """
+        variant = self._cache_variant(is_mtc, cookie)
+        entry = None
+        if cache_kind:
+            entry, is_fresh = self.cache.lookup(url, variant)
+            if is_fresh:
+                return entry['body'], True
+
+        headers = self._build_headers(is_api, is_mtc, cookie)
+        headers.update(self._conditional_headers(entry))
+        bucket = SiteRateLimiter.get_bucket(url)
+
+        max_retries = self.request_retries
         last_exception = None
         
         for attempt in range(max_retries):
+            retry_after = None
             try:
+                # Wait for this site's shared request budget (replaces fixed sleeps)
+                self._throttle(url, download_id)
+
                 # Thêm timeout để tránh request bị treo vô hạn
                 print(f"Making request to {url} with headers: {headers}")
-                response = requests.get(url, headers=headers, timeout=30)
+                request_start = time.monotonic()
+                response = self.http.get(url, headers=headers, timeout=30)
+
+                if response.status_code in THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get('retry-after'))
+                    bucket.on_throttled(retry_after)
+                elif response.status_code == 304 and entry is not None:
+                    # Page unchanged since we cached it, keep the stored body
+                    bucket.on_success(time.monotonic() - request_start)
+                    self.cache.mark_revalidated(url, variant)
+                    return entry['body'], True
                 response.raise_for_status()
 
                 # Return JSON for API requests, text otherwise
                 if is_api and is_mtc:
-                    return response.json()
+                    result = response.json()
                 else:
-                    return response.text
+                    result = response.text
+
+                bucket.on_success(time.monotonic() - request_start)
+                self._count_bytes(download_id, len(response.content))
+                if cache_kind:
+                    self.cache.put(url, result, cache_kind, variant,
+                                   etag=response.headers.get('etag'),
+                                   last_modified=response.headers.get('last-modified'))
+                return result, False
                     
             except (requests.exceptions.RequestException, requests.exceptions.JSONDecodeError) as e:
                 # Xử lý lỗi cụ thể từ thư viện requests
                 last_exception = e
                 error_message = f"Lỗi khi tải trang {url}, lần thử {attempt+1}/{max_retries}: {str(e)}"
                 self._log('error', error_message, download_id)
-                
+
+                status_code = e.response.status_code if getattr(e, 'response', None) is not None else None
+                if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                    # Connection resets and timeouts usually mean the site is overloaded
+                    bucket.on_throttled()
+                elif status_code and 400 <= status_code < 500 and status_code not in THROTTLE_STATUS_CODES:
+                    # Client errors (404, 403...) won't succeed on retry
+                    break
+
                 if attempt < max_retries - 1:
-                    delay_time = random.uniform(1, 2)
+                    delay_time = retry_after if retry_after is not None else backoff_delay(attempt)
                     self._delay(delay_time, download_id)
         
         # Nếu đã thử hết số lần mà vẫn thất bại, ghi log và ném ngoại lệ
-        error_message = f"Thất bại sau {max_retries} lần thử: {str(last_exception)}"
+        error_message = f"Thất bại sau {attempt+1} lần thử: {str(last_exception)}"
         self._log('error', error_message, download_id)
         
         # Tạo và ném một ngoại lệ mới, không tạo đệ quy
@@ -258,36 +609,29 @@ class NovelDownloader:
                 # Check if file exists in Dropbox /Novel directory
                 dropbox_path = f"/Novel/{safe_filename}"
                 try:
-                    # List files in the Novel directory
-                    files = self.dropbox.list_files("/Novel")
-                    for file in files:
-                        if file['name'] == safe_filename:
-                            self._log('info', f"📦 Đã tìm thấy EPUB trong Dropbox: {dropbox_path}", download_id)
-                            
-                            # Download the file to local temp
-                            self._log('info', f"⬇️ Đang tải EPUB từ Dropbox...", download_id)
-                            if self.dropbox.download_file(dropbox_path, temp_epub_path):
-                                self._log('info', f"✅ Đã tải thành công EPUB hiện có từ Dropbox", download_id)
-                                found_path = temp_epub_path
-                            else:
-                                self._log('warning', f"❌ Tải EPUB hiện có từ Dropbox thất bại", download_id)
-                            break
-                    
+                    # Look the file up in the cached index of the Novel directory
+                    if self.dropbox.file_exists(dropbox_path):
+                        self._log('info', f"📦 Đã tìm thấy EPUB trong Dropbox: {dropbox_path}", download_id)
+
+                        # Download the file to local temp
+                        self._log('info', f"⬇️ Đang tải EPUB từ Dropbox...", download_id)
+                        if self.dropbox.download_file(dropbox_path, temp_epub_path):
+                            self._log('info', f"✅ Đã tải thành công EPUB hiện có từ Dropbox", download_id)
+                            found_path = temp_epub_path
+                        else:
+                            self._log('warning', f"❌ Tải EPUB hiện có từ Dropbox thất bại", download_id)
+
                     # Also check Temp directory
-                    if not found_path:
-                        files = self.dropbox.list_files("/Novel/Temp")
-                        for file in files:
-                            if file['name'] == safe_filename:
-                                dropbox_temp_path = f"/Novel/Temp/{safe_filename}"
-                                self._log('info', f"✅ Đã tìm thấy checkpoint hiện có trong Dropbox: {dropbox_temp_path}", download_id)
-                                
-                                # Download the file to local temp
-                                if self.dropbox.download_file(dropbox_temp_path, temp_epub_path):
-                                    self._log('info', f"✅ Đã tải thành công checkpoint từ Dropbox", download_id)
-                                    found_path = temp_epub_path
-                                else:
-                                    self._log('warning', f"❌ Tải checkpoint từ Dropbox thất bại", download_id)
-                                break
+                    dropbox_temp_path = f"/Novel/Temp/{safe_filename}"
+                    if not found_path and self.dropbox.file_exists(dropbox_temp_path):
+                        self._log('info', f"✅ Đã tìm thấy checkpoint hiện có trong Dropbox: {dropbox_temp_path}", download_id)
+
+                        # Download the file to local temp
+                        if self.dropbox.download_file(dropbox_temp_path, temp_epub_path):
+                            self._log('info', f"✅ Đã tải thành công checkpoint từ Dropbox", download_id)
+                            found_path = temp_epub_path
+                        else:
+                            self._log('warning', f"❌ Tải checkpoint từ Dropbox thất bại", download_id)
                 except Exception as e:
                     self._log('warning', f"⚠️ Lỗi khi kiểm tra Dropbox để tìm EPUB hiện có: {str(e)}", download_id)
             
@@ -357,388 +701,249 @@ class NovelDownloader:
     def _get_mtc_novel_info(self, url, cookie='', download_id=None):
         """Get novel information from Metruyenchu"""
         try:
-            html = self._make_request(url, is_mtc=True, cookie=cookie, download_id=download_id)
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Get novel title
-            title_elem = soup.select_one('h1 a')
-            title = title_elem.text.strip() if title_elem else "Unknown"
-            self._log('info', f"Novel title: {title}", download_id)
-
-            # Get author name
-            author_elem = soup.select_one('h1 ~ div')
-            author = author_elem.text.strip() if author_elem else "Unknown"
-            self._log('info', f"Author: {author}", download_id)
-
-            # Get cover image URL
-            cover_elem = soup.select_one('img.h-60')
-            cover_url = cover_elem['src'] if cover_elem and 'src' in cover_elem.attrs else None
-            self._log('info', f"Cover image: {'Yes' if cover_url else 'No'}", download_id)
-
-            # Get synopsis
-            synopsis_elem = soup.select_one('#synopsis .text-base')
-            synopsis = synopsis_elem.get_text('\n', strip=True) if synopsis_elem else ""
-            self._log('info', f"Synopsis: {'Yes' if synopsis else 'No'}", download_id)
-
-            # Get book_id from the "Read from beginning" button
-            read_button = soup.select_one('div button[title="Đọc từ đầu"]')
-            book_id = None
-
-            if read_button and read_button.parent:
-                data_x_data = read_button.parent.get('data-x-data', '')
-                book_id_match = re.search(r'readings\((\d+)\)', data_x_data)
-                if book_id_match:
-                    book_id = book_id_match.group(1)
-                    self._log('info', f"Book ID: {book_id}", download_id)
-                else:
-                    self._log('warning', "Book ID not found in 'Read from beginning' button", download_id)
-            else:
-                self._log('warning', "'Read from beginning' button not found", download_id)
+            variant = self._cache_variant(True, cookie)
+            html, page_unchanged = self._fetch(url, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='novel_info')
+            novel_info = self._parse_cached(url, variant, page_unchanged, self._parse_mtc_novel_info, html, download_id)
+            list_unchanged = False
 
             # Get chapter list from API if book_id is available
-            chapters_list = []
-            if book_id:
-                api_url = f"https://backend.metruyencv.com/api/chapters?filter[book_id]={book_id}"
+            if novel_info['book_id']:
+                api_url = self._mtc_chapters_api_url(novel_info['book_id'])
                 try:
-                    api_data = self._make_request(api_url, is_api=True, is_mtc=True, cookie=cookie, download_id=download_id)
-                    if 'data' in api_data and isinstance(api_data['data'], list):
-                        chapters_list = api_data['data']
-                        self._log('info', f"Retrieved information for {len(chapters_list)} chapters from API", download_id)
+                    api_data, list_unchanged = self._fetch(api_url, is_api=True, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='chapter_list')
+                    novel_info['chapters_list'] = self._parse_mtc_chapter_list(api_data, download_id)
                 except Exception as e:
                     self._log('error', f"Error getting chapter list from API: {str(e)}", download_id)
 
-            return {
-                'title': title,
-                'author': author,
-                'cover_url': cover_url,
-                'synopsis': synopsis,
-                'book_id': book_id,
-                'chapters_list': chapters_list,
-                'site_type': 'metruyenchu'
-            }
+            novel_info['not_modified'] = page_unchanged and list_unchanged
+            return novel_info
         except Exception as e:
             self._log('error', f"Error getting novel information: {str(e)}", download_id)
             traceback.print_exc()
             raise
 
+    def _mtc_chapters_api_url(self, book_id):
+        """Build the Metruyenchu chapter list API URL for a book"""
+        return f"https://backend.metruyencv.com/api/chapters?filter[book_id]={book_id}"
+
+    def _parse_mtc_novel_info(self, html, download_id=None):
+        """Parse the Metruyenchu novel page (chapter list is filled in separately)"""
+        soup = BeautifulSoup(html, self.html_parser)
+
+        # Get novel title
+        title_elem = soup.select_one('h1 a')
+        title = title_elem.text.strip() if title_elem else "Unknown"
+        self._log('info', f"Novel title: {title}", download_id)
+
+        # Get author name
+        author_elem = soup.select_one('h1 ~ div')
+        author = author_elem.text.strip() if author_elem else "Unknown"
+        self._log('info', f"Author: {author}", download_id)
+
+        # Get cover image URL
+        cover_elem = soup.select_one('img.h-60')
+        cover_url = cover_elem['src'] if cover_elem and 'src' in cover_elem.attrs else None
+        self._log('info', f"Cover image: {'Yes' if cover_url else 'No'}", download_id)
+
+        # Get synopsis
+        synopsis_elem = soup.select_one('#synopsis .text-base')
+        synopsis = synopsis_elem.get_text('\n', strip=True) if synopsis_elem else ""
+        self._log('info', f"Synopsis: {'Yes' if synopsis else 'No'}", download_id)
+
+        # Get book_id from the "Read from beginning" button
+        read_button = soup.select_one('div button[title="Đọc từ đầu"]')
+        book_id = None
+
+        if read_button and read_button.parent:
+            data_x_data = read_button.parent.get('data-x-data', '')
+            book_id_match = re.search(r'readings\((\d+)\)', data_x_data)
+            if book_id_match:
+                book_id = book_id_match.group(1)
+                self._log('info', f"Book ID: {book_id}", download_id)
+            else:
+                self._log('warning', "Book ID not found in 'Read from beginning' button", download_id)
+        else:
+            self._log('warning', "'Read from beginning' button not found", download_id)
+
+        return {
+            'title': title,
+            'author': author,
+            'cover_url': cover_url,
+            'synopsis': synopsis,
+            'book_id': book_id,
+            'chapters_list': [],
+            'site_type': 'metruyenchu'
+        }
+
+    def _parse_mtc_chapter_list(self, api_data, download_id=None):
+        """Extract the chapter list from the Metruyenchu chapters API response"""
+        chapters_list = []
+        if 'data' in api_data and isinstance(api_data['data'], list):
+            chapters_list = api_data['data']
+            self._log('info', f"Retrieved information for {len(chapters_list)} chapters from API", download_id)
+        return chapters_list
+
     def _get_ttv_novel_info(self, url, download_id=None):
         """Get novel information from Tangthuvien"""
         try:
-            html = self._make_request(url, is_mtc=False, download_id=download_id)
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Get novel title
-            title_elem = soup.select_one('h1')
-            title = title_elem.text.strip() if title_elem else "Unknown"
-            self._log('info', f"Novel title: {title}", download_id)
-
-            # Default author
-            author = "Unknown"
-
-            # Get cover image URL
-            cover_elem = soup.select_one('.book-img img')
-            cover_url = cover_elem['src'] if cover_elem and 'src' in cover_elem.attrs else None
-            self._log('info', f"Cover image: {'Yes' if cover_url else 'No'}", download_id)
-
-            # Get synopsis
-            synopsis_elem = soup.select_one('.book-intro')
-            synopsis = synopsis_elem.get_text('\n', strip=True) if synopsis_elem else ""
-            self._log('info', f"Synopsis: {'Yes' if synopsis else 'No'}", download_id)
-
-            # Get book_id
-            book_id_elem = soup.select_one('#story_id_hidden')
-            book_id = book_id_elem['value'] if book_id_elem else None
-            self._log('info', f"Book ID: {book_id or 'Not found'}", download_id)
-
-            # Get total number of chapters
-            total_chapters = 0
-            catalog_elem = soup.select_one('#j-bookCatalogPage')
-            if catalog_elem:
-                chapter_count_match = re.search(r'Danh sách chương \((\d+) chương\)', catalog_elem.text)
-                if chapter_count_match:
-                    total_chapters = int(chapter_count_match.group(1))
-                    self._log('info', f"Total chapters: {total_chapters}", download_id)
+            html, page_unchanged = self._fetch(url, is_mtc=False, download_id=download_id, cache_kind='novel_info')
+            novel_info, total_chapters = self._parse_cached(url, '', page_unchanged, self._parse_ttv_novel_info, html, download_id)
+            list_unchanged = False
 
             # Get chapter list
-            chapters_list = []
-            if book_id and total_chapters > 0:
-                chapters_url = f"https://tangthuvien.net/doc-truyen/page/{book_id}?page=0&limit={total_chapters}&web=1"
+            if novel_info['book_id'] and total_chapters > 0:
+                chapters_url = self._ttv_chapters_url(novel_info['book_id'], total_chapters)
                 try:
-                    chapters_html = self._make_request(chapters_url, is_mtc=False, download_id=download_id)
-                    chapters_soup = BeautifulSoup(chapters_html, 'html.parser')
-                    chapter_links = chapters_soup.select('ul.cf > li > a')
-
-                    for i, link in enumerate(chapter_links, 1):
-                        chapter_url = link.get('href')
-                        chapter_title = link.get('title') or f"Chapter {i}"
-
-                        chapters_list.append({
-                            'index': i,
-                            'name': chapter_title,
-                            'url': chapter_url
-                        })
-
-                    self._log('info', f"Retrieved information for {len(chapters_list)} chapters", download_id)
+                    chapters_html, list_unchanged = self._fetch(chapters_url, is_mtc=False, download_id=download_id, cache_kind='chapter_list')
+                    novel_info['chapters_list'] = self._parse_cached(chapters_url, '', list_unchanged, self._parse_ttv_chapter_list, chapters_html, download_id)
                 except Exception as e:
                     self._log('error', f"Error getting chapter list from Tangthuvien: {str(e)}", download_id)
 
-            return {
-                'title': title,
-                'author': author,
-                'cover_url': cover_url,
-                'synopsis': synopsis,
-                'book_id': book_id,
-                'chapters_list': chapters_list,
-                'site_type': 'tangthuvien'
-            }
+            novel_info['not_modified'] = page_unchanged and list_unchanged
+            return novel_info
         except Exception as e:
             self._log('error', f"Error getting novel information from Tangthuvien: {str(e)}", download_id)
             traceback.print_exc()
             raise
 
-    def _extract_chapter_title(self, chapter_number, content=None, default_title=None):
-        """Extract or create an appropriate chapter title"""
-        # If we already have a good title, use it
-        if default_title and default_title != f"Chapter {chapter_number}" and default_title != "":
-            return default_title
-
-        # Try to extract title from content if available
-        if content:
-            try:
-                title_pattern = re.compile(r"Chương\s+\d+\s*[:\-]\s*(.*?)[\n\r]", re.IGNORECASE)
-                match = title_pattern.search(content)
-                if match:
-                    return f"Chương {chapter_number}: {match.group(1).strip()}"
-            except Exception as e:
-                self.logger.warning(f"Error extracting title: {e}")
-
-        # Default title with just the chapter number
-        return f"Chương {chapter_number}"
+    def _ttv_chapters_url(self, book_id, total_chapters):
+        """Build the Tangthuvien catalog page URL listing all chapters of a book"""
+        return f"https://tangthuvien.net/doc-truyen/page/{book_id}?page=0&limit={total_chapters}&web=1"
+
+    def _parse_ttv_novel_info(self, html, download_id=None):
+        """
+        Parse the Tangthuvien novel page (chapter list is filled in separately)
+
+        Returns:
+            Tuple of (novel_info, total_chapters)
+        """
+        soup = BeautifulSoup(html, self.html_parser)
+
+        # Get novel title
+        title_elem = soup.select_one('h1')
+        title = title_elem.text.strip() if title_elem else "Unknown"
+        self._log('info', f"Novel title: {title}", download_id)
+
+        # Default author
+        author = "Unknown"
+
+        # Get cover image URL
+        cover_elem = soup.select_one('.book-img img')
+        cover_url = cover_elem['src'] if cover_elem and 'src' in cover_elem.attrs else None
+        self._log('info', f"Cover image: {'Yes' if cover_url else 'No'}", download_id)
+
+        # Get synopsis
+        synopsis_elem = soup.select_one('.book-intro')
+        synopsis = synopsis_elem.get_text('\n', strip=True) if synopsis_elem else ""
+        self._log('info', f"Synopsis: {'Yes' if synopsis else 'No'}", download_id)
+
+        # Get book_id
+        book_id_elem = soup.select_one('#story_id_hidden')
+        book_id = book_id_elem['value'] if book_id_elem else None
+        self._log('info', f"Book ID: {book_id or 'Not found'}", download_id)
+
+        # Get total number of chapters
+        total_chapters = 0
+        catalog_elem = soup.select_one('#j-bookCatalogPage')
+        if catalog_elem:
+            chapter_count_match = re.search(r'Danh sách chương \((\d+) chương\)', catalog_elem.text)
+            if chapter_count_match:
+                total_chapters = int(chapter_count_match.group(1))
+                self._log('info', f"Total chapters: {total_chapters}", download_id)
+
+        novel_info = {
+            'title': title,
+            'author': author,
+            'cover_url': cover_url,
+            'synopsis': synopsis,
+            'book_id': book_id,
+            'chapters_list': [],
+            'site_type': 'tangthuvien'
+        }
+        return novel_info, total_chapters
+
+    def _parse_ttv_chapter_list(self, chapters_html, download_id=None):
+        """Extract the chapter list from the Tangthuvien catalog page"""
+        chapters_soup = BeautifulSoup(chapters_html, self.html_parser)
+        chapter_links = chapters_soup.select('ul.cf > li > a')
+
+        chapters_list = []
+        for i, link in enumerate(chapter_links, 1):
+            chapter_url = link.get('href')
+            chapter_title = link.get('title') or f"Chapter {i}"
+
+            chapters_list.append({
+                'index': i,
+                'name': chapter_title,
+                'url': chapter_url
+            })
 
-    def _optimize_html_for_ereader(self, html_content):
-        """Optimize HTML content for e-readers"""
-        try:
-            if not html_content:
-                return html_content
-
-            # Parse HTML
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            # Remove unnecessary attributes
-            for tag in soup.find_all(True):
-                allowed_attrs = ['id', 'class', 'href', 'src', 'alt']
-                attrs = dict(tag.attrs)
-                for attr in attrs:
-                    if attr not in allowed_attrs:
-                        del tag[attr]
-
-            # Split long paragraphs
-            for p in soup.find_all('p'):
-                if len(p.get_text()) > 1000:  # If paragraph is too long
-                    text = p.get_text()
-                    p.clear()
-
-                    # Split paragraph
-                    sentences = re.split(r'(?<=[.!?])\s+', text)
-                    current_p = p
-
-                    for i, sentence in enumerate(sentences):
-                        if i > 0 and i % 3 == 0:  # Every 3 sentences create a new paragraph
-                            new_p = soup.new_tag('p')
-                            current_p.insert_after(new_p)
-                            current_p = new_p
-
-                        if current_p.string:
-                            current_p.string = current_p.string + " " + sentence
-                        else:
-                            current_p.string = sentence
-
-            # Ensure spacing between paragraphs
-            for p in soup.find_all('p'):
-                p['style'] = 'margin-top: 0.5em; margin-bottom: 0.5em;'
-
-            # Convert complex tags to simpler ones
-            for tag in soup.find_all(['div', 'span']):
-                if not tag.find_all(True):  # If it has no child tags
-                    new_tag = soup.new_tag('p')
-                    new_tag.string = tag.get_text()
-                    tag.replace_with(new_tag)
-
-            # Remove empty tags
-            for tag in soup.find_all():
-                if len(tag.get_text(strip=True)) == 0 and tag.name not in ['br', 'img', 'hr']:
-                    tag.decompose()
-
-            # Fix special characters
-            for entity in soup.find_all(string=lambda text: '&' in text):
-                new_text = entity.replace('&nbsp;', ' ')
-                entity.replace_with(new_text)
-
-            return str(soup)
-        except Exception as e:
-            self.logger.error(f"Error optimizing HTML: {e}")
-            traceback.print_exc()
-            return html_content  # Return original content if there's an error
+        self._log('info', f"Retrieved information for {len(chapters_list)} chapters", download_id)
+        return chapters_list
 
     def _get_mtc_chapter_content(self, url, chapter_number, chapter_title=None, novel_title="", cookie='', download_id=None):
         """Get chapter content from Metruyenchu"""
         try:
-            chapter_url = url + "/chuong-" + str(chapter_number)
-            html = self._make_request(chapter_url, is_mtc=True, cookie=cookie, download_id=download_id)
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Get chapter title
-            title_elem = soup.select_one('h2')
-            base_title = title_elem.text.strip() if title_elem and title_elem.text else "Chương " + str(chapter_number)
-
-            # Use title from API if available
-            if chapter_title:
-                base_title = chapter_title
-
-            # Get chapter content
-            content_elem = soup.select_one('[data-x-bind="ChapterContent"]')
-            content = ""
-
-            if content_elem:
-                content = content_elem.get_text('\n', strip=True)
-
-            if not content or len(content.strip()) == 0:
-                # Use default content if not found
-                content = "Không có nội dung. Chương này có thể bị khóa hoặc không tồn tại."
-                self._log('warning', f"⚠️ Không tìm thấy nội dung cho chương {chapter_number}: Nội dung có thể bị khoá hoặc không tồn tại, sử dụng nội dung mặc định", download_id)
-
-            # Extract better title if possible
-            title = self._extract_chapter_title(chapter_number, content, base_title)
-
-            # Format HTML content
-            if content_elem:
-                # Process p and br tags
-                for p in content_elem.find_all('p'):
-                    p.insert_after(soup.new_tag('br'))
-                content_html = str(content_elem)
-
-                # Optimize HTML for e-reader
-                content_html = self._optimize_html_for_ereader(content_html)
-            else:
-                content_html = "<p>" + content + "</p>"
-
-            # Log information
-            self._log('info', f"✅ Đã tải chương {chapter_number}: {title} - Độ dài: {len(content)} ký tự", download_id)
-
-            return {
-                'title': title,
-                'content': content,
-                'content_html': content_html
-            }
+            chapter_url = self._mtc_chapter_url(url, chapter_number)
+            html = self._make_request(chapter_url, is_mtc=True, cookie=cookie, download_id=download_id, cache_kind='chapter')
+            chapter_data = self._parse_mtc_chapter_content(html, chapter_number, chapter_title, download_id)
+
+            # Locked or missing chapters may become available later, don't keep them cached
+            if self._is_placeholder(chapter_data):
+                self.cache.invalidate(chapter_url, self._cache_variant(True, cookie))
+            return chapter_data
         except Exception as e:
             self._log('error', f"❌ Lỗi khi tải chương {chapter_number} từ Metruyenchu: {str(e)}", download_id)
             traceback.print_exc()
             raise
 
-    def _get_ttv_chapter_content(self, chapter_info, novel_title="", download_id=None):
-        """Get chapter content from Tangthuvien"""
-        try:
-            chapter_number = chapter_info['index']
-            chapter_url = chapter_info['url']
-            chapter_title = chapter_info['name']
-
-            # Get HTML from the page
-            html = self._make_request(chapter_url, is_mtc=False, download_id=download_id)
-
-            # Parse content
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Clear head content to reduce debug file size
-            if soup.head:
-                soup.head.clear()
-                soup.head.append(soup.new_tag('title'))
-                soup.head.title.string = f"Debug HTML - Chapter {chapter_number}"
-
-            # Novel content - try with main selector
-            content_elem = soup.select_one('.box-chap')
-            content = ""
-            content_html = ""
+    def _is_placeholder(self, chapter_data):
+        """Check whether chapter data holds the default content used for locked or missing chapters"""
+        return chapter_data.get('content') == PLACEHOLDER_CONTENT
 
-            # If main selector not found, try alternative selector
-            if not content_elem or not content_elem.text.strip():
-                content_blocks = soup.select('p.content-block')
-
-                if content_blocks:
-                    self._log('info', f"ℹ️ Sử dụng selector thay thế cho chương {chapter_number}", download_id)
-
-                    # Create content from p.content-block tags
-                    content = "\n".join([block.get_text(strip=True) for block in content_blocks])
-
-                    # Create new HTML with p tags
-                    content_container = soup.new_tag('div')
-                    content_container['class'] = 'chapter-content'
-
-                    for block in content_blocks:
-                        p = soup.new_tag('p')
-                        p.string = block.get_text(strip=True)
-                        content_container.append(p)
-
-                    content_elem = content_container
-                    content_html = str(content_container)
-                else:
-                    # Still no content found
-                    content_elem = None
-
-            # Process if content found with main selector
-            if content_elem and not content:
-                content = content_elem.get_text('\n', strip=True)
-
-                # Create new HTML from text with \n converted to p tags
-                if content:
-                    # Split paragraphs by \n
-                    paragraphs = content.split('\n')
-
-                    # Create div to contain content
-                    fixed_content_elem = soup.new_tag('div')
-                    fixed_content_elem['class'] = 'chapter-content'
-
-                    # Add each paragraph to a separate p tag
-                    for paragraph in paragraphs:
-                        # Skip empty lines
-                        if paragraph.strip():
-                            p = soup.new_tag('p')
-                            p.string = paragraph.strip()
-                            fixed_content_elem.append(p)
-
-                    content_html = str(fixed_content_elem)
-                else:
-                    content_html = "<div class='chapter-content'></div>"
+    def _is_placeholder_html(self, html):
+        """Check whether a stored chapter page has no text besides its headings, or only the placeholder content"""
+        if PLACEHOLDER_CONTENT in html:
+            return True
+        soup = BeautifulSoup(html, 'html.parser')
+        for heading in soup.find_all(['h1', 'h2', 'h3']):
+            heading.decompose()
+        return not soup.get_text(strip=True)
 
-            # If no content could be retrieved, use default content
-            if not content or len(content.strip()) == 0:
-                # Use default content
-                content = "Không có nội dung. Chương này có thể bị khóa hoặc không tồn tại."
-                self._log('warning', f"⚠️ Không tìm thấy nội dung cho chương {chapter_number}: Nội dung có thể bị khoá hoặc không tồn tại", download_id)
-                content_html = "<p>" + content + "</p>"
+    def _mtc_chapter_url(self, url, chapter_number):
+        """Build the Metruyenchu chapter page URL"""
+        return url + "/chuong-" + str(chapter_number)
 
-            # If content_html still not set (rare case)
-            if not content_html:
-                content_html = "<p>" + content.replace("\n\n", "</p><p>") + "</p>"
+    def _parse_log(self, download_id=None):
+        """Log callback handed to the chapter parsers"""
+        return lambda level, message: self._log(level, message, download_id)
 
-            # Extract better title if possible
-            title = self._extract_chapter_title(chapter_number, content, chapter_title)
+    def _parse_mtc_chapter_content(self, html, chapter_number, chapter_title=None, download_id=None):
+        """Extract chapter title and content from a Metruyenchu chapter page"""
+        return parse_mtc_chapter(html, chapter_number, chapter_title, self.html_parser, self._parse_log(download_id))
 
-            # Optimize HTML for e-reader
-            content_html = self._optimize_html_for_ereader(content_html)
+    def _get_ttv_chapter_content(self, chapter_info, novel_title="", download_id=None):
+        """Get chapter content from Tangthuvien"""
+        try:
+            chapter_number = chapter_info['index']
 
-            # Log information
-            self._log('info', f"✅ Đã tải chương {chapter_number}: {title} - Độ dài: {len(content)} ký tự", download_id)
+            # Get HTML from the page
+            html = self._make_request(chapter_info['url'], is_mtc=False, download_id=download_id, cache_kind='chapter')
+            chapter_data = self._parse_ttv_chapter_content(html, chapter_number, chapter_info['name'], download_id)
 
-            return {
-                'title': title,
-                'content': content,
-                'content_html': content_html
-            }
+            # Locked or missing chapters may become available later, don't keep them cached
+            if self._is_placeholder(chapter_data):
+                self.cache.invalidate(chapter_info['url'])
+            return chapter_data
         except Exception as e:
-            self._log('error', f"❌ Lỗi khi tải chương {chapter_number} từ Tangthuvien: {str(e)}", download_id)
+            self._log('error', f"❌ Lỗi khi tải chương {chapter_info.get('index')} từ Tangthuvien: {str(e)}", download_id)
             traceback.print_exc()
             raise
 
+    def _parse_ttv_chapter_content(self, html, chapter_number, chapter_title=None, download_id=None):
+        """Extract chapter title and content from a Tangthuvien chapter page"""
+        return parse_ttv_chapter(html, chapter_number, chapter_title, self.html_parser, self._parse_log(download_id))
+
     def _extract_title_from_html(self, html_content):
         """Extract title from HTML content, usually from h2 tag"""
         try:
@@ -757,6 +962,14 @@ class NovelDownloader:
             self.logger.warning(f"Error extracting title from HTML: {e}")
             return None
 
+    def _get_chapter_item_title(self, item):
+        """Get the title of an EPUB chapter, parsing its page only for chapters loaded from an existing EPUB"""
+        if isinstance(item, ChapterHtml):
+            return item.document.title
+        if hasattr(item, 'content') and item.content:
+            return self._extract_title_from_html(item.content)
+        return None
+
     def _get_novel_info(self, url, cookie='', download_id=None):
         """Get novel information (auto-detect site type)"""
         site_type = self._detect_site_type(url)
@@ -776,14 +989,202 @@ class NovelDownloader:
         else:
             raise ValueError(f"Unsupported website type: {site_type}")
 
-    def _create_epub(self, novel_info, download_id=None):
-        """Create a new EPUB file"""
+    def _fetch_chapter_task(self, url, chapter_info, site_type, novel_title, cookie='', download_id=None):
+        """Fetch one chapter on a worker thread"""
+        self._log('info', f"📥 Đang tải chương {chapter_info.get('index')}: {chapter_info.get('name', 'Không tên')}", download_id)
+        return self._get_chapter_content(url, chapter_info, site_type, novel_title, cookie, download_id)
+
+    def _get_parse_pool(self):
+        """Return the chapter parser process pool, started on first use (None if disabled)"""
+        if self.parse_processes <= 0:
+            return None
+        if self._threads_are_green():
+            # The pool deadlocks under eventlet (gunicorn's eventlet worker): its management thread
+            # is a green thread and the executor can't be driven from a real thread through tpool
+            self.logger.warning("⚠️ Luồng đã bị eventlet patch, PARSE_PROCESSES không có tác dụng, phân tích chương trên luồng tải")
+            self.parse_processes = 0
+            return None
+        with self._parse_pool_lock:
+            if self.parse_pool is None:
+                # Spawn fresh interpreters, workers must not inherit the eventlet-patched server state
+                self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+            return self.parse_pool
+
+    def _threads_are_green(self):
+        """Whether eventlet has monkey patched threading in this process"""
+        try:
+            from eventlet import patcher
+            return patcher.is_monkey_patched('thread')
+        except ImportError:
+            return False
+
+    def _reset_parse_pool(self, pool):
+        """Drop a broken parser pool so the next chapter starts a new one"""
+        with self._parse_pool_lock:
+            if self.parse_pool is pool:
+                self.parse_pool = None
+        pool.shutdown(wait=False)
+
+    def _chapter_from_record(self, record, download_id=None):
+        """Turn a chapter record returned by a parser process into chapter data"""
+        for level, message in record['logs']:
+            self._log(level, message, download_id)
+
+        document = ChapterDocument.from_html(record['title'], record['content'], record['html'], title_checked=True)
+        return {
+            'title': record['title'],
+            'content': record['content'],
+            'document': document
+        }
+
+    def _fetch_chapter_page(self, page_url, chapter_info, is_mtc=True, cookie='', download_id=None):
+        """Download the raw page of one chapter on a worker thread"""
+        self._log('info', f"📥 Đang tải chương {chapter_info.get('index')}: {chapter_info.get('name', 'Không tên')}", download_id)
+        try:
+            return self._make_request(page_url, is_mtc=is_mtc, cookie=cookie, download_id=download_id, cache_kind='chapter')
+        except Exception as e:
+            self._log('error', f"❌ Lỗi khi tải chương {chapter_info.get('index')}: {str(e)}", download_id)
+            raise
+
+    def _submit_fetch_and_parse(self, executor, parse_pool, url, chapter_info, site_type, cookie='', download_id=None):
+        """
+        Fetch a chapter page on a worker thread, then parse it in the parser process pool
+
+        Returns:
+            A concurrent.futures.Future of the chapter data, done once the chapter is parsed
+        """
+        is_mtc = site_type == 'metruyenchu'
+        chapter_number = chapter_info['index']
+        page_url = self._mtc_chapter_url(url, chapter_number) if is_mtc else chapter_info['url']
+        result = Future()
+
+        def on_parsed(parse_future):
+            try:
+                chapter_data = self._chapter_from_record(parse_future.result(), download_id)
+
+                # Locked or missing chapters may become available later, don't keep them cached
+                if self._is_placeholder(chapter_data):
+                    self.cache.invalidate(page_url, self._cache_variant(is_mtc, cookie))
+                result.set_result(chapter_data)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._reset_parse_pool(parse_pool)
+                self._log('error', f"❌ Lỗi khi phân tích chương {chapter_number}: {str(e)}", download_id)
+                result.set_exception(e)
+
+        def on_fetched(fetch_future):
+            # The chapter is no longer wanted (download cancelled or failed), leave it unparsed;
+            # otherwise mark it running so it can't be cancelled while its result is set
+            if not result.set_running_or_notify_cancel():
+                return
+            try:
+                html = fetch_future.result()
+                parse_future = parse_pool.submit(parse_chapter_record, site_type, html, chapter_number,
+                                                 chapter_info.get('name'), self.html_parser)
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._reset_parse_pool(parse_pool)
+                result.set_exception(e)
+                return
+            parse_future.add_done_callback(on_parsed)
+
+        executor.submit(self._fetch_chapter_page, page_url, chapter_info, is_mtc, cookie, download_id).add_done_callback(on_fetched)
+        return result
+
+    def _fetch_chapters(self, url, chapters, site_type, novel_title, cookie='', download_id=None):
+        """
+        Fetch chapters concurrently and yield them back in chapter-index order
+
+        Yields:
+            (chapter_info, chapter_data) tuples, chapter_data is None if the chapter
+            still failed after all retries
+        """
+        workers = max(1, self.fetch_workers.get(site_type, 1))
+        self._log('info', f"🧵 Tải song song với {workers} luồng", download_id)
+        if self._get_parse_pool() is not None:
+            self._log('info', f"⚙️ Phân tích chương trên {self.parse_processes} tiến trình", download_id)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chapter_fetch') as executor:
+            def submit_fetch(chapter_info):
+                parse_pool = self._get_parse_pool()
+                if parse_pool is None:
+                    return executor.submit(self._fetch_chapter_task, url, chapter_info, site_type, novel_title, cookie, download_id)
+                return self._submit_fetch_and_parse(executor, parse_pool, url, chapter_info, site_type, cookie, download_id)
+
+            # Limit how far ahead of the next chapter to yield we may fetch; chapters
+            # waiting for a parser count too, so slow parsing holds the fetchers back
+            yield from self._fetch_in_order(chapters, submit_fetch, workers * 4, download_id)
+
+    def _fetch_in_order(self, chapters, submit_fetch, window, download_id=None):
+        """
+        Run chapter fetches through submit_fetch and yield results in chapter order
+
+        Chapters are downloaded out of order, but each result is held back until
+        every chapter before it has been yielded. At most `window` chapters are
+        in flight or waiting to be yielded. Failed chapters are resubmitted while
+        the other fetches keep going.
+
+        Args:
+            chapters: Chapter info dicts, sorted by index
+            submit_fetch: Callable taking a chapter info dict and returning a
+                          concurrent.futures.Future of its chapter data
+            window: Maximum number of chapters fetched ahead of the next one to yield
+
+        Yields:
+            (chapter_info, chapter_data) tuples, chapter_data is None if the chapter
+            still failed after all retries
+        """
+        pending = {}  # future -> (position, attempt)
+        results = {}  # position -> chapter_data
+        next_submit = 0
+        next_yield = 0
+
+        def submit(position, attempt):
+            pending[submit_fetch(chapters[position])] = (position, attempt)
+
+        try:
+            while next_yield < len(chapters):
+                while next_submit < len(chapters) and next_submit - next_yield < window:
+                    submit(next_submit, 0)
+                    next_submit += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    position, attempt = pending.pop(future)
+                    chapter_index = chapters[position].get('index')
+                    try:
+                        results[position] = future.result()
+                    except Exception as e:
+                        if attempt < self.chapter_retries:
+                            self._log('warning', f"🔁 Thử lại chương {chapter_index} (lần {attempt + 2}/{self.chapter_retries + 1}): {str(e)}", download_id)
+                            submit(position, attempt + 1)
+                        else:
+                            self._log('error', f"Lỗi khi tải chương {chapter_index}: {str(e)}", download_id)
+                            results[position] = None
+
+                # Release every chapter that is now next in order
+                while next_yield in results:
+                    yield chapters[next_yield], results.pop(next_yield)
+                    next_yield += 1
+        finally:
+            # The consumer stopped early (e.g. the download was cancelled), drop the fetches not started yet
+            for future in pending:
+                future.cancel()
+
+    def _create_epub(self, novel_info, download_id=None, book_uuid=None):
+        """
+        Create a new EPUB file
+
+        Args:
+            book_uuid: Identifier of the book, kept across updates of the same novel (default: a new one)
+        """
         try:
             self._log('info', "📙 Bắt đầu tạo file EPUB mới...", download_id)
             book = epub.EpubBook()
 
             # Add metadata
-            book_id = str(uuid.uuid4())
+            book_id = book_uuid or str(uuid.uuid4())
             book.set_identifier(book_id)
             book.set_title(novel_info['title'])
             book.set_language('vi')
@@ -803,7 +1204,8 @@ class NovelDownloader:
                         'user-agent': self._generate_user_agent(),
                         'referer': 'https://metruyencv.com/'
                     }
-                    cover_response = requests.get(novel_info['cover_url'], headers=headers)
+                    self._throttle(novel_info['cover_url'], download_id)
+                    cover_response = self.http.get(novel_info['cover_url'], headers=headers, timeout=30)
                     cover_response.raise_for_status()
                     cover_content = cover_response.content
 
@@ -913,440 +1315,245 @@ class NovelDownloader:
             traceback.print_exc()
             raise
     
-    def _add_chapter_to_epub(self, book, chapter_data, chapter_number, download_id=None):
-        """Add a chapter to the EPUB book"""
+    def _chapter_record(self, chapter_data, chapter_number, download_id=None):
+        """
+        Turn a downloaded chapter into the record kept in the chapter store
+
+        Returns:
+            Dict with the chapter 'index', 'title', optimized 'html' and whether
+            it is only a 'placeholder' for locked or missing content
+        """
         try:
-            chapter_id = 'chapter_' + str(chapter_number)
-
             # Get better title from content if possible
-            title = self._extract_chapter_title(chapter_number, chapter_data['content'], chapter_data['title'])
-
-            chapter = epub.EpubHtml(title=title, file_name='chapter_' + str(chapter_number) + '.xhtml')
-            chapter.id = chapter_id
+            title = extract_chapter_title(chapter_number, chapter_data['content'], chapter_data['title'])
 
-            content_html = "<p>No content</p>"
-            if 'content_html' in chapter_data:
-                content_html = chapter_data['content_html']
+            document = chapter_data.get('document') or ChapterDocument.from_html(title, chapter_data['content'], "<p>No content</p>")
+            document.title = title
 
-            # Check if content_html already contains the chapter title
-            title_present = False
+            # Check the parsed content for the chapter title, add it as a heading if missing
             try:
-                soup = BeautifulSoup(content_html, 'html.parser')
-
-                # Check if title appears in heading tags
-                for heading in soup.find_all(['h1', 'h2', 'h3']):
-                    if title.lower() in heading.get_text().lower():
-                        title_present = True
-                        break
-
-                # If not found in headings, check first paragraphs
-                if not title_present:
-                    # Check first two paragraphs
-                    first_paragraphs = soup.find_all('p', limit=2)
-                    for p in first_paragraphs:
-                        if title.lower() in p.get_text().lower():
-                            # Title is in content but not as heading
-                            # Convert p to h2
-                            p.name = 'h2'
-                            title_present = True
-                            # Update content_html with modified soup
-                            content_html = str(soup)
-                            break
+                document.ensure_title_heading(title)
             except Exception as e:
-                self.logger.warning(f"Error parsing HTML to check for title: {e}")
+                self.logger.warning(f"Error checking chapter content for title: {e}")
 
-            # If title still not present, add it to beginning of content
-            if not title_present:
-                title_html = f"<h2>{title}</h2>"
-                content_html = title_html + content_html
-
-            # Prepare optimized HTML content for e-reader
-            chapter_content = """
-            <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
-            <head>
-                <title>""" + title + """</title>
-                <meta charset="utf-8"/>
-                <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-            </head>
-            <body>
-                """ + content_html + """
-            </body>
-            </html>
-            """
-            chapter.content = chapter_content
-            book.add_item(chapter)
-
-            return chapter
+            return {
+                'index': chapter_number,
+                'title': title,
+                'html': document.html,
+                'placeholder': self._is_placeholder(chapter_data)
+            }
         except Exception as e:
             self._log('error', f"Error adding chapter {chapter_number} to EPUB: {str(e)}", download_id)
             traceback.print_exc()
             raise
 
-    def _fix_navigation_files(self, book, is_temp, download_id=None):
-        """Fix navigation files to ensure all chapters have appropriate titles"""
+    def _chapter_from_store(self, row):
+        """EPUB chapter of a chapter store row, its page is built when it is written"""
+        document = ChapterDocument.from_html(row['title'], '', row['html'], title_checked=True)
+        chapter = ChapterHtml(document, title=row['title'], file_name=f"chapter_{row['index']}.xhtml")
+        chapter.id = f"chapter_{row['index']}"
+        return chapter
+
+    def export_epub(self, store, output_path, novel_info=None, download_id=None, manifest=None):
+        """
+        Build the EPUB of a novel from its chapter store, without fetching any chapter
+
+        Args:
+            store: ChapterStore of the novel
+            output_path: Path of the EPUB to write
+            novel_info: Novel information for the metadata and introduction
+                        (default: the information saved in the store)
+            manifest: ResumeManifest of the novel, gives the book UUID and is
+                      refreshed from the exported chapters
+
+        Returns:
+            Number of chapters in the EPUB
+        """
+        # The chapter bodies are needed now, fetch the ones only checkpointed in Dropbox
+        if not self._merge_remote_store(store, download_id):
+            raise Exception(f"Không thể tải kho chương từ Dropbox để tạo EPUB: {store.path}")
+
+        novel_info = novel_info or store.load_novel()
+        if not novel_info:
+            raise ValueError(f"No novel information in chapter store {store.path}")
+
+        book, intro = self._create_epub(novel_info, download_id, book_uuid=manifest.book_uuid if manifest else None)
+        if manifest:
+            manifest.reset()
+
+        # Chapters are read from the store and written to the zip one at a time
+        writer = self._open_epub_writer(book, output_path, download_id)
+        newest = None
         try:
-            # Get all chapters and extract full titles from content
-            chapter_titles = {}
-            for item in book.items:
-                if isinstance(item, epub.EpubHtml) and hasattr(item, 'id') and item.id and item.id.startswith('chapter_'):
-                    try:
-                        chapter_num = int(item.id.split('_')[1])
-
-                        # Prioritize extracting title from HTML content
-                        full_title = None
-                        if hasattr(item, 'content') and item.content:
-                            full_title = self._extract_title_from_html(item.content)
-
-                        # If not found from HTML, use existing title
-                        if not full_title and hasattr(item, 'title') and item.title:
-                            full_title = item.title
-
-                        # If still no title, create default
-                        if not full_title:
-                            full_title = f"Chương {chapter_num}"
-
-                        # Save extracted title
-                        chapter_titles[chapter_num] = full_title
-
-                        # Update chapter title
-                        item.title = full_title
-
-                    except Exception as e:
-                        self.logger.warning(f"Error processing chapter {item.id}: {e}")
+            for row in store.iter_chapters():
+                self._write_chapter(writer, self._chapter_from_store(row), download_id)
+                newest = max(newest or row['fetched_at'], row['fetched_at'])
+                if manifest:
+                    manifest.add_chapters([row])
+        except Exception:
+            writer.abort()
+            raise
 
-            if not chapter_titles:
-                self._log('warning', "No chapters found to update navigation", download_id)
-                return False
+        # Date the book by its newest chapter, so exporting unchanged chapters gives the same file
+        modified = datetime.datetime.fromtimestamp(newest, datetime.timezone.utc) if newest else None
+        self._finish_epub(writer, intro, download_id, modified=modified)
+        if manifest:
+            manifest.save()
+        return len(writer.chapters)
 
-            if not is_temp:
-                self._log('info', f"Found {len(chapter_titles)} chapters with titles to update navigation", download_id)
+    def _fix_chapter_item(self, chapter):
+        """Make sure a chapter has its id and its full title before it is written"""
+        if not hasattr(chapter, 'id') or not chapter.id:
+            chapter_num = int(chapter.file_name.split('_')[1].split('.')[0])
+            chapter.id = 'chapter_' + str(chapter_num)
 
-            # Create new nav.xhtml content if needed
-            nav_content = """<?xml version='1.0' encoding='utf-8'?>
-            <!DOCTYPE html>
-            <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="vi" xml:lang="vi">
-              <head>
-                <title>{title}</title>
-                <meta charset="utf-8"/>
-              </head>
-              <body>
-                <nav epub:type="toc" id="id" role="doc-toc">
-                  <h2>{title}</h2>
-                  <ol>
-                    <li>
-                      <a href="intro.xhtml">Introduction</a>
-                    </li>
-                    {chapter_items}
-                  </ol>
-                </nav>
-              </body>
-            </html>
-            """
-
-            # Create new toc.ncx content if needed
-            toc_content = """<?xml version='1.0' encoding='utf-8'?>
-            <ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
-              <head>
-                <meta content="{uuid}" name="dtb:uid"/>
-                <meta content="0" name="dtb:depth"/>
-                <meta content="0" name="dtb:totalPageCount"/>
-                <meta content="0" name="dtb:maxPageNumber"/>
-              </head>
-              <docTitle>
-                <text>{title}</text>
-              </docTitle>
-              <navMap>
-                <navPoint id="intro">
-                  <navLabel>
-                    <text>Introduction</text>
-                  </navLabel>
-                  <content src="intro.xhtml"/>
-                </navPoint>
-                {chapter_items}
-              </navMap>
-            </ncx>
-            """
-
-            # Find and update nav.xhtml
-            nav_item = None
-            for item in book.items:
-                if isinstance(item, epub.EpubHtml) and item.file_name == 'nav.xhtml':
-                    nav_item = item
-                    break
+        chapter_num = int(chapter.id.split('_')[1])
+        try:
+            # Prioritize extracting title from HTML content, then the existing title
+            full_title = self._get_chapter_item_title(chapter) or chapter.title
+        except Exception as e:
+            self.logger.warning(f"Error processing chapter {chapter.id}: {e}")
+            full_title = chapter.title
 
-            title = book.title if hasattr(book, 'title') else "Novel EPUB"
+        chapter.title = full_title or f"Chương {chapter_num}"
 
-            if nav_item:
-                try:
-                    if hasattr(nav_item, 'content') and nav_item.content:
-                        soup = BeautifulSoup(nav_item.content, 'html.parser')
-                        links = soup.select('nav ol li a')
+    def _split_large_chapter(self, chapter, download_id=None):
+        """
+        Split a large chapter into smaller parts to avoid performance issues on e-readers
 
-                        for link in links:
-                            href = link.get('href', '')
-                            if href.startswith('chapter_') and href.endswith('.xhtml'):
-                                try:
-                                    chapter_num = int(href.split('_')[1].split('.')[0])
-                                    if chapter_num in chapter_titles and chapter_titles[chapter_num]:
-                                        link.string = chapter_titles[chapter_num]
-                                except:
-                                    pass
-
-                        nav_item.content = str(soup)
-                        if not is_temp:
-                            self._log('info', "Updated nav.xhtml with correct chapter titles", download_id)
-                    else:
-                        # Create new nav.xhtml content
-                        chapter_items = ""
-                        for num in sorted(chapter_titles.keys()):
-                            chapter_items += f"""
-                            <li>
-                              <a href="chapter_{num}.xhtml">{chapter_titles[num]}</a>
-                            </li>"""
-
-                        nav_item.content = nav_content.format(
-                            title=title,
-                            chapter_items=chapter_items
-                        )
-                        if not is_temp:
-                            self._log('info', "Created new nav.xhtml content", download_id)
-                except Exception as e:
-                    self._log('warning', f"Error updating nav.xhtml: {e}", download_id)
+        Returns:
+            List of the EpubHtml parts, empty if the chapter does not need splitting
+        """
+        try:
+            if not (hasattr(chapter, 'content') and chapter.content and len(chapter.content) > 100000):  # ~100KB
+                return []
+
+            chapter_num = int(chapter.id.split('_')[1])
+            if isinstance(chapter, ChapterHtml):
+                # Reuse the parsed chapter, copying the tags so the document stays intact
+                title_tag = chapter.document.root.find('h2')
+                title_tag = copy.copy(title_tag) if title_tag else None
+                paragraphs = chapter.document.copy_paragraphs()
             else:
-                self._log('warning', "nav.xhtml not found in EPUB", download_id)
-
-            # Find and update toc.ncx
-            toc_item = None
-            for item in book.items:
-                if item.file_name == 'toc.ncx':
-                    toc_item = item
-                    break
-
-            if toc_item:
-                try:
-                    if hasattr(toc_item, 'content') and toc_item.content:
-                        soup = BeautifulSoup(toc_item.content, 'xml')
-                        navpoints = soup.select('navPoint')
+                soup = BeautifulSoup(chapter.content, 'html.parser')
+
+                # Get body section
+                body = soup.find('body')
+                if not body:
+                    return []
+
+                title_tag = soup.find('h2')
+                paragraphs = body.find_all('p')
+
+            # Get title
+            title = title_tag.get_text() if title_tag else chapter.title
+
+            if len(paragraphs) < 20:  # Not enough paragraphs to split
+                return []
+
+            # Split into parts
+            parts = []
+            part_size = max(10, len(paragraphs) // 3)  # At least 10 paragraphs per part, max 3 parts
+
+            for i in range(0, len(paragraphs), part_size):
+                part_paragraphs = paragraphs[i:i+part_size]
+                if not part_paragraphs:
+                    continue
+
+                part_soup = BeautifulSoup("""
+                <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+                <head>
+                    <title></title>
+                    <meta charset="utf-8"/>
+                </head>
+                <body></body>
+                </html>
+                """, 'html.parser')
+
+                part_soup.title.string = title
+
+                # Add title to first part
+                if i == 0 and title_tag:
+                    part_soup.body.append(title_tag)
+                # Add subtitle to later parts
+                else:
+                    part_title = part_soup.new_tag('h3')
+                    part_title.string = f"{title} (continued)"
+                    part_soup.body.append(part_title)
+
+                # Add paragraphs
+                for p in part_paragraphs:
+                    part_soup.body.append(p)
+
+                # Add page break at end
+                page_break = part_soup.new_tag('div')
+                page_break['style'] = 'page-break-after: always; break-after: page;'
+                part_soup.body.append(page_break)
+
+                parts.append(str(part_soup))
+
+            if len(parts) <= 1:  # No need to split if only one part
+                return []
+
+            # Create sub-chapters
+            sub_chapters = []
+            for i, part_content in enumerate(parts):
+                # Name for part
+                if i == 0:
+                    sub_title = title
+                else:
+                    sub_title = f"{title} (part {i+1})"
 
-                        for navpoint in navpoints:
-                            nav_id = navpoint.get('id', '')
-                            if nav_id.startswith('chapter_'):
-                                try:
-                                    chapter_num = int(nav_id.split('_')[1])
-                                    if chapter_num in chapter_titles and chapter_titles[chapter_num]:
-                                        text_tag = navpoint.select_one('navLabel text')
-                                        if text_tag:
-                                            text_tag.string = chapter_titles[chapter_num]
-                                except:
-                                    pass
-
-                        toc_item.content = str(soup)
-                        if not is_temp:
-                            self._log('info', "Updated toc.ncx with correct chapter titles", download_id)
-                    else:
-                        # Create new toc.ncx content
-                        chapter_items = ""
-                        for num in sorted(chapter_titles.keys()):
-                            chapter_items += f"""
-                            <navPoint id="chapter_{num}">
-                              <navLabel>
-                                <text>{chapter_titles[num]}</text>
-                              </navLabel>
-                              <content src="chapter_{num}.xhtml"/>
-                            </navPoint>"""
-
-                        book_uuid = book.get_metadata('DC', 'identifier')[0][0] if hasattr(book, 'get_metadata') else str(uuid.uuid4())
-
-                        toc_item.content = toc_content.format(
-                            uuid=book_uuid,
-                            title=title,
-                            chapter_items=chapter_items
-                        )
-                        if not is_temp:
-                            self._log('info', "Created new toc.ncx content", download_id)
-                except Exception as e:
-                    self._log('warning', f"Error updating toc.ncx: {e}", download_id)
-            else:
-                self._log('warning', "toc.ncx not found in EPUB", download_id)
+                sub_chapter = epub.EpubHtml(title=sub_title, file_name=f"chapter_{chapter_num}_{i+1}.xhtml")
+                sub_chapter.id = f"chapter_{chapter_num}_{i+1}"
+                sub_chapter.content = part_content
+                sub_chapters.append(sub_chapter)
 
-            return True
+            self._log('info', f"Split chapter {chapter_num} into {len(parts)} parts", download_id)
+            return sub_chapters
         except Exception as e:
-            self._log('error', f"Error fixing navigation files: {e}", download_id)
-            traceback.print_exc()
-            return False
-
-    def _split_large_chapters(self, book, is_temp, download_id=None):
-        """Split large chapters into smaller parts to avoid performance issues on e-readers"""
-        try:
-            modified = False
-            large_chapters = []
-
-            # Find chapters that are too large
-            for item in book.items:
-                if isinstance(item, epub.EpubHtml) and hasattr(item, 'id') and item.id.startswith('chapter_'):
-                    if hasattr(item, 'content') and item.content and len(item.content) > 100000:  # ~100KB
-                        large_chapters.append(item)
-
-            if not large_chapters:
-                return False
-
-            if not is_temp:
-                self._log('info', f"Found {len(large_chapters)} large chapters that need to be split", download_id)
-
-            # Process each large chapter
-            for chapter in large_chapters:
-                try:
-                    chapter_num = int(chapter.id.split('_')[1])
-                    soup = BeautifulSoup(chapter.content, 'html.parser')
-
-                    # Get body section
-                    body = soup.find('body')
-                    if not body:
-                        continue
-
-                    # Get title
-                    title_tag = soup.find('h2')
-                    title = title_tag.get_text() if title_tag else chapter.title
-
-                    # Get all paragraphs
-                    paragraphs = body.find_all('p')
-
-                    if len(paragraphs) < 20:  # Not enough paragraphs to split
-                        continue
-
-                    # Split into parts
-                    parts = []
-                    part_size = max(10, len(paragraphs) // 3)  # At least 10 paragraphs per part, max 3 parts
-
-                    for i in range(0, len(paragraphs), part_size):
-                        part_paragraphs = paragraphs[i:i+part_size]
-                        if not part_paragraphs:
-                            continue
-
-                        part_soup = BeautifulSoup("""
-                        <html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
-                        <head>
-                            <title></title>
-                            <meta charset="utf-8"/>
-                        </head>
-                        <body></body>
-                        </html>
-                        """, 'html.parser')
-
-                        part_soup.title.string = title
-
-                        # Add title to first part
-                        if i == 0 and title_tag:
-                            part_soup.body.append(title_tag)
-                        # Add subtitle to later parts
-                        else:
-                            part_title = part_soup.new_tag('h3')
-                            part_title.string = f"{title} (continued)"
-                            part_soup.body.append(part_title)
-
-                        # Add paragraphs
-                        for p in part_paragraphs:
-                            part_soup.body.append(p)
-
-                        # Add page break at end
-                        page_break = part_soup.new_tag('div')
-                        page_break['style'] = 'page-break-after: always; break-after: page;'
-                        part_soup.body.append(page_break)
-
-                        parts.append(str(part_soup))
-
-                    if len(parts) <= 1:  # No need to split if only one part
-                        continue
-
-                    # Create sub-chapters
-                    for i, part_content in enumerate(parts):
-                        sub_id = f"chapter_{chapter_num}_{i+1}"
-                        sub_filename = f"chapter_{chapter_num}_{i+1}.xhtml"
-
-                        # Name for part
-                        if i == 0:
-                            sub_title = title
-                        else:
-                            sub_title = f"{title} (part {i+1})"
-
-                        sub_chapter = epub.EpubHtml(title=sub_title, file_name=sub_filename)
-                        sub_chapter.id = sub_id
-                        sub_chapter.content = part_content
-                        book.add_item(sub_chapter)
-
-                    # Replace original chapter in spine
-                    spine_index = book.spine.index(chapter) if chapter in book.spine else -1
-                    if spine_index > 0:
-                        # Remove original chapter
-                        book.spine.pop(spine_index)
-
-                        # Add sub-chapters at that position
-                        for i in range(len(parts)):
-                            sub_id = f"chapter_{chapter_num}_{i+1}"
-                            for item in book.items:
-                                if hasattr(item, 'id') and item.id == sub_id:
-                                    book.spine.insert(spine_index + i, item)
-
-                    # Mark as modified
-                    modified = True
-                    if not is_temp:
-                        self._log('info', f"Split chapter {chapter_num} into {len(parts)} parts", download_id)
+            self._log('warning', f"Error splitting chapter {chapter.id}: {e}", download_id)
+            return []
+
+    def _open_epub_writer(self, book, output_path, download_id=None):
+        """Start streaming an EPUB to output_path, chapters are then added with _write_chapter"""
+        self._log('info', f"Saving EPUB to: {output_path}", download_id)
+        return StreamingEpubWriter(output_path, book, logger=self.logger).open()
+
+    def _write_chapter(self, writer, chapter, download_id=None):
+        """
+        Write a chapter (and its parts if it is split) to the EPUB being streamed
+
+        Returns:
+            The chapter's index entry, None for a split part read back from an
+            existing EPUB (parts are made again from their chapter)
+        """
+        if getattr(chapter, 'id', None) and not re.fullmatch(r'chapter_\d+', chapter.id):
+            return None
 
-                except Exception as e:
-                    self._log('warning', f"Error splitting chapter {chapter.id}: {e}", download_id)
+        self._fix_chapter_item(chapter)
+        parts = self._split_large_chapter(chapter, download_id)
+        entry = writer.add_chapter(chapter)
+        entry.parts = [writer.add_chapter(part, is_part=True) for part in parts]
+        return entry
 
-            return modified
-        except Exception as e:
-            self._log('error', f"Error splitting chapters: {e}", download_id)
-            traceback.print_exc()
-            return False
+    def _finish_epub(self, writer, intro, download_id=None, modified=None):
+        """
+        Write the spine and table of contents of the streamed chapters and close the EPUB
 
-    def _save_epub(self, book, intro, chapters, output_path, is_temp, download_id=None):
-        """Save EPUB file"""
+        Args:
+            modified: UTC datetime written as the book's modified date (default: now)
+        """
         try:
-            if not is_temp:
-                self._log('info', f"Saving EPUB to: {output_path}", download_id)
-
-            # Clear old spine and create new one to ensure correct order
-            book.spine = [('nav', 'nav')]
-            book.spine.append(intro)
-
-            # Add chapters to spine in order
-            # Ensure all chapters have id attribute
-            for chapter in chapters:
-                if not hasattr(chapter, 'id') or not chapter.id:
-                    chapter_num = int(chapter.file_name.split('_')[1].split('.')[0])
-                    chapter.id = 'chapter_' + str(chapter_num)
-
-                # Ensure all chapters have appropriate titles
-                if not hasattr(chapter, 'title') or not chapter.title or chapter.title == "":
-                    chapter_num = int(chapter.id.split('_')[1])
-                    # Extract title from HTML content if possible
-                    if hasattr(chapter, 'content') and chapter.content:
-                        full_title = self._extract_title_from_html(chapter.content)
-                        if full_title:
-                            chapter.title = full_title
-                        else:
-                            chapter.title = f"Chương {chapter_num}"
-                    else:
-                        chapter.title = f"Chương {chapter_num}"
-
-            # Sort chapters by number
-            try:
-                sorted_chapters = sorted(chapters, key=lambda x: int(x.id.split('_')[1]))
-            except Exception as e:
-                self.logger.warning(f"Error sorting chapters: {e}")
-                # Fallback: sort by filename
-                sorted_chapters = sorted(chapters,
-                    key=lambda x: int(re.search(r'chapter_(\d+)', x.file_name).group(1))
-                        if re.search(r'chapter_(\d+)', x.file_name) else 0
-                )
+            book = writer.book
 
+            # Spine in chapter order, split chapters are read through their parts
+            sorted_chapters = sorted(writer.chapters, key=lambda x: int(x.id.split('_')[1]))
+            book.spine = [('nav', 'nav'), intro]
             for chapter in sorted_chapters:
-                book.spine.append(chapter)
+                book.spine.extend(chapter.parts or [chapter])
 
-            if not is_temp:
-                self._log('info', f"Total chapters in spine: {len(sorted_chapters)}", download_id)
+            self._log('info', f"Total chapters in spine: {len(sorted_chapters)}", download_id)
 
             # Create table of contents
             toc = [epub.Link('intro.xhtml', 'Introduction', 'intro')]
@@ -1354,46 +1561,104 @@ class NovelDownloader:
                 toc.append(epub.Link(chapter.file_name, chapter.title, chapter.id))
 
             book.toc = toc
+            self._log('info', f"Created table of contents with {len(toc)} items", download_id)
 
-            if not is_temp:
-                self._log('info', f"Created table of contents with {len(toc)} items", download_id)
-
-            # Fix navigation files before saving
-            self._fix_navigation_files(book, is_temp, download_id)
-
-            # Split large chapters
-            self._split_large_chapters(book, is_temp, download_id)
-
-            # Save EPUB
-            try:
-                epub.write_epub(output_path, book, {})
-
-                if not is_temp:
-                    self._log('info', f"Successfully saved EPUB to: {output_path}", download_id)
+            writer.close(modified=modified)
+            self._log('info', f"Successfully saved EPUB to: {writer.output_path}", download_id)
 
-                # Check file size
-                if not is_temp:
-                    file_size = os.path.getsize(output_path)
-                    self._log('info', f"File size: {round(file_size / (1024*1024), 2)} MB", download_id)
-
-                return True
-            except Exception as e:
-                self._log('error', f"Error writing EPUB file: {str(e)}", download_id)
-                traceback.print_exc()
-                raise
+            # Check file size
+            file_size = os.path.getsize(writer.output_path)
+            self._log('info', f"File size: {round(file_size / (1024*1024), 2)} MB", download_id)
+            return True
         except Exception as e:
             self._log('error', f"Error saving EPUB: {str(e)}", download_id)
             traceback.print_exc()
+            writer.abort()
             raise
 
-    def download_novel(self, url, cookie='', download_id=None):
-        """Main method to download a novel"""
+    def get_progress(self, download_id):
+        """Progress record of a running download (or of one still uploading), None if there is none"""
+        tracker = self._trackers.get(download_id)
+        return tracker.to_dict() if tracker else None
+
+    def _count_bytes(self, download_id, count):
+        """Add bytes fetched from the site to the progress of a download"""
+        tracker = self._trackers.get(download_id)
+        if tracker:
+            tracker.add_bytes(count)
+
+    def _publish_progress(self, download_id, tracker):
+        """Send the progress of a download with its next progress frame, returns the progress record"""
+        record = tracker.to_dict()
+        if self.progress and download_id:
+            self.progress.update(download_id, record)
+        return record
+
+    def _set_stage(self, download_id, tracker, stage, on_progress=None):
+        """Move a download to its next stage and publish its progress"""
+        tracker.set_stage(stage)
+        record = self._publish_progress(download_id, tracker)
+        if on_progress:
+            on_progress(record)
+
+    def _cancelled_result(self, download_id=None, new_chapter_count=0):
+        """Result of a download stopped by its cancel event"""
+        message = f"Đã hủy tải truyện sau {new_chapter_count} chương mới, các chương đã tải được giữ lại cho lần sau"
+        self._log('warning', f"🛑 {message}", download_id)
+        return {'success': False, 'cancelled': True, 'error': message}
+
+    def download_novel(self, url, cookie='', download_id=None, engine='threaded', on_uploaded=None, cancel_event=None,
+                       on_progress=None):
+        """
+        Main method to download a novel
+
+        Args:
+            url: Novel page URL
+            cookie: Access token for VIP chapters on Metruyenchu
+            download_id: Download ID used to tag logs and socket events
+            engine: Fetch engine, 'threaded' (requests + worker threads) or 'async' (asyncio + aiohttp)
+            on_uploaded: Callable receiving the Dropbox link (None if the upload failed) once the
+                         EPUB upload running in the background is done, only called when the
+                         result has 'upload_pending' set
+            cancel_event: threading.Event asking the download to stop; chapters fetched
+                          until then are kept in the chapter store for the next run
+            on_progress: Callable receiving the progress record (see DownloadProgress.to_dict)
+                         when the download changes stage and when it ends; the live record
+                         is available from get_progress and sent with the progress frames
+
+        Returns:
+            Result dict, 'upload_pending' tells whether the Dropbox upload is still running
+            and 'cancelled' whether the download stopped because of cancel_event
+        """
+        crawler = None
+        upload_pending = False
+        tracker = DownloadProgress()
+        if download_id:
+            self._trackers[download_id] = tracker
+
+        def uploaded(dropbox_url):
+            # The background EPUB upload is the last stage
+            self._set_stage(download_id, tracker, 'done', on_progress)
+            self._trackers.pop(download_id, None)
+            if on_uploaded:
+                on_uploaded(dropbox_url)
+
         try:
+            self._set_stage(download_id, tracker, 'info', on_progress)
             self._log('info', "🚀 Bắt đầu quá trình tải truyện...", download_id)
 
+            if engine == 'async':
+                self._log('info', "⚡ Sử dụng engine asyncio", download_id)
+                crawler = AsyncCrawlEngine(self, logger=self.logger)
+            elif engine != 'threaded':
+                raise ValueError(f"Unsupported fetch engine: {engine}")
+
             # Get novel information
             self._log('info', "📚 Đang lấy thông tin truyện...", download_id)
-            novel_info = self._get_novel_info(url, cookie, download_id)
+            if crawler:
+                novel_info = crawler.get_novel_info(url, cookie, download_id)
+            else:
+                novel_info = self._get_novel_info(url, cookie, download_id)
 
             # Check if chapter list is available
             if not novel_info['chapters_list']:
@@ -1403,6 +1668,8 @@ class NovelDownloader:
 
             total_chapters = len(novel_info['chapters_list'])
             self._log('info', f"📚 Tổng số chương: {total_chapters}", download_id)
+            if novel_info.get('not_modified'):
+                self._log('info', "♻️ Trang truyện và danh sách chương không thay đổi kể từ lần kiểm tra trước", download_id)
 
             # Get website type
             site_type = novel_info['site_type']
@@ -1417,135 +1684,159 @@ class NovelDownloader:
             temp_epub_path = os.path.join(self.temp_folder, safe_filename)
             final_epub_path = os.path.join(self.output_folder, safe_filename)
             
-            # Check if novel already exists and load it
-            existing_book, existing_intro, existing_chapters, max_existing_chapter = self._check_existing_novel(epub_filename, download_id)
-            
-            if existing_book and existing_intro and existing_chapters:
-                book = existing_book
-                intro = existing_intro
-                self._log('info', f"📕 Đã tìm thấy truyện đã tải trước đó với {len(existing_chapters)} chương", download_id)
-                self._log('info', f"📕 Sẽ tiếp tục tải từ chương {max_existing_chapter + 1}", download_id)
-            else:
-                # Create new EPUB
-                self._log('info', "📕 Đang tạo file EPUB mới...", download_id)
-                book, intro = self._create_epub(novel_info, download_id)
-                existing_chapters = []
-                max_existing_chapter = 0
-            
-            # Filter chapters to download (only chapters after the max existing chapter)
-            chapters_to_download = [chapter for chapter in sorted_chapters if chapter.get('index', 0) > max_existing_chapter]
+            # Chapters downloaded so far are kept in the novel's chapter store,
+            # the resume manifest lists them without reading their content
+            store, manifest = self._open_chapter_store(novel_info, safe_filename, url, download_id)
+            store.save_novel(novel_info)
+
+            if not manifest.count():
+                # Check if novel already exists as an EPUB made before the store, and import it
+                existing_book, existing_intro, existing_chapters, _ = self._check_existing_novel(epub_filename, download_id)
+                if existing_book and existing_chapters:
+                    self._import_epub_chapters(store, manifest, existing_chapters, download_id)
+                existing_book = existing_chapters = None
+
+            # Chapters to download: not stored yet (new, or failed in an earlier run)
+            # or stored with placeholder content because they were locked or missing
+            missing_indices = set(manifest.missing(chapter.get('index', 0) for chapter in sorted_chapters))
+            chapters_to_download = [chapter for chapter in sorted_chapters if chapter.get('index', 0) in missing_indices]
+            existing_chapter_count = manifest.count() - len(manifest.placeholders())
+            tracker.set_chapters(total_chapters, len(sorted_chapters) - len(chapters_to_download))
+            if manifest.count():
+                max_existing_chapter = manifest.max_index()
+                gaps = [index for index in missing_indices - manifest.indices() if index < max_existing_chapter]
+                placeholders = manifest.placeholders() & missing_indices
+                self._log('info', f"📕 Đã tìm thấy truyện đã tải trước đó với {existing_chapter_count} chương", download_id)
+                if gaps or placeholders:
+                    self._log('info', f"📕 Sẽ tải lại {len(gaps)} chương bị thiếu và {len(placeholders)} chương chưa có nội dung", download_id)
+                if max_existing_chapter < sorted_chapters[-1].get('index', 0):
+                    self._log('info', f"📕 Sẽ tiếp tục tải từ chương {max_existing_chapter + 1}", download_id)
             
+            if cancel_event is not None and cancel_event.is_set():
+                return self._cancelled_result(download_id)
+
             if not chapters_to_download:
                 self._log('info', "✅ Tất cả các chương đã có, không cần tải thêm", download_id)
                 # Still save EPUB to update navigation and optimize
-                all_chapters = existing_chapters
-                self._save_epub(book, intro, all_chapters, final_epub_path, False, download_id)
+                self._set_stage(download_id, tracker, 'assemble', on_progress)
+                chapter_count = self.export_epub(store, final_epub_path, novel_info, download_id, manifest)
                 
-                # Upload to Dropbox if available
-                dropbox_url = None
+                # Upload to Dropbox if available, in the background
                 if self.dropbox and self.dropbox.is_active:
-                    try:
-                        self._log('info', "☁️ Đang tải EPUB lên Dropbox...", download_id)
-                        dropbox_path = f"/Novel/{safe_filename}"
-                        dropbox_url = self.dropbox.upload_file(final_epub_path, dropbox_path)
-                        if dropbox_url:
-                            self._log('info', f"☁️ EPUB đã được tải lên Dropbox: {dropbox_url}", download_id)
-                            
-                            # Delete local file after successful upload
-                            self._delete_local_file(final_epub_path, download_id)
-                        else:
-                            self._log('warning', "⚠️ Không thể tạo URL tải xuống Dropbox", download_id)
-                    except Exception as e:
-                        self._log('warning', f"⚠️ Lỗi khi tải lên Dropbox: {str(e)}", download_id)
+                    self._queue_store_upload(store, manifest, download_id)
+                    # Before queueing: a quick upload moves the download to 'done' before this returns
+                    self._set_stage(download_id, tracker, 'upload', on_progress)
+                    self._queue_epub_upload(final_epub_path, safe_filename, download_id, uploaded)
+                    upload_pending = True
+                else:
+                    self._set_stage(download_id, tracker, 'done', on_progress)
                 
                 return {
                     'success': True,
                     'file_path': final_epub_path,
-                    'dropbox_url': dropbox_url,
+                    'dropbox_url': None,
+                    'upload_pending': upload_pending,
                     'title': novel_info['title'],
                     'author': novel_info['author'],
-                    'chapter_count': len(all_chapters),
+                    'chapter_count': chapter_count,
                     'message': "All chapters already exist"
                 }
             
             self._log('info', f"📥 Cần tải {len(chapters_to_download)} chương mới", download_id)
             
-            # Download chapters
-            new_chapters = []
-
-            for chapter_info in tqdm(chapters_to_download, desc="Đang tải chương"):
-                try:
-                    chapter_index = chapter_info.get('index')
-                    self._log('info', f"📥 Đang tải chương {chapter_index}: {chapter_info.get('name', 'Không tên')}", download_id)
-
-                    # Download chapter content
-                    chapter_data = self._get_chapter_content(url, chapter_info, site_type, novel_info['title'], cookie, download_id)
+            # Download chapters (fetched concurrently, stored in chapter order)
+            new_chapter_count = 0
+            pending_records = []  # Chapters downloaded since the last checkpoint
+            failed_chapters = []
+            saved = None  # Set once the last queued checkpoint is saved
+            cancelled = False
+            self._set_stage(download_id, tracker, 'fetch', on_progress)
+            if crawler:
+                chapter_stream = crawler.fetch_chapters(url, chapters_to_download, site_type, novel_info['title'], cookie, download_id)
+            else:
+                chapter_stream = self._fetch_chapters(url, chapters_to_download, site_type, novel_info['title'], cookie, download_id)
 
-                    # Add chapter to EPUB
-                    chapter = self._add_chapter_to_epub(book, chapter_data, chapter_index, download_id)
-                    new_chapters.append(chapter)
+            try:
+                for chapter_info, chapter_data in tqdm(chapter_stream, total=len(chapters_to_download), desc="Đang tải chương"):
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
 
-                    # Save checkpoint every 50 chapters
-                    if len(new_chapters) % self.checkpoint_interval == 0:
-                        all_chapters = existing_chapters + new_chapters
-                        self.save_queue.put((book, intro, all_chapters, temp_epub_path, download_id))
-                        self._log('info', f"💾 Đã lên lịch lưu điểm kiểm tra sau khi tải {len(new_chapters)} chương", download_id)
+                    chapter_index = chapter_info.get('index')
+                    chapter_failed = chapter_data is None
+                    try:
+                        if chapter_data is None:
+                            failed_chapters.append(chapter_index)
+                            raise Exception(f"Bỏ qua chương {chapter_index} sau {self.chapter_retries + 1} lần thử")
 
-                    # Short delay between requests to avoid being blocked
-                    delay_time = random.uniform(0.5, 1)
-                    self._delay(delay_time, download_id)
+                        # Add chapter to the store
+                        pending_records.append(self._chapter_record(chapter_data, chapter_index, download_id))
+                        new_chapter_count += 1
 
-                except Exception as e:
-                    self._log('error', f"Lỗi khi tải chương {chapter_index}: {str(e)}", download_id)
-                    traceback.print_exc()
+                        # Save checkpoint every 50 chapters
+                        if new_chapter_count % self.checkpoint_interval == 0:
+                            saved = self._queue_checkpoint(store, manifest, pending_records, existing_chapter_count + new_chapter_count, download_id)
+                            pending_records = []
+                            self._log('info', f"💾 Đã lên lịch lưu điểm kiểm tra sau khi tải {new_chapter_count} chương", download_id)
 
-                    # Save current state if error occurs
-                    try:
-                        all_chapters = existing_chapters + new_chapters
-                        self.save_queue.put((book, intro, all_chapters, temp_epub_path, download_id))
-                        self.save_queue.join()
-                        self._log('warning', f"💾 Đã lưu trạng thái sau khi tải {len(new_chapters)} chương do lỗi", download_id)
-                    except Exception as save_err:
-                        self._log('error', f"Lỗi khi lưu trạng thái sau khi gặp lỗi: {str(save_err)}", download_id)
+                    except Exception as e:
+                        chapter_failed = True
+                        self._log('error', f"Lỗi khi tải chương {chapter_index}: {str(e)}", download_id)
 
-            # Combine existing and new chapters
-            all_chapters = existing_chapters + new_chapters
+                        # Save current state if error occurs
+                        try:
+                            saved = self._queue_checkpoint(store, manifest, pending_records, existing_chapter_count + new_chapter_count, download_id)
+                            pending_records = []
+                            saved.wait()
+                            self._log('warning', f"💾 Đã lưu trạng thái sau khi tải {new_chapter_count} chương do lỗi", download_id)
+                        except Exception as save_err:
+                            self._log('error', f"Lỗi khi lưu trạng thái sau khi gặp lỗi: {str(save_err)}", download_id)
+
+                    tracker.chapter_done(failed=chapter_failed)
+                    self._publish_progress(download_id, tracker)
+            finally:
+                # Stop the fetches still running or queued
+                chapter_stream.close()
+                # Store the last chapters too, the EPUB is built from the store
+                if pending_records:
+                    saved = self._queue_checkpoint(store, manifest, pending_records, existing_chapter_count + new_chapter_count, download_id)
+                if saved:
+                    saved.wait()
+
+            if cancelled:
+                return self._cancelled_result(download_id, new_chapter_count)
+
+            if failed_chapters:
+                self._log('warning', f"⚠️ Không tải được {len(failed_chapters)} chương: {', '.join(str(i) for i in failed_chapters)}", download_id)
 
             # Save final EPUB
             self._log('info', "🏁 Tải xuống hoàn tất, đang lưu EPUB cuối cùng...", download_id)
-            self._save_epub(book, intro, all_chapters, final_epub_path, False, download_id)
+            self._set_stage(download_id, tracker, 'assemble', on_progress)
+            chapter_count = self.export_epub(store, final_epub_path, novel_info, download_id, manifest)
 
-            # Upload to Dropbox if available
-            dropbox_url = None
+            # Upload to Dropbox if available, in the background (temp files are deleted once it is done)
             if self.dropbox and self.dropbox.is_active:
-                try:
-                    self._log('info', "☁️ Đang tải EPUB lên Dropbox...", download_id)
-                    dropbox_path = f"/Novel/{safe_filename}"
-                    dropbox_url = self.dropbox.upload_file(final_epub_path, dropbox_path)
-                    if dropbox_url:
-                        self._log('info', f"☁️ EPUB đã được tải lên Dropbox: {dropbox_url}", download_id)
-                        
-                        # Delete local file after successful upload
-                        self._delete_local_file(final_epub_path, download_id)
-                        
-                        # Also delete temp files
-                        self._delete_local_file(temp_epub_path, download_id)
-                    else:
-                        self._log('warning', "⚠️ Không thể tạo URL tải xuống Dropbox", download_id)
-                except Exception as e:
-                    self._log('warning', f"⚠️ Lỗi khi tải lên Dropbox: {str(e)}", download_id)
+                self._queue_store_upload(store, manifest, download_id)
+                # Before queueing: a quick upload moves the download to 'done' before this returns
+                self._set_stage(download_id, tracker, 'upload', on_progress)
+                self._queue_epub_upload(final_epub_path, safe_filename, download_id, uploaded,
+                                        extra_files=(temp_epub_path,))
+                upload_pending = True
             else:
                 self._log('info', "⚠️ Tích hợp Dropbox không hoạt động, file chỉ được lưu cục bộ", download_id)
+                self._set_stage(download_id, tracker, 'done', on_progress)
 
+            self._log_connection_stats(download_id)
             self._log('info', f"🎉🎉🎉 Tải xuống hoàn tất! Truyện đã được lưu tại: {final_epub_path}", download_id)
 
             return {
                 'success': True,
                 'file_path': final_epub_path,
-                'dropbox_url': dropbox_url,
+                'dropbox_url': None,
+                'upload_pending': upload_pending,
                 'title': novel_info['title'],
                 'author': novel_info['author'],
-                'chapter_count': len(all_chapters)
+                'chapter_count': chapter_count
             }
         except Exception as e:
             error_msg = f"Lỗi không xử lý được trong quá trình tải xuống: {str(e)}"
@@ -1553,5 +1844,10 @@ class NovelDownloader:
             traceback.print_exc()
             return {'success': False, 'error': error_msg}
         finally:
-            # Ensure threads exit cleanly
-            self.exit_event.set()
+            if crawler:
+                crawler.close()
+            if not upload_pending:
+                # Failed or cancelled downloads keep the progress they reached
+                self._trackers.pop(download_id, None)
+                if on_progress and tracker.stage != 'done':
+                    on_progress(tracker.to_dict())
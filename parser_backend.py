@@ -0,0 +1,100 @@
+import os
+import sys
+import logging
+
+# Tree builders BeautifulSoup can use, fastest first
+SUPPORTED_PARSERS = ['lxml', 'html.parser']
+
+def _detect_default_parser():
+    """Use lxml (C speed) when it is installed, the pure-Python html.parser otherwise"""
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+def get_parser(name=None):
+    """
+    Resolve the parser backend used for full pages
+
+    Args:
+        name: Requested backend (default: HTML_PARSER environment variable or lxml if installed)
+
+    Returns:
+        A BeautifulSoup tree builder name, html.parser if the requested one is unavailable
+    """
+    name = name or os.getenv('HTML_PARSER') or _detect_default_parser()
+    if name not in SUPPORTED_PARSERS:
+        logging.getLogger('parser_backend').warning(f"Unknown HTML parser '{name}', using html.parser")
+        return 'html.parser'
+    if name == 'lxml' and _detect_default_parser() != 'lxml':
+        logging.getLogger('parser_backend').warning("lxml is not installed, using html.parser")
+        return 'html.parser'
+    return name
+
+def _chapter_signature(chapter_data):
+    """Comparable form of parsed chapter data"""
+    document = chapter_data.get('document')
+    return {
+        'title': chapter_data.get('title'),
+        'content': chapter_data.get('content'),
+        'html': document.html if document is not None else chapter_data.get('content_html')
+    }
+
+def compare_parsers(downloader, pages, site_type, parsers=None):
+    """
+    Check that every parser backend extracts the same chapters from a corpus of pages
+
+    Args:
+        downloader: NovelDownloader instance whose chapter parsers are used
+        pages: Iterable of (name, html) chapter pages
+        site_type: 'metruyenchu' or 'tangthuvien'
+        parsers: Backends to compare, the first one is the reference
+                 (default: html.parser against every other installed backend)
+
+    Returns:
+        List of (name, field, parser, value) for every field that differs from the first backend
+    """
+    parsers = parsers or ['html.parser'] + [p for p in SUPPORTED_PARSERS if p != 'html.parser' and get_parser(p) == p]
+    parse_function = {
+        'metruyenchu': downloader._parse_mtc_chapter_content,
+        'tangthuvien': downloader._parse_ttv_chapter_content
+    }[site_type]
+
+    original_parser = downloader.html_parser
+    mismatches = []
+    try:
+        for index, (name, html) in enumerate(pages, 1):
+            results = {}
+            for parser in parsers:
+                downloader.html_parser = parser
+                results[parser] = _chapter_signature(parse_function(html, index))
+
+            reference = results[parsers[0]]
+            for parser in parsers[1:]:
+                for field, value in results[parser].items():
+                    if value != reference[field]:
+                        mismatches.append((name, field, parser, value))
+    finally:
+        downloader.html_parser = original_parser
+    return mismatches
+
+if __name__ == '__main__':
+    # Usage: python parser_backend.py <metruyenchu|tangthuvien> page1.html [page2.html ...]
+    from novel_downloader import NovelDownloader
+
+    if len(sys.argv) < 3:
+        print("Usage: python parser_backend.py <metruyenchu|tangthuvien> page1.html [page2.html ...]")
+        sys.exit(2)
+
+    logging.basicConfig(level=logging.WARNING)
+    pages = []
+    for path in sys.argv[2:]:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append((path, f.read()))
+
+    mismatches = compare_parsers(NovelDownloader(logger=logging.getLogger('parser_check')), pages, sys.argv[1])
+    for name, field, parser, _ in mismatches:
+        print(f"MISMATCH {name}: '{field}' differs with {parser}")
+    print(f"Checked {len(pages)} pages, {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import threading
+
+class ProgressChannel:
+    """
+    Batched Socket.IO events of the running downloads
+
+    Log lines and progress updates are not emitted one by one: they are kept
+    per download and sent every `interval` seconds as one 'progress_batch'
+    frame with the new lines and the latest progress. Frames and download
+    events go to the room of their download only, so each client receives
+    the downloads it subscribed to. The number of frames grows with the
+    running downloads, not with their log lines. When more lines come in
+    during one interval than a frame holds, the oldest are dropped from the
+    frame (their count is sent along, clients can read them from
+    /api/status with `since`).
+    """
+
+    def __init__(self, socket, logger=None, interval=None, max_lines=None):
+        """
+        Args:
+            socket: SocketIO server used for the emits
+            interval: Seconds between two frames of a download (default: PROGRESS_INTERVAL or 1)
+            max_lines: Log lines per frame (default: PROGRESS_FRAME_LINES or 50)
+        """
+        self.logger = logger or logging.getLogger('progress_channel')
+        self.socket = socket
+        self.interval = interval if interval is not None else float(os.getenv('PROGRESS_INTERVAL', 1))
+        self.max_lines = max_lines if max_lines is not None else int(os.getenv('PROGRESS_FRAME_LINES', 50))
+
+        self._pending = {}  # download id -> {'lines', 'dropped', 'progress'}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @staticmethod
+    def room(download_id):
+        """Socket.IO room of a download"""
+        return f"download:{download_id}"
+
+    def _frame(self, download_id):
+        """Pending frame of a download (called with the lock held)"""
+        frame = self._pending.get(download_id)
+        if frame is None:
+            frame = self._pending[download_id] = {'lines': [], 'dropped': 0, 'progress': None}
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+        return frame
+
+    def log(self, download_id, level, message, source=None):
+        """Queue a log line for the next frame of a download"""
+        with self._lock:
+            frame = self._frame(download_id)
+            frame['lines'].append({
+                'level': level,
+                'message': message,
+                'timestamp': time.time(),
+                'source': source
+            })
+            if len(frame['lines']) > self.max_lines:
+                del frame['lines'][0]
+                frame['dropped'] += 1
+
+    def update(self, download_id, progress):
+        """Set the progress sent with the next frame of a download, replacing the previous one"""
+        with self._lock:
+            self._frame(download_id)['progress'] = progress
+
+    def event(self, download_id, name, data):
+        """
+        Emit a download event (completed, failed, ...) to the room of the download right away
+
+        The lines waiting for the next frame are sent first, so clients get them before the event.
+        """
+        self.flush(download_id)
+        self.socket.emit(name, data, to=self.room(download_id))
+
+    def flush(self, download_id=None):
+        """Send the pending frame of one download, or of every download"""
+        with self._lock:
+            if download_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                frame = self._pending.pop(download_id, None)
+                pending = {download_id: frame} if frame else {}
+
+        for frame_id, frame in pending.items():
+            try:
+                self.socket.emit('progress_batch', dict(frame, download_id=frame_id), to=self.room(frame_id))
+            except Exception as e:
+                self.logger.error(f"Error emitting progress of {frame_id}: {str(e)}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+            with self._lock:
+                if not self._pending:
+                    # Nothing left to send, the next log line starts the loop again
+                    self._flusher = None
+                    return
@@ -0,0 +1,144 @@
+import os
+import time
+import random
+import threading
+import email.utils
+from urllib.parse import urlparse
+
+# HTTP status codes that mean the server wants us to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header
+
+    Args:
+        value: Header value, either a number of seconds or an HTTP date
+
+    Returns:
+        Number of seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with jitter: half of the exponential step is randomized"""
+    step = min(cap, base * (2 ** attempt))
+    return step / 2 + random.uniform(0, step / 2)
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `burst` requests
+
+    The rate adapts to the server (AIMD): it is halved whenever the server throttles us
+    or drops the connection, and grows by a small step after each fast, successful
+    response, staying between min_rate and max_rate.
+    """
+
+    def __init__(self, rate, burst, min_rate=None, max_rate=None, fast_latency=2.0):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.min_rate = float(min_rate) if min_rate else self.rate / 10
+        self.max_rate = float(max_rate) if max_rate else self.rate
+        # Responses faster than this (seconds) let the rate increase
+        self.fast_latency = fast_latency
+        self.increase_step = self.min_rate
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Add the tokens earned since the last update (nothing is earned while paused)"""
+        start = max(self.updated_at, self.paused_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        """
+        Take one token
+
+        The bucket may go into debt, so callers are served in the order they reserved.
+
+        Returns:
+            Number of seconds the caller must wait before sending its request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait_time = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait_time, self.paused_until - now)
+
+    def acquire(self):
+        """Block until a token is available"""
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def on_throttled(self, retry_after=None):
+        """Multiplicative decrease after a 429/503 or a dropped connection"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            # Drop any saved-up burst so we don't hammer the server when it recovers
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+    def on_success(self, latency):
+        """Additive increase after a fast, successful response"""
+        if latency > self.fast_latency:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+class SiteRateLimiter:
+    """Process-wide registry of token buckets, one per site, shared by all jobs"""
+
+    # Starting requests per second, burst size and adaptive ceiling for each site
+    SITE_LIMITS = {
+        'metruyenchu': (float(os.getenv('MTC_RATE_LIMIT', 2)), int(os.getenv('MTC_RATE_BURST', 4)),
+                        float(os.getenv('MTC_RATE_MAX', 8))),
+        'tangthuvien': (float(os.getenv('TTV_RATE_LIMIT', 2)), int(os.getenv('TTV_RATE_BURST', 4)),
+                        float(os.getenv('TTV_RATE_MAX', 8)))
+    }
+    DEFAULT_LIMIT = (float(os.getenv('DEFAULT_RATE_LIMIT', 5)), int(os.getenv('DEFAULT_RATE_BURST', 10)),
+                     float(os.getenv('DEFAULT_RATE_MAX', 10)))
+
+    _buckets = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def site_key(cls, url):
+        """Map a URL to the site whose budget it consumes (backend API hosts share the site budget)"""
+        host = urlparse(url).netloc.lower()
+        if 'metruyencv.com' in host:
+            return 'metruyenchu'
+        elif 'tangthuvien.net' in host:
+            return 'tangthuvien'
+        return host
+
+    @classmethod
+    def get_bucket(cls, url):
+        """Return the shared token bucket for the site of the given URL"""
+        key = cls.site_key(url)
+        with cls._lock:
+            bucket = cls._buckets.get(key)
+            if bucket is None:
+                rate, burst, max_rate = cls.SITE_LIMITS.get(key, cls.DEFAULT_LIMIT)
+                bucket = TokenBucket(rate, burst, max_rate=max(rate, max_rate))
+                cls._buckets[key] = bucket
+            return bucket
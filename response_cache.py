@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    Persistent, size-bounded cache of HTTP response bodies keyed by URL
+
+    Each entry is stored as one JSON file. Entries are evicted least recently used
+    first once the cache grows past max_bytes; file modification times keep the
+    LRU order across restarts.
+    """
+
+    # Seconds each kind of resource stays fresh (None = never expires)
+    DEFAULT_TTLS = {
+        'chapter': None,
+        'chapter_list': int(os.getenv('HTTP_CACHE_LIST_TTL', 600)),
+        'novel_info': int(os.getenv('HTTP_CACHE_LIST_TTL', 600))
+    }
+
+    def __init__(self, cache_dir, max_bytes=None, ttls=None, logger=None):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir: Directory holding the cache entries
+            max_bytes: Maximum total size of the cache
+                       (default: HTTP_CACHE_MAX_MB environment variable or 500 MB)
+            ttls: Optional overrides of DEFAULT_TTLS
+        """
+        self.logger = logger or logging.getLogger('response_cache')
+        self.cache_dir = cache_dir
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('HTTP_CACHE_MAX_MB', 500)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.is_active = max_bytes > 0
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self.total_bytes = 0
+        self.entries = OrderedDict()  # key -> size, least recently used first
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the LRU index from the files on disk"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+            except OSError:
+                continue
+
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+        if self.entries:
+            self.logger.info(f"Loaded HTTP cache index: {len(self.entries)} entries, {self.total_bytes / (1024*1024):.2f} MB")
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def make_key(self, url, variant=''):
+        """Build the cache key for a URL and an auth variant (e.g. a hash of the access token)"""
+        return hashlib.sha256(f"{url}|{variant}".encode('utf-8')).hexdigest()
+
+    def _read_entry(self, key):
+        """Read an entry from disk, None if missing or unreadable"""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove(self, key):
+        """Remove an entry from the index and from disk (caller holds the lock)"""
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def lookup(self, url, variant=''):
+        """
+        Look up the cached entry for a URL, fresh or not
+
+        Expired entries are still returned so their validators (ETag / Last-Modified)
+        can be used to revalidate them with a conditional request.
+
+        Returns:
+            Tuple of (entry, is_fresh), entry is None on a miss
+        """
+        if not self.is_active:
+            return None, False
+
+        key = self.make_key(url, variant)
+        with self._lock:
+            entry = self._read_entry(key) if key in self.entries else None
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            # Mark as most recently used
+            self.entries.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+            is_fresh = not entry.get('expires_at') or entry['expires_at'] >= time.time()
+            if is_fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry, is_fresh
+
+    def get(self, url, variant=''):
+        """
+        Get a fresh cached body for a URL
+
+        Returns:
+            The cached body (text or decoded JSON), or None on a miss or an expired entry
+        """
+        entry, is_fresh = self.lookup(url, variant)
+        return entry['body'] if entry is not None and is_fresh else None
+
+    def _write_entry(self, key, entry):
+        """Write an entry to disk and into the index, evicting old entries if the cache is full"""
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            # Write atomically so readers never see a partial entry
+            tmp_path = self._path(key) + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                self.logger.warning(f"Error writing HTTP cache entry for {entry.get('url')}: {e}")
+                return
+
+            old_size = self.entries.pop(key, None)
+            if old_size is not None:
+                self.total_bytes -= old_size
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+
+            while self.total_bytes > self.max_bytes and self.entries:
+                oldest_key = next(iter(self.entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def put(self, url, body, kind, variant='', etag=None, last_modified=None):
+        """Store a response body and its validators for a URL"""
+        if not self.is_active:
+            return
+
+        ttl = self.ttls.get(kind)
+        now = time.time()
+        self._write_entry(self.make_key(url, variant), {
+            'url': url,
+            'kind': kind,
+            'fetched_at': now,
+            'expires_at': now + ttl if ttl else None,
+            'etag': etag,
+            'last_modified': last_modified,
+            'body': body
+        })
+
+    def mark_revalidated(self, url, variant=''):
+        """Restart the TTL of an entry after the server answered 304 Not Modified"""
+        if not self.is_active:
+            return
+
+        key = self.make_key(url, variant)
+        with self._lock:
+            entry = self._read_entry(key) if key in self.entries else None
+            self.revalidations += 1
+        if entry is None:
+            return
+
+        ttl = self.ttls.get(entry.get('kind'))
+        now = time.time()
+        entry['fetched_at'] = now
+        entry['expires_at'] = now + ttl if ttl else None
+        self._write_entry(key, entry)
+
+    def get_parsed(self, url, variant=''):
+        """Get the parsed form attached to a cached body, None if there is none"""
+        if not self.is_active:
+            return None
+
+        key = self.make_key(url, variant)
+        with self._lock:
+            entry = self._read_entry(key) if key in self.entries else None
+        return entry.get('parsed') if entry else None
+
+    def set_parsed(self, url, parsed, variant=''):
+        """Attach the parsed form of a cached body, so unchanged pages need not be parsed again"""
+        if not self.is_active:
+            return
+
+        key = self.make_key(url, variant)
+        with self._lock:
+            entry = self._read_entry(key) if key in self.entries else None
+        if entry is None:
+            return
+
+        entry['parsed'] = parsed
+        self._write_entry(key, entry)
+
+    def invalidate(self, url, variant=''):
+        """Drop the cached entry for a URL"""
+        key = self.make_key(url, variant)
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def get_stats(self):
+        """Get cache hit/miss counters and size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revalidations': self.revalidations,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes
+            }
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import uuid
+import logging
+from chapter_store import ChapterStore
+
+class ResumeManifest:
+    """
+    Small JSON sidecar describing what has been downloaded for a novel
+
+    Lists the index, title and content hash of every stored chapter (and which
+    ones only hold the placeholder of a locked or missing chapter) together
+    with the book UUID and the source URL. It is kept next to the chapter store
+    locally and in Dropbox, so a job can decide which chapters to fetch without
+    opening an EPUB or downloading the chapter bodies, which are only needed
+    when the book is assembled.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, site=None, book_id=None, source_url=None, book_uuid=None, logger=None):
+        """
+        Args:
+            path: Local path of the manifest file
+            site: Site type of the novel
+            book_id: Book id on the site (same key as the chapter store)
+            source_url: Novel page URL
+            book_uuid: Identifier of the EPUB, kept stable across updates (default: a new one)
+        """
+        self.logger = logger or logging.getLogger('resume_manifest')
+        self.path = path
+        self.site = site
+        self.book_id = str(book_id) if book_id is not None else None
+        self.source_url = source_url
+        self.book_uuid = book_uuid or str(uuid.uuid4())
+        self.updated_at = None
+        self.chapters = {}  # chapter index -> {'title', 'hash', 'placeholder'}
+
+    @classmethod
+    def load(cls, path, logger=None):
+        """
+        Read a manifest file
+
+        Returns:
+            ResumeManifest, or None if the file is missing or unreadable
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            (logger or logging.getLogger('resume_manifest')).warning(f"Ignoring unreadable manifest {path}: {e}")
+            return None
+
+        manifest = cls(path, data.get('site'), data.get('book_id'), data.get('source_url'),
+                       data.get('book_uuid'), logger=logger)
+        manifest.updated_at = data.get('updated_at')
+        manifest.add_chapters(data.get('chapters', []))
+        return manifest
+
+    def matches(self, site, book_id):
+        """Whether the manifest describes the given novel"""
+        return self.site == site and self.book_id == str(book_id)
+
+    def add_chapters(self, chapters):
+        """
+        Record stored chapters
+
+        Args:
+            chapters: Dicts with 'index', 'title', 'content_hash' (or the chapter 'html')
+                      and optionally 'placeholder'
+        """
+        for chapter in chapters:
+            content_hash = chapter.get('content_hash') or chapter.get('hash') or ChapterStore.content_hash(chapter['html'])
+            self.chapters[int(chapter['index'])] = {
+                'title': chapter['title'],
+                'hash': content_hash,
+                'placeholder': bool(chapter.get('placeholder'))
+            }
+
+    def reset(self):
+        """Forget the listed chapters, keeping the book identity"""
+        self.chapters = {}
+
+    def count(self):
+        return len(self.chapters)
+
+    def max_index(self):
+        """Highest listed chapter index, 0 if there is none"""
+        return max(self.chapters) if self.chapters else 0
+
+    def indices(self):
+        return set(self.chapters)
+
+    def placeholders(self):
+        """Indices of the chapters stored with placeholder content"""
+        return {index for index, entry in self.chapters.items() if entry['placeholder']}
+
+    def missing(self, indices):
+        """
+        Chapters of a chapter list that still have to be fetched
+
+        Args:
+            indices: Chapter indices of the current chapter list
+
+        Returns:
+            Sorted indices that are not stored or only hold placeholder content
+        """
+        complete = self.indices() - self.placeholders()
+        return sorted(index for index in set(indices) if index not in complete)
+
+    def to_dict(self):
+        chapters = []
+        for index, entry in sorted(self.chapters.items()):
+            chapter = {'index': index, 'title': entry['title'], 'hash': entry['hash']}
+            if entry['placeholder']:
+                chapter['placeholder'] = True
+            chapters.append(chapter)
+
+        return {
+            'version': self.VERSION,
+            'site': self.site,
+            'book_id': self.book_id,
+            'source_url': self.source_url,
+            'book_uuid': self.book_uuid,
+            'updated_at': self.updated_at,
+            'chapters': chapters
+        }
+
+    def save(self):
+        """Write the manifest atomically to its path"""
+        self.updated_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        return self.path
@@ -0,0 +1,39 @@
+import os
+import json
+import glob
+
+import pytest
+from bs4 import BeautifulSoup
+
+from chapter_document import make_fragment, optimize_for_ereader
+
+# Expected outputs were recorded from the multi-pass optimize_for_ereader that the
+# single traversal replaced; the optimizer must keep producing them byte for byte
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'optimizer')
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def optimize(html, parser='html.parser'):
+    soup = BeautifulSoup(html, parser)
+    return str(optimize_for_ereader(make_fragment(soup.select_one('.chapter-content'))))
+
+def fixture_names():
+    return [os.path.basename(path) for path in sorted(glob.glob(os.path.join(FIXTURES, 'input', '*.html')))]
+
+@pytest.mark.parametrize('parser', ['html.parser', 'lxml'])
+@pytest.mark.parametrize('name', fixture_names())
+def test_optimizer_output_unchanged(name, parser):
+    if parser == 'lxml':
+        pytest.importorskip('lxml')
+    html = read(os.path.join(FIXTURES, 'input', name))
+    expected = read(os.path.join(FIXTURES, 'expected', name)).rstrip('\n')
+
+    assert optimize(html, parser) == expected
+
+def test_optimizer_output_unchanged_on_random_trees():
+    cases = json.loads(read(os.path.join(FIXTURES, 'random_trees.json')))
+
+    mismatches = [case['html'] for case in cases if optimize(case['html']) != case['expected']]
+    assert not mismatches, f"{len(mismatches)} of {len(cases)} trees changed, first: {mismatches[0]}"
@@ -0,0 +1,67 @@
+import time
+import logging
+import zipfile
+
+import pytest
+
+from chapter_store import ChapterStore
+from dropbox_storage import dropbox_content_hash
+from epub_writer import ZIP_DATE_TIME
+from novel_downloader import NovelDownloader
+from response_cache import ResponseCache
+from resume_manifest import ResumeManifest
+
+NOVEL_INFO = {
+    'title': 'Truyện Thử',
+    'author': 'Tác Giả A',
+    'cover_url': None,
+    'synopsis': 'Dòng 1\nDòng 2',
+    'site_type': 'metruyenchu',
+    'book_id': '42',
+    'url': 'https://metruyencv.com/truyen/thu'
+}
+
+def chapter(index, text='Nội dung'):
+    return {'index': index, 'title': f"Chương {index}: Tiêu đề {index}",
+            'html': f"<h2>Chương {index}: Tiêu đề {index}</h2><p>{text} của chương {index}.</p>"}
+
+@pytest.fixture
+def downloader(tmp_path):
+    return NovelDownloader(logger=logging.getLogger('test_epub_export'),
+                           response_cache=ResponseCache(str(tmp_path / 'cache'), max_bytes=0))
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChapterStore(str(tmp_path / 'novel.db'), 'metruyenchu', '42')
+    store.save_novel(NOVEL_INFO)
+    store.put_chapters([chapter(index) for index in range(1, 6)])
+    return store
+
+def export(downloader, store, tmp_path, name):
+    manifest = ResumeManifest.load(str(tmp_path / 'novel.manifest.json')) or \
+        ResumeManifest(str(tmp_path / 'novel.manifest.json'), 'metruyenchu', '42')
+    path = str(tmp_path / name)
+    downloader.export_epub(store, path, manifest=manifest)
+    return path
+
+def test_export_of_unchanged_chapters_is_byte_identical(downloader, store, tmp_path):
+    first = export(downloader, store, tmp_path, 'first.epub')
+    # A later run refetches chapters whose content did not change
+    time.sleep(1.1)
+    store.put_chapters([chapter(2), chapter(4)])
+    second = export(downloader, store, tmp_path, 'second.epub')
+
+    assert dropbox_content_hash(first) == dropbox_content_hash(second)
+    assert {info.date_time for info in zipfile.ZipFile(second).infolist()} == {ZIP_DATE_TIME}
+
+def test_export_changes_with_chapter_content(downloader, store, tmp_path):
+    first = export(downloader, store, tmp_path, 'first.epub')
+    time.sleep(1.1)
+    store.put_chapters([chapter(3, 'Nội dung mới')])
+    second = export(downloader, store, tmp_path, 'second.epub')
+
+    assert dropbox_content_hash(first) != dropbox_content_hash(second)
+    # The modified date follows the newest chapter
+    opf = zipfile.ZipFile(second).read('EPUB/content.opf').decode('utf-8')
+    modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(max(row['fetched_at'] for row in store.iter_chapters())))
+    assert f'<meta property="dcterms:modified">{modified}</meta>' in opf
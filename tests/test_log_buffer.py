@@ -0,0 +1,50 @@
+import logging
+
+from log_buffer import DownloadLogHandler
+
+def make_logger(handler):
+    logger = logging.getLogger('test_log_buffer')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+def test_since_reads_flag_evicted_lines():
+    handler = DownloadLogHandler(capacity=3, per_download=3, max_downloads=10)
+    logger = make_logger(handler)
+
+    logger.info('line 1', extra={'download_id': 'a'})
+    _, cursor, truncated = handler.get_download_logs('a', since=0)
+    assert not truncated
+
+    for i in range(2, 7):
+        logger.info(f"line {i}", extra={'download_id': 'a'})
+
+    # Lines 2 and 3 were pushed out before the client read them
+    lines, seq, truncated = handler.get_download_logs('a', since=cursor)
+    assert lines == ['line 4', 'line 5', 'line 6']
+    assert truncated
+    lines, _, truncated = handler.get_logs(since=cursor)
+    assert lines == ['line 4', 'line 5', 'line 6']
+    assert truncated
+
+    # A client keeping up sees no gap
+    logger.info('line 7', extra={'download_id': 'a'})
+    lines, _, truncated = handler.get_download_logs('a', since=seq)
+    assert lines == ['line 7']
+    assert not truncated
+
+def test_since_reads_flag_lines_left_out_by_n():
+    handler = DownloadLogHandler(capacity=10, per_download=10, max_downloads=10)
+    logger = make_logger(handler)
+
+    for i in range(1, 5):
+        logger.info(f"line {i}", extra={'download_id': 'a'})
+
+    lines, _, truncated = handler.get_download_logs('a', n=2, since=0)
+    assert lines == ['line 3', 'line 4']
+    assert truncated
+    # Without a cursor the last n lines are all that was asked for
+    lines, _, truncated = handler.get_download_logs('a', n=2)
+    assert lines == ['line 3', 'line 4']
+    assert not truncated
@@ -0,0 +1,66 @@
+import os
+import sys
+import sqlite3
+import subprocess
+
+import pytest
+
+from job_scheduler import DownloadJob
+from job_store import JobStore
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def job_db(tmp_path):
+    # One download that was running when the server stopped
+    path = str(tmp_path / 'jobs.db')
+    job = DownloadJob('download_1_abc123', 'https://example.invalid/truyen/thu', params={'cookie': '', 'engine': 'threaded'})
+    JobStore(path).add(job, {'status': 'in_progress', 'url': job.url})
+    return path
+
+def run_python(code, tmp_path, job_db):
+    env = dict(os.environ, JOB_DB_PATH=job_db, SECURE_PATH_KEY='test-boot', PYTHONPATH=REPO)
+    completed = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    return completed.stdout
+
+def job_rows(job_db):
+    with sqlite3.connect(job_db) as conn:
+        return dict(conn.execute("SELECT id, state FROM jobs").fetchall())
+
+def restarts(job_db):
+    with sqlite3.connect(job_db) as conn:
+        return conn.execute("SELECT restarts FROM jobs WHERE id = 'download_1_abc123'").fetchone()[0]
+
+def test_import_does_not_resume_jobs(tmp_path, job_db):
+    output = run_python("import main; print(main.job_store is None, main.scheduler is None)", tmp_path, job_db)
+
+    assert output.split() == ['True', 'True']
+    assert restarts(job_db) == 0
+
+def test_init_jobs_resumes_once(tmp_path, job_db):
+    output = run_python("import main; print(main.init_jobs(), main.init_jobs())", tmp_path, job_db)
+
+    assert output.split() == ['True', 'False']
+    assert restarts(job_db) == 1
+
+# Loads the app the way gunicorn does, then queues a download through the HTTP API
+GUNICORN_CLIENT = """
+from gunicorn.util import import_app
+client = import_app({target!r}).test_client()
+response = client.post('/api/download', json={{'url': 'https://metruyencv.com/truyen/thu'}})
+print('RESULT', response.status_code, response.get_json()['success'],
+      client.get('/thread/status').status_code, client.get('/api/queue').status_code)
+"""
+
+@pytest.mark.parametrize('target', ['main:application', 'wsgi:create_app()'])
+def test_gunicorn_target_queues_downloads(tmp_path, job_db, target):
+    output = run_python(GUNICORN_CLIENT.format(target=target), tmp_path, job_db)
+    # The download workers may print their requests too
+    result = [line for line in output.splitlines() if line.startswith('RESULT ')]
+
+    assert result == ['RESULT 200 True 200 200']
+    # The interrupted job was resumed once and the new download recorded
+    assert restarts(job_db) == 1
+    assert len(job_rows(job_db)) == 2
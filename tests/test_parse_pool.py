@@ -0,0 +1,139 @@
+import os
+import sys
+import logging
+import textwrap
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from novel_downloader import NovelDownloader
+from response_cache import ResponseCache
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAPTER_PAGE = ('<html><body><h2>Chương 1: Mở đầu</h2>'
+                '<div data-x-bind="ChapterContent"><p>Đoạn một.</p><p>Đoạn hai.</p></div></body></html>')
+
+@pytest.fixture
+def downloader(tmp_path):
+    return NovelDownloader(logger=logging.getLogger('test_parse_pool'),
+                           response_cache=ResponseCache(str(tmp_path / 'cache'), max_bytes=0))
+
+def blocked_fetch(downloader, release):
+    """Replace the page fetch with one returning CHAPTER_PAGE once `release` is set"""
+    def fetch_page(page_url, chapter_info, is_mtc=True, cookie='', download_id=None):
+        release.wait(5)
+        return CHAPTER_PAGE
+    downloader._fetch_chapter_page = fetch_page
+
+def test_fetch_and_parse_returns_chapter(downloader):
+    release = threading.Event()
+    release.set()
+    blocked_fetch(downloader, release)
+
+    # A thread pool stands in for the parser processes, it takes the same submit calls
+    with ThreadPoolExecutor(1) as executor, ThreadPoolExecutor(1) as parse_pool:
+        result = downloader._submit_fetch_and_parse(executor, parse_pool, 'https://metruyencv.com/truyen/thu',
+                                                    {'index': 1, 'name': 'Chương 1: Mở đầu'}, 'metruyenchu')
+        chapter_data = result.result(timeout=10)
+
+    assert chapter_data['title'] == 'Chương 1: Mở đầu'
+    assert chapter_data['content'] == 'Đoạn một.\nĐoạn hai.'
+
+def test_cancelled_chapter_is_left_unparsed(downloader, caplog):
+    release = threading.Event()
+    blocked_fetch(downloader, release)
+    parsed = []
+
+    class RecordingPool(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            parsed.append(args)
+            return super().submit(*args, **kwargs)
+
+    with caplog.at_level(logging.ERROR, logger='concurrent.futures'):
+        with ThreadPoolExecutor(1) as executor, RecordingPool(1) as parse_pool:
+            result = downloader._submit_fetch_and_parse(executor, parse_pool, 'https://metruyencv.com/truyen/thu',
+                                                        {'index': 1, 'name': 'Chương 1: Mở đầu'}, 'metruyenchu')
+            # The download stops while the page is still being fetched
+            assert result.cancel()
+            release.set()
+
+    assert result.cancelled()
+    assert parsed == []
+    assert not [record for record in caplog.records if record.name == 'concurrent.futures']
+
+# Entry script with import-time side effects, like a server module: every import
+# appends a line to the marker file, the boot runs only when started as a script
+POOL_SCRIPT = textwrap.dedent("""
+    import os, sys, logging
+    sys.path.insert(0, {repo!r})
+    with open({marker!r}, 'a') as f:
+        f.write(f"import {{os.getpid()}}\\n")
+
+    from chapter_parser import parse_chapter_record
+    from novel_downloader import NovelDownloader
+    from response_cache import ResponseCache
+
+    if __name__ == '__main__':
+        with open({marker!r}, 'a') as f:
+            f.write(f"boot {{os.getpid()}}\\n")
+        downloader = NovelDownloader(logger=logging.getLogger('pool_script'),
+                                     response_cache=ResponseCache({cache!r}, max_bytes=0))
+        pool = downloader._get_parse_pool()
+        if pool is None:
+            record = parse_chapter_record('metruyenchu', {page!r}, 1)
+        else:
+            records = [pool.submit(parse_chapter_record, 'metruyenchu', {page!r}, 1) for _ in range(4)]
+            record = [future.result(timeout=60) for future in records][0]
+            pool.shutdown()
+        print(record['title'])
+""")
+
+def run_pool_script(tmp_path, parse_processes):
+    marker = tmp_path / 'marker.txt'
+    script = tmp_path / 'server_like.py'
+    script.write_text(POOL_SCRIPT.format(repo=REPO, marker=str(marker), cache=str(tmp_path / 'cache'),
+                                         page=CHAPTER_PAGE), encoding='utf-8')
+    env = dict(os.environ)
+    env.pop('PARSE_PROCESSES', None)
+    if parse_processes is not None:
+        env['PARSE_PROCESSES'] = str(parse_processes)
+
+    completed = subprocess.run([sys.executable, str(script)], cwd=str(tmp_path), env=env,
+                               capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout.strip().endswith('Chương 1: Mở đầu')
+    return marker.read_text(encoding='utf-8').split()[::2]
+
+def test_parse_pool_is_off_by_default(tmp_path):
+    # No worker process is spawned, so the script's import-time code runs once
+    assert run_pool_script(tmp_path, None) == ['import', 'boot']
+
+def test_parse_pool_runs_boot_once(tmp_path):
+    # Spawned workers import the script again as __mp_main__, but never run its guarded boot
+    events = run_pool_script(tmp_path, 2)
+
+    assert events.count('boot') == 1
+    assert events.count('import') > 1
+
+def test_parse_pool_is_disabled_under_eventlet(tmp_path):
+    # gunicorn's eventlet worker patches threading, the pool would deadlock there
+    code = textwrap.dedent(f"""
+        import eventlet
+        eventlet.monkey_patch()
+        import sys, logging
+        sys.path.insert(0, {REPO!r})
+        from novel_downloader import NovelDownloader
+        from response_cache import ResponseCache
+        downloader = NovelDownloader(logger=logging.getLogger('eventlet_pool'),
+                                     response_cache=ResponseCache({str(tmp_path / 'cache')!r}, max_bytes=0))
+        print('RESULT', downloader._get_parse_pool(), downloader.parse_processes)
+    """)
+    env = dict(os.environ, PARSE_PROCESSES='2')
+    completed = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env,
+                               capture_output=True, text=True, timeout=120)
+
+    assert completed.returncode == 0, completed.stderr
+    assert 'RESULT None 0' in completed.stdout.splitlines()
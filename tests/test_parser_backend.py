@@ -0,0 +1,51 @@
+import os
+import glob
+
+import pytest
+
+from chapter_parser import PLACEHOLDER_CONTENT, parse_chapter_record
+from parser_backend import get_parser
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'chapters')
+SITES = {'mtc': 'metruyenchu', 'ttv': 'tangthuvien'}
+
+def chapter_pages():
+    pages = []
+    for folder, site_type in SITES.items():
+        for path in sorted(glob.glob(os.path.join(FIXTURES, folder, '*.html'))):
+            pages.append(pytest.param(site_type, path, id=f"{folder}/{os.path.basename(path)}"))
+    return pages
+
+def read_page(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+@pytest.mark.skipif(get_parser('lxml') != 'lxml', reason="lxml is not installed")
+@pytest.mark.parametrize('site_type, path', chapter_pages())
+def test_lxml_matches_html_parser(site_type, path):
+    html = read_page(path)
+    expected = parse_chapter_record(site_type, html, 5, None, parser='html.parser')
+    record = parse_chapter_record(site_type, html, 5, None, parser='lxml')
+
+    assert record == expected
+
+@pytest.mark.parametrize('site_type, path', chapter_pages())
+def test_fixture_page_kind(site_type, path):
+    # Guards the corpus itself: placeholder pages must stay placeholders, the others must have content
+    record = parse_chapter_record(site_type, read_page(path), 5, None)
+    is_placeholder = os.path.basename(path) in ('locked.html', 'missing_content.html')
+
+    assert (record['content'] == PLACEHOLDER_CONTENT) == is_placeholder
+    assert record['html']
+
+@pytest.mark.skipif(get_parser('lxml') != 'lxml', reason="lxml is not installed")
+def test_lxml_keeps_text_of_malformed_page():
+    # The tree builders repair unclosed <p> tags differently (lxml closes them as browsers do,
+    # html.parser nests them), so only the extracted text has to match on broken markup
+    html = read_page(os.path.join(FIXTURES, 'malformed', 'mtc_unclosed_tags.html'))
+    expected = parse_chapter_record('metruyenchu', html, 9, None, parser='html.parser')
+    record = parse_chapter_record('metruyenchu', html, 9, None, parser='lxml')
+
+    assert record['title'] == expected['title']
+    assert record['content'] == expected['content']
+    assert record['logs'] == expected['logs']
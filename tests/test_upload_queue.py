@@ -0,0 +1,50 @@
+import shutil
+import logging
+
+from upload_queue import UploadQueue
+
+class FailingDropbox:
+    """Stands in for DropboxStorage, every upload fails while the client stays active"""
+    is_active = True
+
+    def __init__(self):
+        self.uploaded = []
+
+    def upload_file(self, local_path, dropbox_path, download_id=None):
+        self.uploaded.append(dropbox_path)
+        return None
+
+def test_failed_upload_removes_staging_files(tmp_path):
+    source = tmp_path / 'novel.db'
+    source.write_bytes(b'chapters')
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text('{}')
+
+    def prepare():
+        staged = []
+        for path in (source, manifest):
+            copy = str(path) + '.upload'
+            shutil.copyfile(path, copy)
+            staged.append((copy, f"/Novel/Temp/{path.name}"))
+        return staged
+
+    dropbox = FailingDropbox()
+    queue = UploadQueue(dropbox, logger=logging.getLogger('test_upload_queue'), workers=1, retries=1, retry_delay=0)
+    results = []
+    queue.submit('store', prepare=prepare, on_done=results.append, delete_after=True)
+    assert queue.join(timeout=10)
+
+    assert results == [[None]]
+    # The manifest is never sent after the store failed, its copy is still removed
+    assert dropbox.uploaded == ['/Novel/Temp/novel.db'] * 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['manifest.json', 'novel.db']
+
+def test_failed_upload_keeps_files_without_delete_after(tmp_path):
+    epub = tmp_path / 'novel.epub'
+    epub.write_bytes(b'epub')
+
+    queue = UploadQueue(FailingDropbox(), logger=logging.getLogger('test_upload_queue'), workers=1, retries=0, retry_delay=0)
+    queue.submit('epub', files=[(str(epub), '/Novel/novel.epub')])
+    assert queue.join(timeout=10)
+
+    assert epub.exists()
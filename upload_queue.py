@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+class UploadJob:
+    """Files waiting to be uploaded to Dropbox, in order, and the callbacks run once they are"""
+
+    def __init__(self, key, files=None, prepare=None, download_id=None, on_done=None, delete_after=False):
+        """
+        Args:
+            key: Jobs with the same key are coalesced and never run at the same time
+            files: List of (local_path, dropbox_path) uploaded in order
+            prepare: Callable run on the worker instead of giving files, returns the
+                     files to upload (e.g. a fresh snapshot), or None to skip the job
+            download_id: Download ID used to tag logs
+            on_done: Callable receiving the shared link of each uploaded file (None
+                     for a failed one, the list stops at the first failure)
+            delete_after: Remove the local files once the job is over, uploaded or not
+                          (for staging copies made only for the upload)
+        """
+        self.key = key
+        self.files = files
+        self.prepare = prepare
+        self.download_id = download_id
+        self.callbacks = [on_done] if on_done else []
+        self.delete_after = delete_after
+
+class UploadQueue:
+    """
+    Background Dropbox uploads, run by a small pool of worker threads
+
+    Downloads hand their uploads to the queue and carry on. A job still waiting
+    is replaced when a newer job with the same key is submitted (its callbacks
+    are kept), so only the newest checkpoint of a novel gets uploaded, and jobs
+    with the same key never run together, so an older upload cannot overwrite
+    a newer one. Failed uploads are retried with exponential backoff.
+    """
+
+    def __init__(self, dropbox, logger=None, workers=None, retries=None, retry_delay=None):
+        """
+        Args:
+            dropbox: DropboxStorage used for the uploads
+            workers: Number of worker threads (default: UPLOAD_WORKERS or 2)
+            retries: Extra attempts per file (default: UPLOAD_RETRIES or 3)
+            retry_delay: Delay before the first retry in seconds, doubled each time
+                         (default: UPLOAD_RETRY_DELAY or 5)
+        """
+        self.logger = logger or logging.getLogger('upload_queue')
+        self.dropbox = dropbox
+        self.workers = workers if workers is not None else int(os.getenv('UPLOAD_WORKERS', 2))
+        self.retries = retries if retries is not None else int(os.getenv('UPLOAD_RETRIES', 3))
+        self.retry_delay = retry_delay if retry_delay is not None else float(os.getenv('UPLOAD_RETRY_DELAY', 5))
+
+        self._order = deque()  # Keys of the waiting jobs, oldest first
+        self._waiting = {}     # key -> waiting job
+        self._running = set()  # Keys of the jobs being uploaded
+        self._unfinished = 0
+        self._condition = threading.Condition()
+        self._threads = []
+
+    def submit(self, key, files=None, prepare=None, download_id=None, on_done=None, delete_after=False):
+        """
+        Queue an upload (see UploadJob for the arguments)
+
+        Returns:
+            The queued UploadJob
+        """
+        job = UploadJob(key, files, prepare, download_id, on_done, delete_after)
+        with self._condition:
+            replaced = self._waiting.get(key)
+            if replaced:
+                job.callbacks = replaced.callbacks + job.callbacks
+                self.logger.info(f"Upload {key} superseded by a newer one")
+            else:
+                self._order.append(key)
+                self._unfinished += 1
+            self._waiting[key] = job
+            self._start_workers()
+            self._condition.notify()
+        return job
+
+    def _start_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < max(self.workers, 1):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_job(self):
+        """Oldest waiting job whose key is not being uploaded (called with the lock held)"""
+        for key in self._order:
+            if key not in self._running:
+                self._order.remove(key)
+                self._running.add(key)
+                return self._waiting.pop(key)
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+
+            urls = None
+            try:
+                urls = self._run(job)
+            except Exception as e:
+                self.logger.error(f"Error uploading {job.key}: {str(e)}", extra={'download_id': job.download_id})
+            finally:
+                with self._condition:
+                    self._running.discard(job.key)
+                    self._unfinished -= 1
+                    self._condition.notify_all()
+
+            for callback in job.callbacks:
+                try:
+                    callback(urls)
+                except Exception as e:
+                    self.logger.error(f"Error in upload callback for {job.key}: {str(e)}")
+
+    def _run(self, job):
+        """Upload the files of a job, returns their shared links (None if the job was skipped)"""
+        files = job.files
+        try:
+            if job.prepare:
+                files = job.prepare()
+            if not files:
+                return None
+
+            urls = []
+            for local_path, dropbox_path in files:
+                url = self._upload_with_retries(local_path, dropbox_path, job.download_id)
+                urls.append(url)
+                if not url:
+                    # Later files may describe the earlier ones (e.g. a manifest), don't upload them
+                    break
+            return urls
+        finally:
+            # A failed upload leaves nothing behind either, the next job makes fresh copies
+            if job.delete_after and files:
+                for local_path, _ in files:
+                    try:
+                        os.remove(local_path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        self.logger.warning(f"Error removing {local_path}: {str(e)}", extra={'download_id': job.download_id})
+
+    def _upload_with_retries(self, local_path, dropbox_path, download_id=None):
+        for attempt in range(self.retries + 1):
+            url = self.dropbox.upload_file(local_path, dropbox_path, download_id)
+            if url or not self.dropbox.is_active or not os.path.exists(local_path):
+                return url
+            if attempt < self.retries:
+                delay = self.retry_delay * 2 ** attempt
+                self.logger.warning(f"Upload of {dropbox_path} failed, retrying in {delay:.0f} seconds", extra={'download_id': download_id})
+                time.sleep(delay)
+
+        self.logger.error(f"Upload of {dropbox_path} failed after {self.retries + 1} attempts", extra={'download_id': download_id})
+        return None
+
+    def pending(self):
+        """Number of uploads waiting or running"""
+        with self._condition:
+            return self._unfinished
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued upload has finished
+
+        Returns:
+            True if the queue is empty, False if the timeout expired first
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while self._unfinished:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
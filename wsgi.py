@@ -4,17 +4,17 @@ eventlet.monkey_patch()
 
 # Sau đó import các module khác
 import os
-from main import app, socketio, start_worker_thread
+from main import app, socketio, init_jobs
 
 # Hàm này sẽ được gọi bởi Gunicorn
 def create_app():
-    # Khởi động worker thread khi ứng dụng khởi động
-    # start_worker_thread()
+    # Mở job store và tiếp tục các download bị gián đoạn (chỉ chạy một lần mỗi tiến trình)
+    init_jobs()
     # Trả về ứng dụng Flask thông thường
     return app
 
 # Biến Gunicorn sẽ sử dụng
-application = socketio.wrap_wsgi(create_app())
+application = create_app()
 
 # Nếu chạy trực tiếp file này
 if __name__ == "__main__":